@@ -0,0 +1,88 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from monitoring.tracing import span
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import (
+    JWTAuthentication, JWTStatelessUserAuthentication)
+from rest_framework_simplejwt.settings import api_settings
+
+
+class UserCache:
+    """Caché LRU de usuarios por identificador, con tiempo de expiración."""
+
+    def __init__(self):
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def max_size(self):
+        return getattr(settings, 'API_JWT_USER_CACHE_SIZE', 1024)
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'API_JWT_USER_CACHE_TTL', 60)
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return None
+            user, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._users[user_id]
+                return None
+            self._users.move_to_end(user_id)
+            return user
+
+    def set(self, user_id, user):
+        if self.ttl <= 0 or self.max_size <= 0:
+            return
+        with self._lock:
+            self._users[user_id] = (user, time.monotonic() + self.ttl)
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_size:
+                self._users.popitem(last=False)
+
+    def delete(self, user_id):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+
+user_cache = UserCache()
+
+
+class FactsJWTAuthentication(JWTStatelessUserAuthentication):
+    """Autenticación JWT que evita consultar el usuario en cada petición.
+
+    En las peticiones de solo lectura (GET, HEAD, OPTIONS) confía en los
+    datos firmados del token y entrega un TokenUser, sin acceder a la base
+    de datos. En las demás peticiones entrega el modelo User completo,
+    guardado en una caché LRU con expiración.
+
+    Con API_JWT_STATELESS_READS = False todas las peticiones usan el modelo
+    User. Un usuario desactivado conserva el acceso de lectura hasta que
+    expire su token, y el de escritura hasta que expire la caché.
+    """
+
+    def authenticate(self, request):
+        self.stateless = (getattr(settings, 'API_JWT_STATELESS_READS', True)
+                          and request.method in SAFE_METHODS)
+        with span('jwt.authenticate', stateless=self.stateless):
+            return super().authenticate(request)
+
+    def get_user(self, validated_token):
+        if self.stateless:
+            return super().get_user(validated_token)
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        user = user_cache.get(user_id)
+        if user is None:
+            user = JWTAuthentication.get_user(self, validated_token)
+            user_cache.set(user_id, user)
+        return user
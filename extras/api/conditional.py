@@ -0,0 +1,23 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+def make_etag(*parts):
+    digest = hashlib.md5(':'.join(str(part) for part in parts).encode(), usedforsecurity=False)
+    return f'"{digest.hexdigest()}"'
+
+
+def not_modified(request, etag, last_modified):
+    # Devuelve una respuesta 304 si los validadores enviados por el cliente
+    # (If-None-Match / If-Modified-Since) coinciden, o None en caso contrario
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    return get_conditional_response(request, etag=etag, last_modified=timestamp)
+
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
@@ -0,0 +1,58 @@
+import time
+
+from api.authentication import user_cache
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from facts.models import Fact
+from rest_framework_simplejwt.tokens import AccessToken
+
+
+class Command(BaseCommand):
+    help = ('Mide peticiones por segundo a la API con y sin la autenticación '
+            'JWT sin consulta de usuario.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--username', help='Usuario con el que se firma el token')
+
+    def counter(self, queries):
+        # El cliente de pruebas reinicia connection.queries en cada petición,
+        # por lo que las consultas se cuentan con un execute_wrapper
+        def wrapper(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+        return wrapper
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(is_active=True)
+        if options['username']:
+            users = users.filter(username=options['username'])
+        user = users.first()
+        fact = Fact.objects.first()
+        if user is None or fact is None:
+            raise CommandError('Se necesita al menos un usuario activo y un hecho.')
+        token = AccessToken.for_user(user)
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {token}', SERVER_NAME='localhost')
+        url = f'/api/facts/{fact.id}/'
+
+        modes = (
+            ('Consulta por petición', {'API_JWT_STATELESS_READS': False, 'API_JWT_USER_CACHE_TTL': 0}),
+            ('Caché LRU de usuarios', {'API_JWT_STATELESS_READS': False}),
+            ('Sin consulta (lectura)', {'API_JWT_STATELESS_READS': True}),
+        )
+        for name, overrides in modes:
+            user_cache.clear()
+            with override_settings(ALLOWED_HOSTS=['*'], **overrides):
+                # Contamos las consultas de una petición con la caché ya cargada
+                client.get(url)
+                queries = []
+                with connection.execute_wrapper(self.counter(queries)):
+                    client.get(url)
+                start = time.perf_counter()
+                for _ in range(options['requests']):
+                    client.get(url)
+                elapsed = time.perf_counter() - start
+            self.stdout.write(f'{name:>24}: {options["requests"] / elapsed:8.1f} peticiones/s, '
+                              f'{len(queries)} consultas por petición')
@@ -0,0 +1,66 @@
+import time
+
+from api.serializers import FACT_VALUES, FactSerializer, fact_rows_to_dicts
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from facts.models import Fact
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Compara FactSerializer sobre Fact.objects.all() con la lectura '
+            'mediante values() y fact_rows_to_dicts.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--facts', type=int, default=1000,
+                            help='Hechos temporales a crear para la medición')
+        parser.add_argument('--users', type=int, default=50,
+                            help='Usuarios temporales entre los que se reparten los hechos')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        # Los datos temporales se crean dentro de una transacción que se
+        # revierte al terminar
+        try:
+            with transaction.atomic():
+                self.create_data(options['facts'], options['users'])
+                self.run(options['facts'], options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def create_data(self, facts, users):
+        users = User.objects.bulk_create(
+            [User(username=f'benchmark_{i}') for i in range(users)])
+        if users[0].id is None:
+            users = list(User.objects.filter(username__startswith='benchmark_'))
+        Fact.objects.bulk_create(
+            [Fact(fact=f'Hecho {i}', user=users[i % len(users)]) for i in range(facts)],
+            batch_size=1000)
+
+    def measure(self, function, repeat):
+        with CaptureQueriesContext(connection) as queries:
+            function()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            function()
+        return len(queries), (time.perf_counter() - start) / repeat
+
+    def run(self, facts, repeat):
+        def before():
+            return FactSerializer(Fact.objects.all()[:facts], many=True).data
+
+        def after():
+            rows = Fact.objects.values(*FACT_VALUES)[:facts]
+            return list(fact_rows_to_dicts(rows))
+
+        per_thousand = 1000 / facts
+        for name, function in (('FactSerializer', before), ('values()', after)):
+            queries, elapsed = self.measure(function, repeat)
+            self.stdout.write(f'{name:>15}: {queries:5d} consultas, '
+                              f'{elapsed * per_thousand * 1e3:8.2f} ms por 1000 hechos')
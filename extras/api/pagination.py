@@ -0,0 +1,118 @@
+import base64
+import json
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Paginación por cursor sobre la llave compuesta (created_at, id).
+
+    Cada página se obtiene con un filtro sobre la última fila de la página
+    anterior, por lo que no se usa OFFSET ni COUNT(*) y las páginas
+    profundas cuestan lo mismo que la primera.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    ordering_field = 'created_at'
+    invalid_cursor_message = 'Cursor inválido.'
+
+    def get_page_size(self, request):
+        default = getattr(settings, 'FACTS_API_PAGE_SIZE', 50)
+        maximum = getattr(settings, 'FACTS_API_MAX_PAGE_SIZE', 500)
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return default
+        return max(1, min(page_size, maximum))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            value = parse_datetime(data['c'])
+            position = (value, int(data['i']))
+            reverse = bool(data.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeEncodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if value is None:
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def encode_cursor(self, position, reverse):
+        value, pk = position
+        data = {'c': value.isoformat(), 'i': pk, 'r': int(reverse)}
+        encoded = base64.urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode('ascii'))
+        url = replace_query_param(self.base_url, self.cursor_query_param, encoded.decode('ascii'))
+        if self.page_size_query_param in self.request.query_params:
+            url = replace_query_param(url, self.page_size_query_param, self.page_size)
+        return url
+
+    def get_position(self, row):
+        if isinstance(row, dict):
+            return row[self.ordering_field], row['id']
+        return getattr(row, self.ordering_field), row.pk
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = remove_query_param(request.build_absolute_uri(), self.cursor_query_param)
+        self.page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request)
+        field = self.ordering_field
+
+        # Ordenamos por la llave compuesta; al retroceder se invierte el orden
+        if reverse:
+            queryset = queryset.order_by(f'-{field}', '-id')
+        else:
+            queryset = queryset.order_by(field, 'id')
+
+        # Filtramos las filas posteriores (o anteriores) a la posición
+        if position is not None:
+            value, pk = position
+            lookup = 'lt' if reverse else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{field}__{lookup}': value}) |
+                Q(**{field: value, f'id__{lookup}': pk}))
+
+        # Pedimos una fila extra para saber si existe otra página
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        self.next_position = self.previous_position = None
+        if rows:
+            first, last = self.get_position(rows[0]), self.get_position(rows[-1])
+            if reverse:
+                self.previous_position = first if has_more else None
+                self.next_position = last
+            else:
+                self.previous_position = first if position is not None else None
+                self.next_position = last if has_more else None
+        return rows
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position, reverse=False)
+
+    def get_previous_link(self):
+        if self.previous_position is None:
+            return None
+        return self.encode_cursor(self.previous_position, reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
@@ -1,5 +1,7 @@
 from django.contrib.auth.models import User
-from facts.models import Fact
+from django.utils import timezone
+from facts.models import DUPLICATE_FACT_MESSAGE, Fact, fact_hash
+from monitoring.tracing import span
 from rest_framework import serializers
 
 
@@ -15,5 +17,88 @@ class FactSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Fact
-        fields = '__all__'
+        exclude = ('content_hash',)
         depth = 1
+
+    def run_validation(self, data=serializers.empty):
+        with span('serializer.validate', serializer=type(self).__name__):
+            return super().run_validation(data)
+
+    def to_representation(self, instance):
+        with span('serializer.represent', serializer=type(self).__name__):
+            return super().to_representation(instance)
+
+    def validate_fact(self, value):
+        # La carga masiva revisa los duplicados de todos los elementos en
+        # una sola consulta, por lo que desactiva esta validación
+        if not self.context.get('check_duplicates', True):
+            return value
+        duplicates = Fact.objects.filter(content_hash=fact_hash(value))
+        if self.instance is not None:
+            duplicates = duplicates.exclude(pk=self.instance.pk)
+        if duplicates.exists():
+            raise serializers.ValidationError(DUPLICATE_FACT_MESSAGE)
+        return value
+
+
+class FactBulkUpdateSerializer(serializers.Serializer):
+    """Campos que PATCH /api/facts/bulk/ puede modificar en varios hechos a
+    la vez; los demás se rechazan."""
+
+    fact = serializers.CharField(max_length=Fact._meta.get_field('fact').max_length)
+    user = serializers.PrimaryKeyRelatedField(queryset=User.objects.all())
+
+    def to_internal_value(self, data):
+        unknown = sorted(set(data) - set(self.fields))
+        if unknown:
+            raise serializers.ValidationError({key: ['Campo desconocido o de solo lectura.'] for key in unknown})
+        return super().to_internal_value(data)
+
+
+# Campos de User incluidos en la representación anidada de un hecho
+USER_FIELDS = ('id', 'username', 'first_name', 'last_name', 'email')
+# Campos que se leen con values() para representar un hecho sin crear modelos
+FACT_VALUES = ('id', 'fact', 'created_at', 'updated_at') + tuple(
+    f'user__{name}' for name in USER_FIELDS)
+
+_datetime_field = serializers.DateTimeField()
+
+
+def _format_datetime(value, tz):
+    # Equivale a DateTimeField.to_representation para fechas con zona
+    # horaria, evitando sus validaciones por cada valor
+    if value is None or timezone.is_naive(value):
+        return _datetime_field.to_representation(value)
+    value = value.astimezone(tz).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def fact_row_to_dict(row, tz=None):
+    # Construye la misma representación que FactSerializer a partir de una
+    # fila obtenida con values(*FACT_VALUES)
+    tz = tz or timezone.get_current_timezone()
+    return {
+        'id': row['id'],
+        'user': {name: row[f'user__{name}'] for name in USER_FIELDS},
+        'fact': row['fact'],
+        'created_at': _format_datetime(row['created_at'], tz),
+        'updated_at': _format_datetime(row['updated_at'], tz),
+    }
+
+
+def fact_rows_to_dicts(rows):
+    # Convierte varias filas obteniendo la zona horaria una sola vez
+    tz = timezone.get_current_timezone()
+    for row in rows:
+        yield fact_row_to_dict(row, tz)
+
+
+def fact_to_dict(fact, tz=None):
+    # Representación de un hecho ya cargado (con su usuario), sin pasar por
+    # FactSerializer
+    row = {'id': fact.id, 'fact': fact.fact, 'created_at': fact.created_at,
+           'updated_at': fact.updated_at}
+    row.update({f'user__{name}': getattr(fact.user, name) for name in USER_FIELDS})
+    return fact_row_to_dict(row, tz)
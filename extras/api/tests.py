@@ -1,3 +1,546 @@
-from django.test import TestCase
+import json
+import os
+import pstats
+import shutil
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection, models
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from facts.models import DUPLICATE_FACT_MESSAGE, Fact
+from monitoring import slow_queries, tracing
+from monitoring.memory import snapshots
+from monitoring.metrics import MEMORY_BUCKETS, collect, registry
+from monitoring.middleware import MemoryMiddleware
+from monitoring.slow_queries import read_log
+from monitoring.tracing import MemoryExporter
+from rest_framework.test import APIClient
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .authentication import user_cache
+from .serializers import FactSerializer
+from .views import FactBulk, FactExport
+
+
+# El índice de autocompletado se construiría en otro hilo, fuera de la
+# transacción de cada prueba
+@override_settings(FACTS_AUTOCOMPLETE_PRELOAD=False)
+class FactsAPITestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('chuck', password='roundhouse')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+
+class FactListTests(FactsAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        Fact.objects.create(user=self.user, fact='Chuck Norris paginó hasta el final.')
+        # Los hechos con la misma fecha se ordenan por identificador
+        Fact.objects.update(created_at=timezone.now())
+        self.ids = list(Fact.objects.order_by('created_at', 'id').values_list('id', flat=True))
+
+    def ids_in(self, response):
+        return [item['id'] for item in response.data['results']]
+
+    def test_pages_follow_created_at_and_id(self):
+        ids = []
+        url = '/api/facts/?page_size=3'
+        while url:
+            response = self.client.get(url)
+            self.assertLessEqual(len(response.data['results']), 3)
+            ids += self.ids_in(response)
+            url = response.data['next']
+        self.assertEqual(ids, self.ids)
+
+    def test_previous_page(self):
+        first = self.client.get('/api/facts/?page_size=3')
+        self.assertIsNone(first.data['previous'])
+        second = self.client.get(first.data['next'])
+        self.assertEqual(self.ids_in(second), self.ids[3:6])
+        self.assertEqual(self.ids_in(self.client.get(second.data['previous'])), self.ids[:3])
+
+    def test_new_facts_do_not_shift_pages(self):
+        first = self.client.get('/api/facts/?page_size=3')
+        fact = Fact.objects.create(user=self.user, fact='Chuck Norris llegó primero.')
+        Fact.objects.filter(id=fact.id).update(created_at=timezone.now() - timedelta(days=1))
+        self.assertEqual(self.ids_in(self.client.get(first.data['next'])), self.ids[3:6])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/facts/?cursor=roundhouse').status_code, 404)
+
+    def test_rows_match_serializer(self):
+        response = self.client.get('/api/facts/')
+        facts = Fact.objects.select_related('user').order_by('created_at', 'id')
+        self.assertEqual(json.loads(response.content)['results'],
+                         json.loads(json.dumps([FactSerializer(fact).data for fact in facts], cls=JSONEncoder)))
+
+
+class FactExportTests(FactsAPITestCase):
+
+    def export(self, url):
+        response = self.client.get(url)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_ndjson_in_chunks(self):
+        with mock.patch.object(FactExport, 'chunk_size', 2):
+            response, content = self.export('/api/facts/export/')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        ids = [json.loads(line)['id'] for line in content.splitlines()]
+        self.assertEqual(ids, list(Fact.objects.order_by('id').values_list('id', flat=True)))
+
+    def test_json_since(self):
+        since = timezone.now()
+        fact = Fact.objects.create(user=self.user, fact='Chuck Norris exportó el futuro.')
+        response, content = self.export(f'/api/facts/export/?output=json&since={since.isoformat()}'.replace('+', '%2B'))
+        self.assertEqual(response['Content-Type'], 'application/json')
+        data = json.loads(content)
+        self.assertEqual([item['id'] for item in data], [fact.id])
+        self.assertEqual(data[0]['user']['username'], 'chuck')
+
+    def test_invalid_since(self):
+        self.assertEqual(self.client.get('/api/facts/export/?since=ayer').status_code, 400)
+
+
+class AuthenticationTests(FactsAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        user_cache.clear()
+        self.fact = Fact.objects.create(user=self.user, fact='Chuck Norris firmó el token.')
+
+    def user_queries(self, method, *args, **kwargs):
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(*args, format='json', **kwargs)
+        self.assertLess(response.status_code, 300)
+        return [query for query in context.captured_queries if 'FROM "auth_user"' in query['sql']]
+
+    def test_reads_do_not_query_user(self):
+        self.assertEqual(self.user_queries('get', '/api/facts/'), [])
+        self.assertEqual(self.user_queries('get', f'/api/facts/{self.fact.id}/'), [])
+
+    def test_writes_cache_user(self):
+        url = f'/api/facts/{self.fact.id}/'
+        self.assertEqual(len(self.user_queries('put', url, {'fact': 'Chuck Norris firmó dos veces.'})), 1)
+        self.assertEqual(self.user_queries('put', url, {'fact': 'Chuck Norris firmó tres veces.'}), [])
+
+    def test_inactive_user_cannot_write(self):
+        url = f'/api/facts/{self.fact.id}/'
+        self.client.put(url, {'fact': 'Chuck Norris firmó dos veces.'}, format='json')
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.put(url, {'fact': 'Chuck Norris firmó tres veces.'}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+
+class FactBulkCreateTests(FactsAPITestCase):
+
+    def create(self, items):
+        return self.client.post('/api/facts/bulk/', items, format='json')
+
+    def test_results_keep_order_and_ids(self):
+        items = [{'fact': 'Chuck Norris contó hasta el infinito.'},
+                 {'fact': ''},
+                 {'fact': 'Chuck Norris le gana al ajedrez en un movimiento.'}]
+        response = self.create(items)
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.data['created'], 2)
+        results = response.data['results']
+        self.assertEqual([result['index'] for result in results], [0, 1, 2])
+        self.assertIn('errors', results[1])
+        for index in (0, 2):
+            fact = Fact.objects.get(id=results[index]['id'])
+            self.assertEqual(fact.fact, items[index]['fact'])
+
+    def test_ids_without_returning_rows(self):
+        # Como en MySQL, bulk_create no asigna los identificadores
+        items = [{'fact': 'Chuck Norris no duerme, espera.'},
+                 {'fact': 'Chuck Norris cuenta los números primos al revés.'}]
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False):
+            response = self.create(items)
+        self.assertEqual(response.status_code, 201)
+        for result, item in zip(response.data['results'], items):
+            self.assertIsNotNone(result['id'])
+            self.assertEqual(Fact.objects.get(id=result['id']).fact, item['fact'])
+
+    def test_duplicates_are_rejected(self):
+        Fact.objects.create(user=self.user, fact='Chuck Norris le contó un chiste a la Luna.')
+        response = self.create([{'fact': 'chuck norris le contó un CHISTE a la luna!'},
+                                {'fact': 'Chuck Norris hace llorar a las cebollas.'},
+                                {'fact': 'Chuck Norris hace llorar a las cebollas'}])
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.data['created'], 1)
+        results = response.data['results']
+        self.assertIn('errors', results[0])
+        self.assertIn('id', results[1])
+        self.assertIn('errors', results[2])
+
+
+class FactBulkChangeTests(FactsAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.other = User.objects.create_user('bruce', password='dragon')
+        self.facts = [Fact.objects.create(user=self.user, fact=f'Chuck Norris hizo {number} flexiones con un dedo.')
+                      for number in range(3)]
+        self.other_fact = Fact.objects.create(user=self.other, fact='Bruce Lee saluda a Chuck Norris.')
+
+    def test_delete_by_user(self):
+        response = self.client.delete('/api/facts/bulk/', {'filter': {'user': self.user.id}}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['deleted'], 3)
+        self.assertFalse(Fact.objects.filter(user=self.user).exists())
+        self.assertTrue(Fact.objects.filter(id=self.other_fact.id).exists())
+
+    def test_patch_fact(self):
+        fact = self.facts[0]
+        response = self.client.patch('/api/facts/bulk/', {'ids': [fact.id], 'set': {'fact': 'Chuck Norris ganó.'}},
+                                     format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated'], 1)
+        fact.refresh_from_db()
+        self.assertEqual(fact.fact, 'Chuck Norris ganó.')
+        # Un mismo texto no puede asignarse a varios hechos
+        response = self.client.patch('/api/facts/bulk/', {'filter': {'user': self.user.id},
+                                                          'set': {'fact': 'Chuck Norris empató.'}}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_patch_user(self):
+        response = self.client.patch('/api/facts/bulk/', {'filter': {'user': self.user.id},
+                                                          'set': {'user': self.other.id}}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated'], 3)
+        self.assertEqual(Fact.objects.filter(user=self.other).count(), 4)
+
+    def test_patch_rejects_unknown_fields(self):
+        updated_at = Fact.objects.get(id=self.facts[0].id).updated_at
+        for changes in ({'bogus': 1}, {'created_at': '2020-01-01T00:00:00Z'}, {'user': 0},
+                        {'user': self.other.id, 'id': 1}):
+            response = self.client.patch('/api/facts/bulk/', {'ids': [fact.id for fact in self.facts],
+                                                              'set': changes}, format='json')
+            self.assertEqual(response.status_code, 400, changes)
+        self.assertEqual(Fact.objects.get(id=self.facts[0].id).updated_at, updated_at)
+        self.assertEqual(Fact.objects.filter(user=self.user).count(), 3)
+
+    def test_nothing_cascades_from_fact(self):
+        # El DELETE masivo usa _raw_delete, que no borra en cascada: ningún
+        # modelo puede depender de Fact con otro on_delete
+        for relation in Fact._meta.related_objects:
+            self.assertIs(relation.on_delete, models.DO_NOTHING, relation)
+
+    def test_invalid_selection(self):
+        for data in ({'filter': {'user': 'chuck'}}, {'filter': {'created_after': 'ayer'}},
+                     {'ids': ['1']}, {}):
+            response = self.client.delete('/api/facts/bulk/', data, format='json')
+            self.assertEqual(response.status_code, 400, data)
+        self.assertEqual(Fact.objects.filter(user=self.user).count(), 3)
+
+
+class ConditionalGetTests(FactsAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.fact = Fact.objects.create(user=self.user, fact='Chuck Norris respondió antes de la pregunta.')
+
+    def test_list_not_modified(self):
+        etag = self.client.get('/api/facts/')['ETag']
+        response = self.client.get('/api/facts/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_list_changes_after_delete(self):
+        # Eliminar no cambia la última modificación, pero sí el contador
+        etag = self.client.get('/api/facts/')['ETag']
+        self.client.delete('/api/facts/bulk/', {'ids': [self.fact.id]}, format='json')
+        response = self.client.get('/api/facts/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(self.fact.id, [item['id'] for item in response.data['results']])
+
+    def test_list_ignores_if_modified_since(self):
+        response = self.client.get('/api/facts/')
+        self.assertNotIn('Last-Modified', response)
+        self.client.delete('/api/facts/bulk/', {'ids': [self.fact.id]}, format='json')
+        response = self.client.get('/api/facts/', HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+
+    def test_version_is_shared(self):
+        # El contador no se guarda en la caché local del proceso
+        etag = self.client.get('/api/facts/')['ETag']
+        caches['default'].clear()
+        response = self.client.get('/api/facts/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_detail_not_modified(self):
+        url = f'/api/facts/{self.fact.id}/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.client.put(url, {'fact': 'Chuck Norris respondió dos veces.'}, format='json')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_changes_after_user_rename(self):
+        url = f'/api/facts/{self.fact.id}/'
+        etags = [self.client.get(url)['ETag'], self.client.get('/api/facts/')['ETag']]
+        self.user.username = 'walker'
+        self.user.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etags[0])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['user']['username'], 'walker')
+        self.assertEqual(self.client.get('/api/facts/', HTTP_IF_NONE_MATCH=etags[1]).status_code, 200)
+
+
+class DuplicateRaceTests(FactsAPITestCase):
+    # Otra petición guarda el mismo texto entre la validación y el INSERT:
+    # se simula omitiendo la revisión previa
+
+    text = 'Chuck Norris llegó antes que el rayo.'
+
+    def setUp(self):
+        super().setUp()
+        Fact.objects.create(user=self.user, fact=self.text)
+
+    def test_create(self):
+        with mock.patch.object(FactSerializer, 'validate_fact', lambda self, value: value):
+            response = self.client.post('/api/facts/', {'fact': self.text.upper()}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'fact': [DUPLICATE_FACT_MESSAGE]})
+
+    def test_bulk_create(self):
+        original = FactBulk.reject_duplicates
+        calls = []
+
+        def reject_duplicates(view, *args):
+            # La primera revisión no encuentra el texto
+            calls.append(args)
+            if len(calls) > 1:
+                original(view, *args)
+
+        with mock.patch.object(FactBulk, 'reject_duplicates', reject_duplicates):
+            response = self.client.post('/api/facts/bulk/', [{'fact': self.text},
+                                                             {'fact': 'Chuck Norris le ganó al rayo.'}],
+                                        format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(response.data['results'][0]['errors'], {'fact': [DUPLICATE_FACT_MESSAGE]})
+        self.assertTrue(Fact.objects.filter(id=response.data['results'][1]['id']).exists())
+
+
+class ProfilingTests(FactsAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_only_staff(self):
+        with override_settings(PROFILING_DIR=self.directory):
+            response = self.client.get('/api/facts/', HTTP_X_PROFILE='cprofile')
+        self.assertNotIn('X-Profile-File', response)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_keeps_latest_profiles(self):
+        self.user.is_staff = True
+        self.user.save()
+        names = []
+        with override_settings(PROFILING_DIR=self.directory, PROFILING_MAX_FILES=2):
+            for age in (3, 2, 1):
+                response = self.client.get('/api/facts/', HTTP_X_PROFILE='sample')
+                names.append(response['X-Profile-File'])
+                # Los perfiles se ordenan por fecha de modificación
+                modified = time.time() - age
+                os.utime(os.path.join(self.directory, names[-1]), (modified, modified))
+        self.assertEqual(sorted(os.listdir(self.directory)), sorted(names[1:]))
+
+    def test_download_cprofile(self):
+        self.user.is_staff = True
+        self.user.save()
+        with override_settings(PROFILING_DIR=self.directory):
+            response = self.client.get('/api/facts/?_profile=cprofile&_profile_download=1')
+        self.assertIn('attachment', response['Content-Disposition'])
+        path = os.path.join(self.directory, os.listdir(self.directory)[0])
+        with open(path, 'rb') as file:
+            self.assertEqual(b''.join(response.streaming_content), file.read())
+        response.close()
+        self.assertIn('get_page', str(pstats.Stats(path).stats))
+
+
+class MetricsTests(FactsAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        override = override_settings(METRICS_DIR=self.directory)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def requests(self, status='200'):
+        key = ('django_http_requests_total', (('view', 'api.views.FactList'), ('method', 'GET'), ('status', status)))
+        return collect()['counters'].get(key, 0)
+
+    def test_requests_by_view_and_status(self):
+        before = self.requests(), self.requests('404')
+        self.client.get('/api/facts/')
+        self.client.get('/api/facts/?cursor=roundhouse')
+        self.assertEqual((self.requests(), self.requests('404')), (before[0] + 1, before[1] + 1))
+        histogram = collect()['histograms'][('django_http_request_db_queries', (('view', 'api.views.FactList'),))]
+        self.assertEqual(sum(histogram[:-2]), histogram[-1])
+
+    def test_finished_processes_are_archived(self):
+        before = self.requests()
+        with open(os.path.join(self.directory, '999999999-1.json'), 'w') as file:
+            json.dump({'counters': [['django_http_requests_total', [['view', 'api.views.FactList'],
+                                                                    ['method', 'GET'], ['status', '200']], 5]]}, file)
+        self.assertEqual(self.requests(), before + 5)
+        self.assertNotIn('999999999-1.json', os.listdir(self.directory))
+        # El archivo histórico se suma una sola vez
+        self.assertEqual(self.requests(), before + 5)
+
+    def test_metrics_view(self):
+        self.client.get('/api/facts/')
+        response = self.client.get('/metrics')
+        labels = 'view="api.views.FactList"'
+        self.assertContains(response, f'django_http_requests_total{{{labels},method="GET",status="200"}} ')
+        self.assertContains(response, f'django_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} ')
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.1').status_code, 403)
+
+
+class TracingTests(FactsAPITestCase):
+    traceparent = '00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01'
+
+    def setUp(self):
+        super().setUp()
+        self.exporter = MemoryExporter()
+        patcher = mock.patch.object(tracing, '_exporter', self.exporter)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @override_settings(TRACING_SAMPLE_RATE=0, TRACING_TRUSTED_IPS=[])
+    def test_untrusted_traceparent_is_ignored(self):
+        response = self.client.get('/api/facts/', HTTP_TRACEPARENT=self.traceparent)
+        self.assertNotIn('X-Trace-Id', response)
+        self.assertEqual(len(self.exporter.traces), 0)
+
+    @override_settings(TRACING_SAMPLE_RATE=0, TRACING_TRUSTED_IPS=['127.0.0.1'])
+    def test_trusted_traceparent_continues_trace(self):
+        # Un hecho nuevo cambia la versión, para que la página no se lea de
+        # la caché de consultas
+        Fact.objects.create(user=self.user, fact='Chuck Norris trazó la traza.')
+        response = self.client.get('/api/facts/', HTTP_TRACEPARENT=self.traceparent)
+        self.assertEqual(response['X-Trace-Id'], '0af7651916cd43dd8448eb211c80319c')
+        trace = self.exporter.traces[-1]
+        root = trace['spans'][0]
+        self.assertEqual(root['parent_id'], 'b7ad6b7169203331')
+        self.assertEqual(root['attributes']['view'], 'api.views.FactList')
+        names = {span['name'] for span in trace['spans']}
+        self.assertLessEqual({'view', 'jwt.authenticate', 'db.query', 'serialize', 'response.render'}, names)
+
+    @override_settings(TRACING_SAMPLE_RATE=1, TRACING_MAX_SPANS=3)
+    def test_max_spans(self):
+        self.client.get('/api/facts/')
+        trace = self.exporter.traces[-1]
+        self.assertEqual(len(trace['spans']), 3)
+        self.assertGreater(trace['dropped'], 0)
+
+
+class SlowQueryTests(FactsAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.log = os.path.join(directory, 'slow_queries.jsonl')
+        patcher = mock.patch.object(slow_queries, 'throttle', slow_queries.Throttle())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Un hecho nuevo cambia la versión, para que la página no se lea de
+        # la caché de consultas
+        self.fact = Fact.objects.create(user=self.user, fact='Chuck Norris hizo esperar a la consulta.')
+
+    def records(self, table):
+        return [record for record in read_log(self.log) if f'"{table}"' in record['sql']]
+
+    def test_logs_select_with_plan(self):
+        with override_settings(SLOW_QUERY_THRESHOLD_MS=0, SLOW_QUERY_LOG=self.log):
+            self.client.get('/api/facts/')
+        record = self.records('facts_fact')[0]
+        self.assertEqual((record['view'], record['path']), ('api.views.FactList', '/api/facts/'))
+        self.assertTrue(record['plan'])
+        self.assertTrue(any(frame.startswith('api/views.py') for frame in record['stack']))
+
+    def test_one_record_per_query_and_interval(self):
+        with override_settings(SLOW_QUERY_THRESHOLD_MS=0, SLOW_QUERY_LOG=self.log):
+            for page_size in (2, 3):
+                Fact.objects.create(user=self.user, fact=f'Chuck Norris consultó {page_size} veces.')
+                self.client.get(f'/api/facts/?page_size={page_size}')
+            self.assertEqual(len(self.records('facts_fact')), 1)
+            with override_settings(SLOW_QUERY_INTERVAL=0):
+                Fact.objects.create(user=self.user, fact='Chuck Norris consultó una vez más.')
+                self.client.get('/api/facts/?page_size=4')
+        records = self.records('facts_fact')
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[1]['skipped'], 1)
+
+    def test_user_params_are_redacted(self):
+        user_cache.clear()
+        with override_settings(SLOW_QUERY_THRESHOLD_MS=0, SLOW_QUERY_LOG=self.log):
+            self.client.put(f'/api/facts/{self.fact.id}/', {'fact': 'Chuck Norris esperó.'}, format='json')
+        records = self.records('auth_user')
+        self.assertTrue(records)
+        self.assertTrue(all(record['params'] is None for record in records))
+
+
+class MemoryTests(FactsAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.addCleanup(snapshots.clear)
+
+    def test_only_admin(self):
+        self.assertEqual(self.client.post('/memory/snapshots/').status_code, 403)
+
+    def test_snapshots_and_diff(self):
+        self.user.is_staff = True
+        self.user.save()
+        with override_settings(MEMORY_SNAPSHOT_DIR=self.directory, MEMORY_MAX_SNAPSHOTS=2):
+            ids = [self.client.post('/memory/snapshots/?limit=5').data['id'] for _ in range(3)]
+            # Solo se conservan las dos últimas capturas y sus archivos
+            listed = self.client.get('/memory/snapshots/').data['snapshots']
+            self.assertEqual([info['id'] for info in listed], ids[1:])
+            self.assertEqual(len(os.listdir(self.directory)), 2)
+            self.assertEqual(self.client.get('/memory/diff/').status_code, 200)
+            response = self.client.get(f'/memory/diff/?from={ids[0]}&to={ids[2]}')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(self.client.delete('/memory/snapshots/').status_code, 204)
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def peak_histogram(self):
+        histograms = {(name, labels): values for name, labels, values in registry.snapshot()['histograms']}
+        return histograms.get(('django_http_request_memory_peak_bytes', (('view', 'api.views.FactList'),)))
+
+    @override_settings(MEMORY_PROFILING=True)
+    def test_middleware_records_peak(self):
+        def view(request):
+            data = bytearray(1024 * 1024)
+            return HttpResponse(len(data))
+
+        self.addCleanup(tracemalloc.stop)
+        middleware = MemoryMiddleware(view)
+        before = self.peak_histogram() or [0] * (len(MEMORY_BUCKETS) + 3)
+        middleware(RequestFactory().get('/api/facts/'))
+        after = self.peak_histogram()
+        self.assertEqual(after[-1], before[-1] + 1)
+        self.assertGreaterEqual(after[-2] - before[-2], 1024 * 1024)
@@ -2,11 +2,18 @@ from django.urls import path
 from rest_framework_simplejwt.views import (TokenObtainPairView,
                                             TokenRefreshView)
 
-from .views import FactDetail, FactList
+from .views import (DatabasePoolStats, FactBulk, FactCacheStats, FactDetail,
+                    FactExport, FactList, FactSearch, FactSimilar)
 
 urlpatterns = [
     path('auth/', TokenObtainPairView.as_view()),
     path('auth/refresh/', TokenRefreshView.as_view()),
     path('facts/', FactList.as_view()),
+    path('facts/export/', FactExport.as_view()),
+    path('facts/bulk/', FactBulk.as_view()),
+    path('facts/search/', FactSearch.as_view()),
+    path('db/pool/', DatabasePoolStats.as_view()),
+    path('cache/facts/', FactCacheStats.as_view()),
     path('facts/<int:id>/', FactDetail.as_view()),
+    path('facts/<int:id>/similar/', FactSimilar.as_view()),
 ]
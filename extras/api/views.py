@@ -1,51 +1,120 @@
-from django.http import Http404
-from facts.models import Fact
-from rest_framework import status
-from rest_framework.permissions import IsAuthenticated
+import json
+
+from chuck_norris.cache.singleflight import get_or_compute
+from chuck_norris.db.pool import get_pool_stats
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import Http404, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from facts.minhash import find_near_duplicates
+from facts.models import DUPLICATE_FACT_MESSAGE, Fact, fact_hash
+from facts.object_cache import fact_cache
+from facts.search import search_ids
+from facts.signals import facts_created, facts_deleted, facts_updated
+from facts.similar import similar_facts
+from facts.trigram import trigram_index
+from facts.version import get_facts_version
+from monitoring.tracing import span
+from rest_framework import serializers, status
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.authentication import JWTAuthentication
 
-from .serializers import FactSerializer
+from .authentication import FactsJWTAuthentication
+from .conditional import make_etag, not_modified, set_validators
+from .pagination import KeysetPagination
+from .serializers import (FACT_VALUES, USER_FIELDS, FactBulkUpdateSerializer,
+                          FactSerializer, fact_rows_to_dicts, fact_to_dict)
 
 
 class FactList(APIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [FactsJWTAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get(self, request):
-        facts = Fact.objects.all()
-        serializer = FactSerializer(facts, many=True)
-        return Response(serializer.data)
+        # El validador se calcula sin consultar la base de datos: el contador
+        # de cambios registra también las eliminaciones y los cambios de los
+        # usuarios. No se envía Last-Modified porque la última modificación
+        # no avanza al eliminar hechos
+        etag = make_etag(get_facts_version(), request.get_full_path())
+        response = not_modified(request, etag, None)
+        if response is not None:
+            return response
+        # La página se guarda según los validadores; cuando cambian, una sola
+        # petición la vuelve a consultar mientras las demás esperan
+        key = 'facts:list:' + make_etag(etag, request.build_absolute_uri()).strip('"')
+        timeout = getattr(settings, 'FACTS_QUERY_CACHE_TTL', 60)
+        data = get_or_compute(key, lambda: self.get_page(request), timeout)
+        return set_validators(Response(data), etag, None)
+
+    def get_page(self, request):
+        # Obtenemos solo la página solicitada, ordenada por (created_at, id),
+        # leyendo el hecho y su usuario en una sola consulta con values()
+        paginator = self.pagination_class()
+        rows = paginator.paginate_queryset(Fact.objects.values(*FACT_VALUES), request, view=self)
+        with span('serialize', rows=len(rows)):
+            data = list(fact_rows_to_dicts(rows))
+        return paginator.get_paginated_response(data).data
 
     def post(self, request):
         serializer = FactSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save(user=request.user)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            # Buscamos los hechos casi idénticos antes de guardar, y los
+            # informamos en la respuesta sin impedir la creación
+            matches = find_near_duplicates(serializer.validated_data['fact'])
+            # Otra petición pudo guardar el mismo texto después de validarlo;
+            # el índice único lo rechaza y respondemos igual que al validar
+            try:
+                with transaction.atomic():
+                    serializer.save(user=request.user)
+            except IntegrityError:
+                return Response({'fact': [DUPLICATE_FACT_MESSAGE]}, status=status.HTTP_400_BAD_REQUEST)
+            data = dict(serializer.data, near_duplicates=[
+                {'id': fact_id, 'similarity': score} for fact_id, score in matches])
+            return Response(data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
 class FactDetail(APIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [FactsJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get_fact(self, id):
         try:
-            return Fact.objects.get(id=id)
+            return Fact.objects.select_related('user').get(id=id)
         except Fact.DoesNotExist:
             raise Http404
 
     def get(self, request, id):
-        fact = self.get_fact(id)
-        serializer = FactSerializer(fact)
-        return Response(serializer.data)
+        # Leemos el hecho desde la caché de objetos; las modificaciones
+        # (put y delete) siempre lo leen desde la base de datos
+        fact = fact_cache.get(id)
+        if fact is None:
+            raise Http404
+        # El ETag incluye los datos del usuario que se muestran con el hecho.
+        # No se envía Last-Modified porque updated_at no cambia al modificar
+        # el usuario
+        etag = make_etag(id, fact.updated_at.isoformat(), *(getattr(fact.user, name) for name in USER_FIELDS))
+        response = not_modified(request, etag, None)
+        if response is not None:
+            return response
+        with span('serialize', rows=1):
+            data = fact_to_dict(fact)
+        return set_validators(Response(data), etag, None)
 
     def put(self, request, id):
         fact = self.get_fact(id)
         serializer = FactSerializer(fact, data=request.data)
         if serializer.is_valid():
-            serializer.save()
+            try:
+                with transaction.atomic():
+                    serializer.save()
+            except IntegrityError:
+                return Response({'fact': [DUPLICATE_FACT_MESSAGE]}, status=status.HTTP_400_BAD_REQUEST)
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -53,3 +122,314 @@ class FactDetail(APIView):
         fact = self.get_fact(id)
         fact.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class FactExport(APIView):
+    authentication_classes = [FactsJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    # Filas leídas por consulta mientras se escribe la respuesta
+    chunk_size = 2000
+
+    def get_queryset(self, request):
+        queryset = Fact.objects.all()
+        since = request.query_params.get('since')
+        if since:
+            value = parse_datetime(since)
+            if value is None:
+                raise ValidationError({'since': 'Fecha inválida, use el formato ISO 8601.'})
+            queryset = queryset.filter(updated_at__gte=value)
+        return queryset
+
+    def iter_rows(self, queryset):
+        # Recorremos la tabla por bloques de identificadores en lugar de usar
+        # iterator(), ya que el controlador de MySQL carga el resultado
+        # completo en memoria; así la memoria del proceso se mantiene acotada
+        last_id = 0
+        while True:
+            rows = list(queryset.filter(id__gt=last_id).order_by('id')
+                        .values(*FACT_VALUES)[:self.chunk_size])
+            if not rows:
+                return
+            yield from fact_rows_to_dicts(rows)
+            last_id = rows[-1]['id']
+
+    def stream_ndjson(self, queryset):
+        for data in self.iter_rows(queryset):
+            yield json.dumps(data, ensure_ascii=False) + '\n'
+
+    def stream_json(self, queryset):
+        yield '['
+        separator = ''
+        for data in self.iter_rows(queryset):
+            yield separator + json.dumps(data, ensure_ascii=False)
+            separator = ','
+        yield ']'
+
+    def get(self, request):
+        queryset = self.get_queryset(request)
+        # El formato se indica con ?output=ndjson (por defecto) o ?output=json
+        if request.query_params.get('output') == 'json':
+            content = self.stream_json(queryset)
+            content_type = 'application/json'
+        else:
+            content = self.stream_ndjson(queryset)
+            content_type = 'application/x-ndjson'
+        return StreamingHttpResponse(content, content_type=content_type)
+
+
+class FactBulk(APIView):
+    authentication_classes = [FactsJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    # Filas por cada INSERT de bulk_create
+    batch_size = 1000
+
+    @property
+    def chunk_size(self):
+        # Filas afectadas por cada UPDATE o DELETE, para acotar los bloqueos
+        return getattr(settings, 'FACTS_API_BULK_CHUNK_SIZE', 1000)
+
+    def get_selection(self, data):
+        # Los hechos se seleccionan por lista de identificadores y/o por un
+        # filtro con user, created_after y created_before
+        if not isinstance(data, dict):
+            raise ValidationError({'detail': 'Se esperaba un objeto JSON.'})
+        queryset = Fact.objects.all()
+        selected = False
+        ids = data.get('ids')
+        if ids is not None:
+            if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+                raise ValidationError({'ids': 'Debe ser una lista de identificadores.'})
+            max_items = getattr(settings, 'FACTS_API_BULK_MAX_ITEMS', 10000)
+            if len(ids) > max_items:
+                raise ValidationError({'ids': f'Se permiten como máximo {max_items} identificadores.'})
+            queryset = queryset.filter(id__in=ids)
+            selected = True
+        filters = data.get('filter') or {}
+        if not isinstance(filters, dict):
+            raise ValidationError({'filter': 'Debe ser un objeto JSON.'})
+        if 'user' in filters:
+            try:
+                user_id = serializers.IntegerField(min_value=1).run_validation(filters['user'])
+            except ValidationError as exc:
+                raise ValidationError({'user': exc.detail})
+            queryset = queryset.filter(user_id=user_id)
+            selected = True
+        for key, lookup in (('created_after', 'created_at__gte'), ('created_before', 'created_at__lt')):
+            if key in filters:
+                value = parse_datetime(str(filters[key]))
+                if value is None:
+                    raise ValidationError({key: 'Fecha inválida, use el formato ISO 8601.'})
+                queryset = queryset.filter(**{lookup: value})
+                selected = True
+        if not selected:
+            raise ValidationError({'detail': 'Debe indicar ids o un filtro.'})
+        return queryset
+
+    def iter_chunks(self, queryset):
+        # Obtenemos los identificadores seleccionados por bloques, usando el
+        # último identificador como cursor
+        last_id = 0
+        while True:
+            ids = list(queryset.filter(id__gt=last_id).order_by('id')
+                       .values_list('id', flat=True)[:self.chunk_size])
+            if not ids:
+                return
+            yield ids
+            last_id = ids[-1]
+
+    def reject_duplicates(self, validated, hashes, errors):
+        # Descartamos los textos repetidos dentro de la petición y los que
+        # ya existen, consultando todos los hashes a la vez
+        existing = set(Fact.objects.filter(content_hash__in={hashes[index] for index in validated})
+                       .values_list('content_hash', flat=True))
+        for index in list(validated):
+            if hashes[index] in existing:
+                del validated[index]
+                errors[index] = {'fact': [DUPLICATE_FACT_MESSAGE]}
+            existing.add(hashes[index])
+
+    def fill_ids(self, facts):
+        # MySQL no devuelve los identificadores al usar bulk_create; los
+        # leemos por el hash del texto, que es único
+        missing = {fact.content_hash: fact for fact in facts if fact.id is None}
+        hashes = list(missing)
+        for start in range(0, len(hashes), self.batch_size):
+            rows = Fact.objects.filter(content_hash__in=hashes[start:start + self.batch_size])
+            for content_hash, fact_id in rows.values_list('content_hash', 'id'):
+                missing[content_hash].id = fact_id
+
+    def post(self, request):
+        items = request.data
+        if not isinstance(items, list):
+            raise ValidationError({'detail': 'Se esperaba una lista de hechos.'})
+        max_items = getattr(settings, 'FACTS_API_BULK_MAX_ITEMS', 10000)
+        if len(items) > max_items:
+            raise ValidationError({'detail': f'Se permiten como máximo {max_items} hechos por petición.'})
+
+        # Validamos cada elemento una sola vez, guardando los datos válidos
+        # o los errores según corresponda
+        child = FactSerializer(context={'check_duplicates': False})
+        validated, errors = {}, {}
+        for index, item in enumerate(items):
+            try:
+                validated[index] = child.run_validation(item)
+            except ValidationError as exc:
+                errors[index] = exc.detail
+
+        hashes = {index: fact_hash(data['fact']) for index, data in validated.items()}
+        self.reject_duplicates(validated, hashes, errors)
+
+        # Insertamos los hechos válidos por lotes dentro de una transacción.
+        # Si otra petición guardó alguno de los textos después de revisarlos,
+        # el índice único rechaza el lote: descartamos esos textos y lo
+        # intentamos una vez más
+        for attempt in range(2):
+            facts = [Fact(user=request.user, content_hash=hashes[index], **data)
+                     for index, data in validated.items()]
+            try:
+                with transaction.atomic():
+                    facts = Fact.objects.bulk_create(facts, batch_size=self.batch_size)
+                    self.fill_ids(facts)
+                    transaction.on_commit(lambda: facts_created.send(sender=Fact, facts=facts))
+                break
+            except IntegrityError:
+                if attempt:
+                    raise ValidationError({'detail': DUPLICATE_FACT_MESSAGE})
+                self.reject_duplicates(validated, hashes, errors)
+
+        # Informamos el resultado de cada elemento en el mismo orden recibido
+        ids = dict(zip(validated, (fact.id for fact in facts)))
+        results = [{'index': index, 'id': ids[index]} if index in ids
+                   else {'index': index, 'errors': errors[index]}
+                   for index in range(len(items))]
+        response_status = status.HTTP_207_MULTI_STATUS if errors else status.HTTP_201_CREATED
+        return Response({'created': len(facts), 'results': results}, status=response_status)
+
+    def patch(self, request):
+        data = request.data
+        changes = data.get('set') if isinstance(data, dict) else None
+        if not isinstance(changes, dict) or not changes:
+            raise ValidationError({'set': 'Debe indicar los campos a modificar.'})
+        queryset = self.get_selection(data)
+        # Solo se pueden modificar el texto (de un único hecho) y el usuario
+        serializer = FactBulkUpdateSerializer(data=changes, partial=True)
+        serializer.is_valid(raise_exception=True)
+        values = dict(serializer.validated_data, updated_at=timezone.now())
+        if 'fact' in values:
+            # Un mismo texto no puede asignarse a más de un hecho
+            if queryset[:2].count() > 1:
+                raise ValidationError({'fact': 'No se puede asignar el mismo texto a varios hechos.'})
+            values['content_hash'] = fact_hash(values['fact'])
+
+        # Ejecutamos un UPDATE por bloque, cada uno en su propia transacción
+        updated = 0
+        for ids in self.iter_chunks(queryset):
+            try:
+                with transaction.atomic():
+                    chunk = Fact.objects.filter(id__in=ids)
+                    # Los textos anteriores se quitan de los índices de palabras
+                    texts = list(chunk.values_list('fact', flat=True)) if 'fact' in values else []
+                    updated += chunk.update(**values)
+            except IntegrityError:
+                # Otro hecho tiene el mismo texto, guardado después de validar
+                raise ValidationError({'fact': [DUPLICATE_FACT_MESSAGE]})
+            facts_updated.send(sender=Fact, ids=ids, values=values, texts=texts)
+        return Response({'updated': updated})
+
+    def delete(self, request):
+        queryset = self.get_selection(request.data)
+        # Ejecutamos un DELETE por bloque. Usamos _raw_delete porque delete()
+        # carga cada instancia y envía post_delete por cada una, cuyos
+        # receptores hacen varias consultas por hecho. Es seguro porque
+        # ningún modelo borra en cascada desde Fact (las bandas de FactBand
+        # usan DO_NOTHING; una prueba lo comprueba) y facts_deleted hace lo mismo que post_delete:
+        # quita las bandas, los textos de los índices y las entradas de caché
+        deleted = 0
+        for ids in self.iter_chunks(queryset):
+            with transaction.atomic():
+                chunk = Fact.objects.filter(id__in=ids)
+                texts = list(chunk.values_list('fact', flat=True))
+                deleted += chunk._raw_delete(chunk.db)
+            facts_deleted.send(sender=Fact, ids=ids, texts=texts)
+        return Response({'deleted': deleted})
+
+
+class FactSearch(APIView):
+    authentication_classes = [FactsJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    max_limit = 100
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params.get('limit', 20))
+        except ValueError:
+            raise ValidationError({'limit': 'Debe ser un número entero.'})
+        return max(1, min(limit, self.max_limit))
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            raise ValidationError({'q': 'Debe indicar el texto a buscar.'})
+        limit = self.get_limit(request)
+        # Con ?fuzzy=1 se toleran errores de tipeo usando el índice de
+        # trigramas; si no, se buscan las palabras exactas
+        if request.query_params.get('fuzzy') in ('1', 'true'):
+            similarity = dict(trigram_index.search(query, limit))
+            ids = list(similarity)
+        else:
+            # Las búsquedas repetidas se consultan una sola vez por versión
+            # de la tabla de hechos
+            similarity = {}
+            key = 'facts:search:' + make_etag(get_facts_version(), query, limit).strip('"')
+            timeout = getattr(settings, 'FACTS_QUERY_CACHE_TTL', 60)
+            ids = get_or_compute(key, lambda: search_ids(query, limit), timeout)
+        # Leemos los hechos encontrados desde la caché, conservando el orden
+        facts = fact_cache.get_many(ids)
+        tz = timezone.get_current_timezone()
+        with span('serialize', rows=len(facts)):
+            data = [fact_to_dict(facts[i], tz) for i in ids if i in facts]
+        for item in data:
+            if item['id'] in similarity:
+                item['similarity'] = similarity[item['id']]
+        return Response({'results': data})
+
+
+class FactSimilar(APIView):
+    authentication_classes = [FactsJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    max_limit = 50
+
+    def get(self, request, id):
+        try:
+            fact = Fact.objects.get(id=id)
+        except Fact.DoesNotExist:
+            raise Http404
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 10)), self.max_limit))
+        except ValueError:
+            raise ValidationError({'limit': 'Debe ser un número entero.'})
+        # Hechos con mayor similitud coseno entre sus vectores TF-IDF
+        data = []
+        for similar, score in similar_facts(fact, limit):
+            item = fact_to_dict(similar)
+            item['similarity'] = score
+            data.append(item)
+        return Response({'results': data})
+
+
+class FactCacheStats(APIView):
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        # Aciertos y fallos de la caché de hechos del proceso que atiende la petición
+        return Response(fact_cache.stats())
+
+
+class DatabasePoolStats(APIView):
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        # Estadísticas del pool de conexiones del proceso que atiende la petición
+        return Response(get_pool_stats())
@@ -0,0 +1,126 @@
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+# Indica que no hay un valor anterior para entregar mientras se recalcula
+MISSING = object()
+
+
+class _Flight:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Agrupa las llamadas concurrentes con la misma llave dentro del proceso.
+
+    Solo el primer hilo ejecuta la función; los demás esperan su resultado
+    (o su excepción), o reciben de inmediato el valor anterior si se indica
+    con stale.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.reset_stats()
+
+    def do(self, key, function, stale=MISSING):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self._stats['calls'] += 1
+            elif stale is not MISSING:
+                self._stats['stale'] += 1
+                return stale
+            else:
+                self._stats['shared'] += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = function()
+        except BaseException as error:
+            flight.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._flights))
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = {'calls': 0, 'shared': 0, 'stale': 0}
+
+
+# Grupo compartido por todas las peticiones del proceso
+group = SingleFlight()
+
+
+def get_cache():
+    return caches[getattr(settings, 'SINGLE_FLIGHT_ALIAS', 'default')]
+
+
+def get_or_compute(key, compute, timeout):
+    """Devuelve el valor guardado en la caché o lo calcula una sola vez.
+
+    Cuando el valor expira, un solo hilo del proceso lo recalcula y, si
+    SINGLE_FLIGHT_LOCK está activo, un solo proceso, usando un candado en la
+    caché compartida. Mientras tanto los demás reciben el valor anterior,
+    que se conserva SINGLE_FLIGHT_STALE_TTL segundos después de expirar, o
+    esperan el nuevo si no existe.
+    """
+    cache = get_cache()
+    entry = cache.get(key)
+    if entry is not None and entry[1] > time.time():
+        return entry[0]
+    stale = MISSING if entry is None else entry[0]
+    return group.do(key, lambda: _refresh(cache, key, compute, timeout, stale), stale=stale)
+
+
+def _refresh(cache, key, compute, timeout, stale):
+    # Otro hilo u otro proceso pudo guardar el valor mientras esperábamos
+    entry = cache.get(key)
+    if entry is not None and entry[1] > time.time():
+        return entry[0]
+    lock_key = f'{key}:lock'
+    token = None
+    if getattr(settings, 'SINGLE_FLIGHT_LOCK', True):
+        lock_timeout = getattr(settings, 'SINGLE_FLIGHT_LOCK_TIMEOUT', 10)
+        token = uuid.uuid4().hex
+        if not cache.add(lock_key, token, timeout=lock_timeout):
+            token = None
+            # Otro proceso lo está calculando
+            if stale is not MISSING:
+                return stale
+            deadline = time.monotonic() + lock_timeout
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                entry = cache.get(key)
+                if entry is not None and entry[1] > time.time():
+                    return entry[0]
+                if not cache.has_key(lock_key):
+                    break
+            # El otro proceso falló o tardó demasiado: lo calculamos aquí
+    try:
+        value = compute()
+        stale_ttl = getattr(settings, 'SINGLE_FLIGHT_STALE_TTL', 60)
+        cache.set(key, (value, time.time() + timeout), timeout=timeout + stale_ttl)
+        return value
+    finally:
+        if token is not None and cache.get(lock_key) == token:
+            cache.delete(lock_key)
@@ -0,0 +1,351 @@
+import pickle
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# Estado del primer nivel de cada caché (por LOCATION), compartido por los
+# hilos del proceso: caches[alias] crea una instancia del backend por hilo,
+# como LocMemCache
+_states = {}
+_states_lock = threading.Lock()
+
+
+class _State:
+
+    def __init__(self, buckets):
+        self.lock = threading.Lock()
+        # llave -> (valor serializado, expiración, grupo, versión del grupo)
+        self.l1 = OrderedDict()
+        self.stamps = [None] * buckets
+        self.stamps_at = None
+        self.stats = {}
+
+
+class TieredCache(BaseCache):
+    """Caché en dos niveles: un LRU en memoria del proceso (L1) delante de una
+    caché compartida entre procesos (L2).
+
+    Las llaves se reparten en STAMP_BUCKETS grupos y cada grupo tiene un
+    número de versión guardado en L2. Al reemplazar o eliminar una llave se
+    incrementa el número de su grupo; cada entrada de L1 recuerda el número
+    con que se guardó y solo se usa mientras coincida con el actual. Los
+    números se leen de L2 todos juntos, como máximo una vez cada
+    STAMP_INTERVAL segundos, por lo que otro proceso puede leer un valor
+    reemplazado durante ese tiempo como máximo. Los valores leídos de la
+    fuente después de un fallo se guardan con fill_many, que no cambia los
+    números.
+
+    L1 es uno por proceso para cada LOCATION, compartido por sus hilos.
+
+    Configuración:
+
+        'facts': {
+            'BACKEND': 'chuck_norris.cache.tiered.TieredCache',
+            'LOCATION': 'facts',
+            'TIMEOUT': 300,
+            'OPTIONS': {
+                'L2': 'shared',         # alias de CACHES
+                'L1_MAX_ENTRIES': 1000,
+                'L1_TIMEOUT': 60,       # tiempo máximo en L1
+                'STAMP_BUCKETS': 64,
+                'STAMP_INTERVAL': 1,
+            },
+        }
+    """
+
+    stamp_prefix = '__tiered_stamp__'
+    _missing = object()
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._l2_alias = options.get('L2', 'default')
+        self._l1_max_entries = int(options.get('L1_MAX_ENTRIES', 1000))
+        self._l1_timeout = options.get('L1_TIMEOUT', 60)
+        self._buckets = int(options.get('STAMP_BUCKETS', 64))
+        self._stamp_interval = float(options.get('STAMP_INTERVAL', 1))
+        with _states_lock:
+            state = _states.get(location)
+            if state is None or len(state.stamps) != self._buckets:
+                state = _states[location] = _State(self._buckets)
+                new = True
+            else:
+                new = False
+        self._state = state
+        self._lock = state.lock
+        self._l1 = state.l1
+        if new:
+            self.reset_stats()
+
+    @property
+    def l2(self):
+        return caches[self._l2_alias]
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._state.stats[name] += amount
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._state.stats)
+            stats['l1_size'] = len(self._l1)
+        stats['l1_max_entries'] = self._l1_max_entries
+        stats['l2'] = self._l2_alias
+        l1_lookups = stats['l1_hits'] + stats['l1_misses']
+        l2_lookups = stats['l2_hits'] + stats['l2_misses']
+        stats['l1_hit_ratio'] = round(stats['l1_hits'] / l1_lookups, 4) if l1_lookups else None
+        stats['l2_hit_ratio'] = round(stats['l2_hits'] / l2_lookups, 4) if l2_lookups else None
+        return stats
+
+    def reset_stats(self):
+        with self._lock:
+            self._state.stats.update({
+                'l1_hits': 0, 'l1_misses': 0, 'l1_stale': 0, 'l1_evictions': 0,
+                'l2_hits': 0, 'l2_misses': 0, 'writes': 0, 'fills': 0, 'deletes': 0,
+                'stamp_refreshes': 0,
+            })
+
+    # Números de versión de los grupos
+
+    def _bucket(self, key):
+        return zlib.crc32(key.encode()) % self._buckets
+
+    def _stamp_key(self, bucket):
+        return f'{self.stamp_prefix}:{bucket}'
+
+    def _refresh_stamps(self, force=False):
+        # Leemos todos los números en una sola consulta a L2
+        now = time.monotonic()
+        stamps_at = self._state.stamps_at
+        if not force and stamps_at is not None and now - stamps_at < self._stamp_interval:
+            return
+        l2 = self.l2
+        keys = [self._stamp_key(i) for i in range(self._buckets)]
+        stamps = l2.get_many(keys, version=1)
+        for key in keys:
+            if key not in stamps:
+                # Si el número no existe (o se descartó) usamos la hora
+                # actual, para no coincidir con un número usado antes
+                l2.add(key, time.time_ns(), timeout=None, version=1)
+                stamps[key] = l2.get(key, version=1)
+        with self._lock:
+            self._state.stamps[:] = [stamps[key] for key in keys]
+            self._state.stamps_at = now
+            self._state.stats['stamp_refreshes'] += 1
+
+    def _current_stamps(self):
+        self._refresh_stamps()
+        with self._lock:
+            return list(self._state.stamps)
+
+    def _bump(self, buckets):
+        # Cambia la versión de los grupos, invalidando sus entradas en L1 de
+        # todos los procesos
+        l2 = self.l2
+        for bucket in set(buckets):
+            key = self._stamp_key(bucket)
+            try:
+                stamp = l2.incr(key, version=1)
+            except ValueError:
+                stamp = time.time_ns()
+                l2.set(key, stamp, timeout=None, version=1)
+            with self._lock:
+                self._state.stamps[bucket] = stamp
+
+    # Primer nivel
+
+    def _l1_expiry(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if self._l1_timeout is not None:
+            timeout = self._l1_timeout if timeout is None else min(timeout, self._l1_timeout)
+        return None if timeout is None else time.monotonic() + timeout
+
+    def _l1_get(self, key, stamps):
+        # Devuelve (encontrado, valor)
+        with self._lock:
+            entry = self._l1.get(key)
+            if entry is None:
+                self._state.stats['l1_misses'] += 1
+                return False, None
+            data, expires, bucket, stamp = entry
+            if stamp != stamps[bucket] or (expires is not None and expires <= time.monotonic()):
+                del self._l1[key]
+                self._state.stats['l1_stale'] += 1
+                self._state.stats['l1_misses'] += 1
+                return False, None
+            self._l1.move_to_end(key)
+            self._state.stats['l1_hits'] += 1
+        return True, pickle.loads(data)
+
+    def _l1_set(self, key, value, timeout, stamp):
+        # stamp es la versión del grupo leída antes de consultar L2, para que
+        # un valor leído antes de una escritura de otro proceso no se use
+        # después de conocer la nueva versión
+        if timeout is not DEFAULT_TIMEOUT and timeout is not None and timeout <= 0:
+            self._l1_delete(key)
+            return
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        expires = self._l1_expiry(timeout)
+        with self._lock:
+            self._l1[key] = (data, expires, self._bucket(key), stamp)
+            self._l1.move_to_end(key)
+            while len(self._l1) > self._l1_max_entries:
+                self._l1.popitem(last=False)
+                self._state.stats['l1_evictions'] += 1
+
+    def _l1_delete(self, key):
+        with self._lock:
+            return self._l1.pop(key, None) is not None
+
+    # API de BaseCache
+
+    def _keys(self, key, version):
+        # L1 usa la llave completa de esta caché; L2 recibe la llave original
+        # con la versión de esta caché y aplica su propio prefijo
+        version = self.version if version is None else version
+        return self.make_and_validate_key(key, version=version), version
+
+    def _l1_keys(self, keys, version):
+        return {key: self._keys(key, version)[0] for key in keys}
+
+    def get(self, key, default=None, version=None):
+        l1_key, version = self._keys(key, version)
+        stamps = self._current_stamps()
+        found, value = self._l1_get(l1_key, stamps)
+        if found:
+            return value
+        stamp = stamps[self._bucket(l1_key)]
+        value = self.l2.get(key, self._missing, version=version)
+        if value is self._missing:
+            self._count('l2_misses')
+            return default
+        self._count('l2_hits')
+        self._l1_set(l1_key, value, DEFAULT_TIMEOUT, stamp)
+        return value
+
+    def get_many(self, keys, version=None):
+        version = self.version if version is None else version
+        stamps = self._current_stamps()
+        found, pending = {}, {}
+        for key, l1_key in self._l1_keys(keys, version).items():
+            hit, value = self._l1_get(l1_key, stamps)
+            if hit:
+                found[key] = value
+            else:
+                pending[key] = (l1_key, stamps[self._bucket(l1_key)])
+        if pending:
+            loaded = self.l2.get_many(list(pending), version=version)
+            self._count('l2_hits', len(loaded))
+            self._count('l2_misses', len(pending) - len(loaded))
+            for key, value in loaded.items():
+                l1_key, stamp = pending[key]
+                self._l1_set(l1_key, value, DEFAULT_TIMEOUT, stamp)
+            found.update(loaded)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        l1_key, version = self._keys(key, version)
+        self.l2.set(key, value, timeout=timeout, version=version)
+        stamps = self._written([l1_key])
+        self._l1_set(l1_key, value, timeout, stamps[self._bucket(l1_key)])
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        # Si la llave no existía en L2 ningún proceso puede tenerla vigente
+        # en L1, por lo que no se cambia la versión de su grupo
+        l1_key, version = self._keys(key, version)
+        stamps = self._current_stamps()
+        if not self.l2.add(key, value, timeout=timeout, version=version):
+            return False
+        self._count('fills')
+        self._l1_set(l1_key, value, timeout, stamps[self._bucket(l1_key)])
+        return True
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        version = self.version if version is None else version
+        l1_keys = self._l1_keys(data, version)
+        failed = self.l2.set_many(data, timeout=timeout, version=version) or []
+        stamps = self._written(l1_keys.values())
+        for key, value in data.items():
+            if key in failed:
+                self._l1_delete(l1_keys[key])
+            else:
+                self._l1_set(l1_keys[key], value, timeout, stamps[self._bucket(l1_keys[key])])
+        return failed
+
+    def fill_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        """Guarda en L2 valores leídos de la fuente después de un fallo.
+
+        No son valores nuevos, por lo que no cambian las versiones de los
+        grupos ni invalidan L1 en los demás procesos. Tampoco se guardan en
+        L1: la siguiente lectura los copia desde L2 con la versión vigente,
+        leída antes de consultarlos.
+        """
+        version = self.version if version is None else version
+        failed = self.l2.set_many(data, timeout=timeout, version=version) or []
+        self._count('fills', len(data) - len(failed))
+        return failed
+
+    def _written(self, l1_keys):
+        # Devuelve las versiones de los grupos después de incrementarlas
+        self._refresh_stamps()
+        l1_keys = list(l1_keys)
+        self._count('writes', len(l1_keys))
+        self._bump(self._bucket(key) for key in l1_keys)
+        with self._lock:
+            return list(self._state.stamps)
+
+    def delete(self, key, version=None):
+        l1_key, version = self._keys(key, version)
+        deleted = self.l2.delete(key, version=version)
+        self._deleted([l1_key])
+        return deleted
+
+    def delete_many(self, keys, version=None):
+        version = self.version if version is None else version
+        l1_keys = self._l1_keys(keys, version)
+        if l1_keys:
+            self.l2.delete_many(list(l1_keys), version=version)
+            self._deleted(l1_keys.values())
+
+    def _deleted(self, l1_keys):
+        l1_keys = list(l1_keys)
+        self._refresh_stamps()
+        self._count('deletes', len(l1_keys))
+        self._bump(self._bucket(key) for key in l1_keys)
+        for key in l1_keys:
+            self._l1_delete(key)
+
+    def incr(self, key, delta=1, version=None):
+        # El incremento se hace en L2, que es atómico en los backends
+        # compartidos; la entrada de L1 se descarta
+        l1_key, version = self._keys(key, version)
+        value = self.l2.incr(key, delta, version=version)
+        self._deleted([l1_key])
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        l1_key, version = self._keys(key, version)
+        self._l1_delete(l1_key)
+        return self.l2.touch(key, timeout=timeout, version=version)
+
+    def has_key(self, key, version=None):
+        l1_key, version = self._keys(key, version)
+        found, _ = self._l1_get(l1_key, self._current_stamps())
+        return found or self.l2.has_key(key, version=version)
+
+    def clear(self):
+        # Al vaciar L2 también se eliminan los números de versión; los nuevos
+        # se crean con la hora actual, por lo que los demás procesos
+        # descartan sus entradas en L1
+        self.l2.clear()
+        with self._lock:
+            self._l1.clear()
+        self._refresh_stamps(force=True)
+
+    def close(self, **kwargs):
+        self.l2.close(**kwargs)
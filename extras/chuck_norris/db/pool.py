@@ -0,0 +1,180 @@
+import os
+import threading
+import time
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """Pool acotado de conexiones a la base de datos, seguro entre hilos.
+
+    Las conexiones se reutilizan entre peticiones y entre hilos (WSGI o los
+    hilos que usa ASGI para el ORM). Si todas están en uso, se espera hasta
+    `timeout` segundos a que se libere alguna. Las conexiones inactivas por
+    más de `idle_timeout` segundos se cierran.
+    """
+
+    def __init__(self, connect, ping, size=10, timeout=10, idle_timeout=300):
+        self.connect = connect
+        self.ping = ping
+        self.size = size
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self._idle = []
+        self._in_use = 0
+        self._condition = threading.Condition()
+        # Estadísticas acumuladas
+        self.created = 0
+        self.closed = 0
+        self.evicted = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.timeouts = 0
+
+    def _close(self, connection):
+        self.closed += 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _evict_idle(self):
+        # Cerramos las conexiones que llevan demasiado tiempo sin usarse
+        if not self.idle_timeout:
+            return
+        limit = time.monotonic() - self.idle_timeout
+        while self._idle and self._idle[0][1] < limit:
+            connection, _ = self._idle.pop(0)
+            self.evicted += 1
+            self._close(connection)
+
+    def acquire(self):
+        with self._condition:
+            self._evict_idle()
+            if not self._idle and self._in_use >= self.size:
+                self.waits += 1
+                start = time.monotonic()
+                available = self._condition.wait_for(
+                    lambda: self._idle or self._in_use < self.size, self.timeout)
+                self.wait_time += time.monotonic() - start
+                if not available:
+                    self.timeouts += 1
+                    raise PoolTimeout(
+                        f'No hay conexiones disponibles en el pool tras {self.timeout} s '
+                        f'({self.size} en uso).')
+            self._in_use += 1
+            # Usamos la conexión liberada más recientemente
+            connection = self._idle.pop()[0] if self._idle else None
+        if connection is not None:
+            # Verificamos que la conexión siga viva antes de entregarla
+            try:
+                self.ping(connection)
+                return connection
+            except Exception:
+                self._close(connection)
+        try:
+            connection = self.connect()
+        except Exception:
+            with self._condition:
+                self._in_use -= 1
+                self._condition.notify()
+            raise
+        self.created += 1
+        return connection
+
+    def release(self, connection, discard=False):
+        with self._condition:
+            self._in_use -= 1
+            if discard:
+                self._close(connection)
+            else:
+                self._idle.append((connection, time.monotonic()))
+                self._evict_idle()
+            self._condition.notify()
+
+    def stats(self):
+        with self._condition:
+            return {
+                'size': self.size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'created': self.created,
+                'closed': self.closed,
+                'evicted': self.evicted,
+                'waits': self.waits,
+                'wait_time': round(self.wait_time, 6),
+                'timeouts': self.timeouts,
+            }
+
+
+# Pools del proceso por alias de base de datos. Se guardan junto al PID para
+# no compartir conexiones con procesos creados con fork (p. ej. gunicorn)
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, target, factory):
+    key = (os.getpid(), alias, target)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = factory()
+        return pool
+
+
+def get_pool_stats():
+    pid = os.getpid()
+    with _pools_lock:
+        pools = {alias: pool for (owner, alias, _), pool in _pools.items() if owner == pid}
+    return {alias: pool.stats() for alias, pool in pools.items()}
+
+
+class PooledDatabaseWrapperMixin:
+    """Reemplaza la apertura y cierre de conexiones de un backend de Django
+    por la obtención y devolución de conexiones del pool.
+
+    La configuración se lee de la llave POOL de la base de datos en
+    settings.DATABASES: SIZE, TIMEOUT e IDLE_TIMEOUT.
+    """
+
+    def get_pool(self, conn_params):
+        options = self.settings_dict.get('POOL', {})
+        # El pool depende también del servidor y la base de datos, para no
+        # reutilizar conexiones si cambian (p. ej. al crear la base de pruebas)
+        target = tuple(str(self.settings_dict.get(key)) for key in ('HOST', 'PORT', 'NAME', 'USER'))
+        return get_pool(self.alias, target, lambda: ConnectionPool(
+            connect=lambda: super(PooledDatabaseWrapperMixin, self).get_new_connection(conn_params),
+            ping=self.ping_connection,
+            size=options.get('SIZE', 10),
+            timeout=options.get('TIMEOUT', 10),
+            idle_timeout=options.get('IDLE_TIMEOUT', 300),
+        ))
+
+    def ping_connection(self, connection):
+        cursor = connection.cursor()
+        try:
+            cursor.execute('SELECT 1')
+        finally:
+            cursor.close()
+
+    def get_new_connection(self, conn_params):
+        self._pool = self.get_pool(conn_params)
+        try:
+            return self._pool.acquire()
+        except PoolTimeout as exc:
+            raise self.Database.OperationalError(str(exc)) from exc
+
+    def _close(self):
+        if self.connection is None:
+            return
+        # Deshacemos cualquier transacción abierta antes de devolver la
+        # conexión; si falla, o si hubo errores, la descartamos
+        discard = self.errors_occurred and not self.is_usable()
+        if not discard and not self.get_autocommit():
+            try:
+                self.connection.rollback()
+            except self.Database.Error:
+                discard = True
+        self._pool.release(self.connection, discard=discard)
@@ -45,11 +45,17 @@ INSTALLED_APPS = [
     'rest_framework',
     'corsheaders',
     'api',
+    'monitoring',
     'rest_framework.authtoken'
 ]
 
 MIDDLEWARE = [
+    'monitoring.middleware.MetricsMiddleware',
+    'monitoring.middleware.MemoryMiddleware',
+    'monitoring.middleware.TracingMiddleware',
+    'monitoring.middleware.SlowQueryMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'facts.middleware.AutocompleteMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -58,13 +64,16 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'monitoring.middleware.ProfilingMiddleware',
+    'monitoring.middleware.ViewTracingMiddleware',
 ]
 
 ROOT_URLCONF = 'chuck_norris.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Igual a DjangoTemplates, pero mide el renderizado en las trazas
+        'BACKEND': 'monitoring.template_backends.TracedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -88,6 +97,79 @@ DATABASES = {
     'default': env.db()
 }
 
+# Pool de conexiones compartido por los hilos de cada proceso (WSGI y ASGI).
+# Cada petición devuelve su conexión al pool al terminar. Está activo por
+# defecto con MySQL; con SQLite abrir una conexión es barato
+DB_POOL_ENGINES = {
+    'django.db.backends.mysql': 'chuck_norris.db.mysql',
+    'django.db.backends.sqlite3': 'chuck_norris.db.sqlite3',
+}
+DB_POOL = (env.bool('DB_POOL', default=DATABASES['default']['ENGINE'] == 'django.db.backends.mysql')
+           and DATABASES['default']['ENGINE'] in DB_POOL_ENGINES)
+if DB_POOL:
+    DATABASES['default']['ENGINE'] = DB_POOL_ENGINES[DATABASES['default']['ENGINE']]
+    # El pool mantiene abiertas las conexiones y las verifica al entregarlas
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['POOL'] = {
+        # Cantidad máxima de conexiones abiertas por proceso
+        'SIZE': env.int('DB_POOL_SIZE', default=10),
+        # Segundos que se espera por una conexión libre antes de fallar
+        'TIMEOUT': env.float('DB_POOL_TIMEOUT', default=10.0),
+        # Segundos de inactividad tras los cuales se cierra una conexión
+        'IDLE_TIMEOUT': env.int('DB_POOL_IDLE_TIMEOUT', default=300),
+    }
+else:
+    # Sin pool, conexiones persistentes: se reutilizan durante
+    # DB_CONN_MAX_AGE segundos y se verifican antes de reutilizarse en una
+    # nueva petición
+    DATABASES['default']['CONN_MAX_AGE'] = env.int('DB_CONN_MAX_AGE', default=60)
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = env.bool('DB_CONN_HEALTH_CHECKS', default=True)
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Caché compartida entre los procesos del servidor, por ejemplo
+    # CACHE_URL=filecache:///var/tmp/chuck_norris o memcache://127.0.0.1:11211
+    'shared': env.cache_url('CACHE_URL', default='locmemcache://shared'),
+    # Hechos leídos por identificador: un LRU en memoria de cada proceso
+    # delante de la caché compartida
+    'facts': {
+        'BACKEND': 'chuck_norris.cache.tiered.TieredCache',
+        'LOCATION': 'facts',
+        'TIMEOUT': env.int('FACTS_CACHE_TTL', default=300),
+        'OPTIONS': {
+            'L2': 'shared',
+            'L1_MAX_ENTRIES': env.int('FACTS_CACHE_MAX_ENTRIES', default=10000),
+            'L1_TIMEOUT': env.int('FACTS_CACHE_L1_TTL', default=60),
+            # Segundos que un proceso puede usar un valor ya reemplazado por otro
+            'STAMP_INTERVAL': env.float('FACTS_CACHE_STAMP_INTERVAL', default=1),
+        },
+    },
+}
+FACTS_CACHE_ALIAS = 'facts'
+# Contador de cambios de los hechos usado en los ETag y en las consultas
+# guardadas. Debe estar en una caché compartida por todos los procesos
+# (CACHE_URL); con la caché en memoria por defecto solo sirve con uno
+FACTS_VERSION_CACHE_ALIAS = 'shared'
+# Segundos que se guardan las páginas del listado, las búsquedas y los
+# hechos similares de la API y la página principal
+FACTS_QUERY_CACHE_TTL = env.int('FACTS_QUERY_CACHE_TTL', default=60)
+# Los valores que expiran se recalculan una sola vez: por hilo en cada
+# proceso y, con SINGLE_FLIGHT_LOCK, por proceso usando un candado en la
+# caché compartida. Mientras tanto se entrega el valor anterior, que se
+# conserva SINGLE_FLIGHT_STALE_TTL segundos más
+SINGLE_FLIGHT_ALIAS = 'shared'
+SINGLE_FLIGHT_LOCK = env.bool('SINGLE_FLIGHT_LOCK', default=True)
+SINGLE_FLIGHT_LOCK_TIMEOUT = env.int('SINGLE_FLIGHT_LOCK_TIMEOUT', default=10)
+SINGLE_FLIGHT_STALE_TTL = env.int('SINGLE_FLIGHT_STALE_TTL', default=60)
+# Segundos que se recuerda que un identificador no existe
+FACTS_CACHE_NEGATIVE_TTL = env.int('FACTS_CACHE_NEGATIVE_TTL', default=30)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -132,6 +214,98 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 CORS_ORIGIN_ALLOW_ALL = True
 
+# Segundos que dura el índice de hechos usado para la selección aleatoria
+# antes de reconstruirse (0 para mantenerlo indefinidamente)
+FACTS_RANDOM_INDEX_TTL = env.int('FACTS_RANDOM_INDEX_TTL', default=300)
+
+# Tamaño de página por defecto y máximo de la API de hechos
+FACTS_API_PAGE_SIZE = env.int('FACTS_API_PAGE_SIZE', default=50)
+FACTS_API_MAX_PAGE_SIZE = env.int('FACTS_API_MAX_PAGE_SIZE', default=500)
+# Cantidad máxima de hechos por petición en las operaciones masivas
+FACTS_API_BULK_MAX_ITEMS = env.int('FACTS_API_BULK_MAX_ITEMS', default=10000)
+# Filas afectadas por cada UPDATE o DELETE de las operaciones masivas
+FACTS_API_BULK_CHUNK_SIZE = env.int('FACTS_API_BULK_CHUNK_SIZE', default=1000)
+
+# Hechos mejor puntuados por el índice de texto completo que la búsqueda
+# aproximada vuelve a ordenar según la similitud de sus palabras
+FACTS_SEARCH_CANDIDATES = env.int('FACTS_SEARCH_CANDIDATES', default=500)
+# Similitud mínima (0 a 1) para corregir una palabra en la búsqueda aproximada
+FACTS_TRIGRAM_THRESHOLD = env.float('FACTS_TRIGRAM_THRESHOLD', default=0.3)
+# Cantidad máxima de palabras y frases del índice de autocompletado, y si se
+# construye en segundo plano desde la primera petición de cada proceso en
+# lugar de en la primera consulta
+FACTS_AUTOCOMPLETE_MAX_TERMS = env.int('FACTS_AUTOCOMPLETE_MAX_TERMS', default=100000)
+FACTS_AUTOCOMPLETE_PRELOAD = env.bool('FACTS_AUTOCOMPLETE_PRELOAD', default=True)
+# Similitud de Jaccard mínima (0 a 1) para advertir que un hecho nuevo es
+# casi idéntico a uno existente
+FACTS_NEAR_DUPLICATE_THRESHOLD = env.float('FACTS_NEAR_DUPLICATE_THRESHOLD', default=0.7)
+
+# Directorio con los vectores TF-IDF de los hechos similares (se construyen con
+# el comando build_similar_index), fracción máxima de hechos en que puede
+# aparecer una palabra, hechos leídos por palabra en cada consulta, segundos
+# entre cada revisión de una nueva versión y hechos creados o modificados
+# después del índice a partir de los cuales se reconstruye automáticamente
+FACTS_SIMILAR_DIR = env.str('FACTS_SIMILAR_DIR', default=os.path.join(BASE_DIR, 'var', 'similar'))
+FACTS_SIMILAR_MAX_DF = env.float('FACTS_SIMILAR_MAX_DF', default=0.5)
+FACTS_SIMILAR_MAX_POSTINGS = env.int('FACTS_SIMILAR_MAX_POSTINGS', default=5000)
+FACTS_SIMILAR_RELOAD_INTERVAL = env.int('FACTS_SIMILAR_RELOAD_INTERVAL', default=30)
+FACTS_SIMILAR_MAX_PENDING = env.int('FACTS_SIMILAR_MAX_PENDING', default=5000)
+
+# Métricas de las peticiones: cada proceso escribe las suyas en METRICS_DIR
+# cada METRICS_FLUSH_INTERVAL segundos y /metrics las suma. Solo las
+# direcciones de METRICS_ALLOWED_IPS pueden leerlas (todas si está vacía)
+METRICS_DIR = env.str('METRICS_DIR', default=os.path.join(BASE_DIR, 'var', 'metrics'))
+METRICS_FLUSH_INTERVAL = env.int('METRICS_FLUSH_INTERVAL', default=5)
+METRICS_ALLOWED_IPS = env.list('METRICS_ALLOWED_IPS', default=['127.0.0.1', '::1'])
+
+# Fracción de las peticiones que se trazan (0 a 1), destino de las trazas
+# ('file' o 'memory'), archivo JSON Lines que lee el comando show_traces,
+# tamaño a partir del cual se rota a TRACING_FILE.1 y cantidad máxima de
+# spans por traza. Solo se respeta el traceparent muestreado de las
+# peticiones que llegan desde TRACING_TRUSTED_IPS (ninguna si está vacía)
+TRACING_SAMPLE_RATE = env.float('TRACING_SAMPLE_RATE', default=0.01)
+TRACING_EXPORTER = env.str('TRACING_EXPORTER', default='file')
+TRACING_FILE = env.str('TRACING_FILE', default=os.path.join(BASE_DIR, 'var', 'traces.jsonl'))
+TRACING_MAX_BYTES = env.int('TRACING_MAX_BYTES', default=50 * 1024 * 1024)
+TRACING_MAX_SPANS = env.int('TRACING_MAX_SPANS', default=1000)
+TRACING_TRUSTED_IPS = env.list('TRACING_TRUSTED_IPS', default=[])
+
+# Registro de consultas lentas: las que superan SLOW_QUERY_THRESHOLD_MS se
+# guardan en SLOW_QUERY_LOG con su plan de ejecución. Se registran como
+# máximo una vez por consulta cada SLOW_QUERY_INTERVAL segundos, y de esos
+# registros solo una fracción SLOW_QUERY_SAMPLE_RATE; las ejecuciones no
+# registradas se suman al siguiente. El comando slow_queries resume el archivo
+SLOW_QUERY_THRESHOLD_MS = env.float('SLOW_QUERY_THRESHOLD_MS', default=100)
+SLOW_QUERY_SAMPLE_RATE = env.float('SLOW_QUERY_SAMPLE_RATE', default=1.0)
+SLOW_QUERY_INTERVAL = env.int('SLOW_QUERY_INTERVAL', default=60)
+SLOW_QUERY_EXPLAIN = env.bool('SLOW_QUERY_EXPLAIN', default=True)
+SLOW_QUERY_LOG = env.str('SLOW_QUERY_LOG', default=os.path.join(BASE_DIR, 'var', 'slow_queries.jsonl'))
+# Tablas cuyas consultas se registran sin parámetros
+SLOW_QUERY_REDACTED_TABLES = env.list('SLOW_QUERY_REDACTED_TABLES', default=['django_session', 'auth_user'])
+
+# Perfiles de las peticiones solicitadas por usuarios staff (encabezado
+# X-Profile o parámetro _profile), segundos entre muestras del modo 'sample'
+# y cuántos perfiles se conservan y por cuántos segundos como máximo
+PROFILING_DIR = env.str('PROFILING_DIR', default=os.path.join(BASE_DIR, 'var', 'profiles'))
+PROFILING_INTERVAL = env.float('PROFILING_INTERVAL', default=0.005)
+PROFILING_MAX_FILES = env.int('PROFILING_MAX_FILES', default=100)
+PROFILING_MAX_AGE = env.int('PROFILING_MAX_AGE', default=7 * 24 * 3600)
+
+# Capturas de tracemalloc (memory/snapshots/ y memory/diff/, solo staff):
+# directorio donde se guardan, cuántas se conservan en cada proceso y
+# marcos guardados por asignación. MEMORY_PROFILING activa tracemalloc al
+# iniciar y registra la memoria máxima de cada petición por vista
+MEMORY_SNAPSHOT_DIR = env.str('MEMORY_SNAPSHOT_DIR', default=os.path.join(BASE_DIR, 'var', 'memory'))
+MEMORY_MAX_SNAPSHOTS = env.int('MEMORY_MAX_SNAPSHOTS', default=5)
+MEMORY_TRACE_FRAMES = env.int('MEMORY_TRACE_FRAMES', default=5)
+MEMORY_PROFILING = env.bool('MEMORY_PROFILING', default=False)
+
+# Las peticiones de lectura a la API confían en los datos del token JWT sin
+# consultar el usuario; las de escritura usan una caché LRU de usuarios
+API_JWT_STATELESS_READS = env.bool('API_JWT_STATELESS_READS', default=True)
+API_JWT_USER_CACHE_SIZE = env.int('API_JWT_USER_CACHE_SIZE', default=1024)
+API_JWT_USER_CACHE_TTL = env.int('API_JWT_USER_CACHE_TTL', default=60)
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=15),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=14),
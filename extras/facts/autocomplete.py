@@ -0,0 +1,241 @@
+import heapq
+import os
+import threading
+import unicodedata
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from itertools import groupby
+
+from django.conf import settings
+from django.db import connection
+
+from .models import WORD_RE, Fact
+from .search import fold
+
+# Carácter mayor que cualquier otro, para obtener el final de un rango de prefijos
+MAX_CHAR = '\U0010ffff'
+
+
+def terms(text, folded=None):
+    # Palabras y pares de palabras consecutivas del texto, como pares
+    # (clave sin tildes, texto en minúsculas):
+    # "Chuck Norris ganó" -> "chuck", "norris", "ganó", "chuck norris", "norris ganó"
+    # folded guarda las palabras ya convertidas, para no repetir fold()
+    if folded is None:
+        folded = {}
+    words = WORD_RE.findall(unicodedata.normalize('NFKC', text).casefold())
+    keys = []
+    for word in words:
+        key = folded.get(word)
+        if key is None:
+            key = folded[word] = fold(word)
+        keys.append(key)
+    result = dict(zip(keys, words))
+    for i in range(len(words) - 1):
+        result.setdefault(f'{keys[i]} {keys[i + 1]}', f'{words[i]} {words[i + 1]}')
+    return result.items()
+
+
+class PrefixIndex:
+    """Índice de prefijos para autocompletar la búsqueda.
+
+    Guarda las palabras y frases sin tildes en una lista ordenada, junto a
+    su texto original y la cantidad de hechos en que aparecen. Los términos
+    que comienzan con un prefijo forman un rango contiguo que se obtiene con
+    bisect. Se conservan como máximo FACTS_AUTOCOMPLETE_MAX_TERMS términos,
+    los más frecuentes.
+    """
+
+    chunk_size = 5000
+    # Los prefijos cortos abarcan muchos términos, por lo que se guardan sus
+    # mejores resultados y se actualizan con cada modificación
+    cached_prefix_length = 3
+    cache_size = 10
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Evita que dos hilos construyan el índice al mismo tiempo
+        self._load_lock = threading.Lock()
+        self._loaded = False
+        # Proceso que ya inició la construcción en segundo plano
+        self._preload_pid = None
+        self._keys = []
+        self._labels = []
+        self._counts = array('I')
+        self._cache = {}
+
+    @property
+    def max_terms(self):
+        return getattr(settings, 'FACTS_AUTOCOMPLETE_MAX_TERMS', 100000)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def load(self):
+        # Contamos los términos por bloques. Si el conteo supera el doble del
+        # máximo descartamos los que aparecen una sola vez y, si no basta,
+        # los menos frecuentes, para acotar la memoria
+        max_terms = self.max_terms
+        counts = Counter()
+        labels = {}
+        folded = {}
+        last_id = 0
+        while True:
+            rows = list(Fact.objects.filter(id__gt=last_id).order_by('id')
+                        .values_list('id', 'fact')[:self.chunk_size])
+            if not rows:
+                break
+            for _, text in rows:
+                for key, label in terms(text, folded):
+                    counts[key] += 1
+                    if key not in labels:
+                        labels[key] = label
+            last_id = rows[-1][0]
+            if len(counts) > 2 * max_terms:
+                counts = Counter({key: count for key, count in counts.items() if count > 1})
+                if len(counts) > max_terms:
+                    counts = Counter(dict(counts.most_common(max_terms)))
+                labels = {key: labels[key] for key in counts}
+                folded = {}
+        keys = sorted(key for key, _ in counts.most_common(max_terms))
+        with self._lock:
+            self._keys = keys
+            self._labels = [labels[key] for key in keys]
+            self._counts = array('I', (counts[key] for key in keys))
+            self._cache = {}
+            self._warm_cache()
+            self._loaded = True
+
+    def ensure_loaded(self, blocking=True):
+        # Sin bloquear, devuelve False mientras otro hilo construye el índice
+        if self._loaded:
+            return True
+        if not self._load_lock.acquire(blocking=blocking):
+            return False
+        try:
+            if not self._loaded:
+                self.load()
+        finally:
+            self._load_lock.release()
+        return True
+
+    def preload(self):
+        # Construye el índice en segundo plano, una vez por proceso. Se llama
+        # con la primera petición y no al importar la aplicación: con
+        # gunicorn --preload, un proceso creado con fork mientras otro hilo
+        # tiene _load_lock lo heredaría bloqueado para siempre
+        if self._preload_pid == os.getpid():
+            return
+        self._preload_pid = os.getpid()
+        threading.Thread(target=self._preload, daemon=True).start()
+
+    def _preload(self):
+        try:
+            self.ensure_loaded()
+        finally:
+            # La conexión de este hilo no se vuelve a usar
+            connection.close()
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded = False
+
+    def _position(self, key):
+        position = bisect_left(self._keys, key)
+        if position < len(self._keys) and self._keys[position] == key:
+            return position
+        return None
+
+    def _count(self, key):
+        position = self._position(key)
+        return 0 if position is None else self._counts[position]
+
+    def _prefixes(self, key):
+        return {key[:length] for length in range(1, self.cached_prefix_length + 1)}
+
+    def add_text(self, text):
+        # Igual que en el índice de trigramas, al modificar un hecho se quita
+        # su texto anterior y se agrega el nuevo
+        with self._lock:
+            if not self._loaded:
+                return
+            for key, label in terms(text):
+                position = bisect_left(self._keys, key)
+                if position < len(self._keys) and self._keys[position] == key:
+                    self._counts[position] += 1
+                else:
+                    self._keys.insert(position, key)
+                    self._labels.insert(position, label)
+                    self._counts.insert(position, 1)
+                # Actualizamos los resultados guardados de sus prefijos
+                for prefix in self._prefixes(key):
+                    cached = self._cache.get(prefix)
+                    if cached is not None:
+                        if key not in cached:
+                            cached.append(key)
+                        cached.sort(key=self._count, reverse=True)
+                        del cached[self.cache_size:]
+            # Si se supera el máximo en un 10% descartamos los menos frecuentes
+            if len(self._keys) > self.max_terms * 1.1:
+                self._trim()
+
+    def remove_text(self, text):
+        with self._lock:
+            if not self._loaded:
+                return
+            for key, _ in terms(text):
+                position = self._position(key)
+                if position is None or not self._counts[position]:
+                    continue
+                self._counts[position] -= 1
+                # Si el término estaba entre los resultados guardados, se
+                # vuelven a calcular en la siguiente consulta
+                for prefix in self._prefixes(key):
+                    if key in self._cache.get(prefix, ()):
+                        del self._cache[prefix]
+
+    def _trim(self):
+        keep = sorted(heapq.nlargest(self.max_terms, range(len(self._keys)), key=self._counts.__getitem__))
+        self._keys = [self._keys[i] for i in keep]
+        self._labels = [self._labels[i] for i in keep]
+        self._counts = array('I', (self._counts[i] for i in keep))
+        self._cache = {}
+        self._warm_cache()
+
+    def _top(self, start, end, limit):
+        counts = self._counts
+        return heapq.nlargest(limit, (i for i in range(start, end) if counts[i]),
+                              key=counts.__getitem__)
+
+    def _warm_cache(self):
+        # Calculamos en una pasada los resultados de los prefijos de una y dos
+        # letras, que son los que abarcan más términos
+        keys = self._keys
+        for length in range(1, 3):
+            for prefix, group in groupby(range(len(keys)), key=lambda i: keys[i][:length]):
+                group = list(group)
+                if len(prefix) == length:
+                    best = self._top(group[0], group[-1] + 1, self.cache_size)
+                    self._cache[prefix] = [keys[i] for i in best]
+
+    def complete(self, prefix, limit=10):
+        # Devuelve los términos más frecuentes que comienzan con el prefijo
+        key = ' '.join(WORD_RE.findall(fold(prefix)))
+        if not key or not self.ensure_loaded(blocking=False):
+            return []
+        with self._lock:
+            if len(key) <= self.cached_prefix_length and limit <= self.cache_size:
+                cached = self._cache.get(key)
+                if cached is None:
+                    start = bisect_left(self._keys, key)
+                    end = bisect_left(self._keys, key + MAX_CHAR, start)
+                    cached = self._cache[key] = [self._keys[i] for i in self._top(start, end, self.cache_size)]
+                return [self._labels[self._position(k)] for k in cached[:limit]]
+            start = bisect_left(self._keys, key)
+            end = bisect_left(self._keys, key + MAX_CHAR, start)
+            return [self._labels[i] for i in self._top(start, end, limit)]
+
+
+# Índice compartido por todas las peticiones del proceso
+autocomplete_index = PrefixIndex()
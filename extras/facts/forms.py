@@ -1,6 +1,6 @@
 from django import forms
 
-from .models import Fact
+from .models import DUPLICATE_FACT_MESSAGE, Fact, fact_hash
 
 
 class FactForm(forms.ModelForm):
@@ -15,3 +15,13 @@ class FactForm(forms.ModelForm):
         labels = {
             'fact': 'Hecho'
         }
+
+    def clean_fact(self):
+        fact = self.cleaned_data['fact']
+        # Rechazamos los hechos cuyo texto normalizado ya existe
+        duplicates = Fact.objects.filter(content_hash=fact_hash(fact))
+        if self.instance.pk is not None:
+            duplicates = duplicates.exclude(pk=self.instance.pk)
+        if duplicates.exists():
+            raise forms.ValidationError(DUPLICATE_FACT_MESSAGE)
+        return fact
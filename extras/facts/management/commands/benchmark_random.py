@@ -0,0 +1,92 @@
+import random
+import time
+from array import array
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+from facts.models import Fact
+from facts.random_index import FactIdIndex
+
+
+class Command(BaseCommand):
+    help = ('Compara la selección aleatoria con random.choice(Fact.objects.all()) '
+            'contra el índice de identificadores en memoria.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int,
+                            default=[10_000, 1_000_000, 10_000_000])
+        parser.add_argument('--repeat', type=int, default=1000,
+                            help='Selecciones medidas con el índice por tamaño')
+        parser.add_argument('--baseline-max', type=int, default=1_000_000,
+                            help='Tamaño máximo para medir el enfoque actual')
+        parser.add_argument('--db', action='store_true',
+                            help='Medir contra la tabla real en lugar de datos sintéticos')
+
+    def handle(self, *args, **options):
+        if options['db']:
+            self.benchmark_db(options['repeat'])
+            return
+        self.stdout.write(f'{"hechos":>12} {"actual (ms)":>14} {"índice (µs)":>14} {"índice (MB)":>12}')
+        for size in options['sizes']:
+            index = self.synthetic_index(size)
+            index_us = self.time_index(index, options['repeat']) * 1e6
+            index_mb = index._ids.itemsize * len(index._ids) / 2**20
+            if size <= options['baseline_max']:
+                baseline = f'{self.time_baseline(index._ids) * 1e3:14.1f}'
+            else:
+                baseline = f'{"omitido":>14}'
+            self.stdout.write(f'{size:>12} {baseline} {index_us:14.2f} {index_mb:12.1f}')
+
+    def synthetic_index(self, size):
+        # Generamos identificadores con ~5% de huecos, como si se hubieran
+        # eliminado filas
+        ids = array('q')
+        next_id = 1
+        while len(ids) < size:
+            if random.random() >= 0.05:
+                ids.append(next_id)
+            next_id += 1
+        index = FactIdIndex(ttl=0)
+        index._ids = ids
+        index._loaded_at = time.monotonic()
+        return index
+
+    def time_index(self, index, repeat):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            index.sample_id()
+        return (time.perf_counter() - start) / repeat
+
+    def time_baseline(self, ids):
+        # Reproducimos el costo de materializar todas las filas como modelos,
+        # sin contar la transferencia desde la base de datos
+        now = timezone.now()
+        fields = ['id', 'fact', 'created_at', 'updated_at', 'user_id']
+        start = time.perf_counter()
+        facts = [Fact.from_db('default', fields, (i, 'Chuck Norris', now, now, 1)) for i in ids]
+        random.choice(facts)
+        return time.perf_counter() - start
+
+    def benchmark_db(self, repeat):
+        count = Fact.objects.count()
+        self.stdout.write(f'Hechos en la tabla: {count}')
+        if not count:
+            return
+        rounds = max(1, min(repeat, 20))
+        start = time.perf_counter()
+        for _ in range(rounds):
+            random.choice(Fact.objects.all())
+        baseline = (time.perf_counter() - start) / rounds
+        index = FactIdIndex(ttl=0)
+        start = time.perf_counter()
+        index.load()
+        load = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(repeat):
+            index.random_fact()
+        indexed = (time.perf_counter() - start) / repeat
+        self.stdout.write(f'Enfoque actual: {baseline * 1e3:.2f} ms por petición')
+        self.stdout.write(f'Carga del índice: {load * 1e3:.2f} ms (una vez por proceso)')
+        self.stdout.write(f'Índice + consulta por id: {indexed * 1e3:.3f} ms por petición')
+        self.stdout.write(f'Motor: {connection.vendor}')
@@ -0,0 +1,62 @@
+import random
+import string
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from facts.trigram import TrigramIndex
+
+
+class Command(BaseCommand):
+    help = ('Mide la latencia de la corrección de palabras con el índice de '
+            'trigramas según la cantidad de hechos (datos sintéticos).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int,
+                            default=[10_000, 100_000, 1_000_000])
+        parser.add_argument('--words', type=int, default=12,
+                            help='Palabras por hecho')
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        self.stdout.write(f'{"hechos":>10} {"vocabulario":>12} {"p50 (ms)":>10} {"p95 (ms)":>10}')
+        for size in options['sizes']:
+            index, vocabulary = self.build(rng, size, options['words'])
+            queries = [self.typo(rng, rng.choice(vocabulary)) for _ in range(options['repeat'])]
+            timings = []
+            for query in queries:
+                start = time.perf_counter()
+                index.similar_words(query)
+                timings.append(time.perf_counter() - start)
+            timings.sort()
+            p50 = timings[len(timings) // 2] * 1e3
+            p95 = timings[int(len(timings) * 0.95)] * 1e3
+            self.stdout.write(f'{size:>10} {len(index):>12} {p50:10.3f} {p95:10.3f}')
+
+    def build(self, rng, size, words_per_fact):
+        # El vocabulario crece con la raíz de la cantidad de hechos (ley de
+        # Heaps) y la frecuencia de las palabras sigue una distribución de Zipf
+        vocabulary = [self.word(rng) for _ in range(int(60 * size ** 0.5))]
+        weights = [1 / rank for rank in range(1, len(vocabulary) + 1)]
+        counts = Counter()
+        for _ in range(size // 1000 or 1):
+            counts.update(rng.choices(vocabulary, weights, k=1000 * words_per_fact))
+        index = TrigramIndex()
+        for word, count in counts.items():
+            index._add_word(word, count)
+        index._loaded = True
+        return index, list(counts)
+
+    def word(self, rng):
+        return ''.join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 10)))
+
+    def typo(self, rng, word):
+        # Eliminamos, duplicamos o cambiamos una letra al azar
+        position = rng.randrange(len(word))
+        operation = rng.choice(('delete', 'double', 'replace'))
+        if operation == 'delete':
+            return word[:position] + word[position + 1:]
+        if operation == 'double':
+            return word[:position] + word[position] + word[position:]
+        return word[:position] + rng.choice(string.ascii_lowercase) + word[position + 1:]
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from facts import similar
+
+
+class Command(BaseCommand):
+    help = ('Calcula los vectores TF-IDF de todos los hechos para la búsqueda '
+            'de hechos similares. Debe ejecutarse una vez al instalar; luego los '
+            'hechos nuevos y modificados se agregan de forma incremental y el '
+            'índice se reconstruye solo al superar FACTS_SIMILAR_MAX_PENDING.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directory', default=None,
+                            help='Directorio del índice (por defecto FACTS_SIMILAR_DIR)')
+        parser.add_argument('--max-df', type=float, default=None,
+                            help='Fracción máxima de hechos en que puede aparecer una palabra')
+
+    def handle(self, *args, **options):
+        if not similar.similar_index.available:
+            raise CommandError('Se requieren NumPy y SciPy para construir el índice.')
+        start = time.perf_counter()
+        manifest = similar.build_index(options['directory'], max_df=options['max_df'])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f'Índice {manifest["build"]} con {manifest["facts"]} hechos '
+                          f'construido en {elapsed:.1f} s')
@@ -0,0 +1,116 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from facts import minhash
+from facts.models import Fact, FactBand
+
+
+class Command(BaseCommand):
+    help = ('Agrupa los hechos casi idénticos recorriendo la tabla por bloques. '
+            'También guarda las bandas MinHash de los hechos que aún no las '
+            'tienen (la migración 0009 las calcula para los existentes).')
+
+    # Claves por consulta, para no superar el límite de parámetros de SQLite
+    keys_per_query = 900
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold', type=float, default=None,
+                            help='Similitud de Jaccard mínima (por defecto '
+                                 'FACTS_NEAR_DUPLICATE_THRESHOLD)')
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Hechos leídos por bloque')
+        parser.add_argument('--top', type=int, default=20,
+                            help='Cantidad de grupos que se muestran')
+
+    def handle(self, *args, **options):
+        threshold = options['threshold']
+        if threshold is None:
+            threshold = getattr(settings, 'FACTS_NEAR_DUPLICATE_THRESHOLD', 0.7)
+        # Solo se guardan en memoria los hechos que tienen algún casi
+        # duplicado (como un union-find), nunca la tabla completa
+        self.parent = {}
+        total = indexed = 0
+        last_id = 0
+        while True:
+            chunk = list(Fact.objects.filter(id__gt=last_id).order_by('id')
+                         .values_list('id', 'fact')[:options['chunk_size']])
+            if not chunk:
+                break
+            last_id = chunk[-1][0]
+            total += len(chunk)
+            indexed += self.process(chunk, threshold)
+            self.stderr.write(f'\r{total} hechos revisados', ending='')
+        self.stderr.write('')
+
+        clusters = defaultdict(list)
+        for fact_id in self.parent:
+            clusters[self.find(fact_id)].append(fact_id)
+        clusters = sorted(clusters.values(), key=len, reverse=True)
+        self.stdout.write(f'Hechos revisados: {total}; bandas nuevas para {indexed} hechos')
+        self.stdout.write(f'Grupos de casi duplicados: {len(clusters)} '
+                          f'({sum(len(c) for c in clusters)} hechos)')
+        for cluster in clusters[:options['top']]:
+            cluster.sort()
+            texts = dict(Fact.objects.filter(id__in=cluster[:3]).values_list('id', 'fact'))
+            self.stdout.write(f'\n{len(cluster)} hechos: {cluster[:10]}')
+            for fact_id in cluster[:3]:
+                self.stdout.write(f'  {fact_id}: {texts.get(fact_id, "")}')
+
+    def process(self, chunk, threshold):
+        # Calculamos los fragmentos y las bandas de cada hecho del bloque
+        shingles = {fact_id: minhash.shingles(text) for fact_id, text in chunk}
+        keys = {fact_id: minhash.band_keys(minhash.signature(shingles[fact_id]))
+                for fact_id, _ in chunk}
+
+        # Guardamos las bandas de los hechos que aún no están indexados
+        ids = list(keys)
+        present = set(FactBand.objects.filter(fact_id__in=ids)
+                      .values_list('fact_id', flat=True).distinct())
+        missing = [(fact_id, text) for fact_id, text in chunk if fact_id not in present]
+        minhash.index_facts(missing)
+
+        # Buscamos los hechos que comparten alguna banda, consultando el
+        # índice con todas las claves del bloque
+        owners = defaultdict(set)
+        all_keys = list({key for fact_keys in keys.values() for key in fact_keys})
+        for start in range(0, len(all_keys), self.keys_per_query):
+            rows = FactBand.objects.filter(key__in=all_keys[start:start + self.keys_per_query])
+            for key, fact_id in rows.values_list('key', 'fact_id'):
+                owners[key].add(fact_id)
+
+        # Cada par se compara una sola vez: con los hechos anteriores
+        candidates = {}
+        for fact_id, fact_keys in keys.items():
+            found = set()
+            for key in fact_keys:
+                found.update(other for other in owners[key] if other < fact_id)
+            if found:
+                candidates[fact_id] = found
+        needed = list({other for found in candidates.values() for other in found} - shingles.keys())
+        for start in range(0, len(needed), self.keys_per_query):
+            batch = needed[start:start + self.keys_per_query]
+            for fact_id, text in Fact.objects.filter(id__in=batch).values_list('id', 'fact'):
+                shingles[fact_id] = minhash.shingles(text)
+
+        for fact_id, found in candidates.items():
+            for other in found:
+                if other in shingles and minhash.jaccard(shingles[fact_id], shingles[other]) >= threshold:
+                    self.union(fact_id, other)
+        return len(missing)
+
+    def find(self, fact_id):
+        parent = self.parent
+        root = fact_id
+        while parent.setdefault(root, root) != root:
+            root = parent[root]
+        # Comprimimos el camino para que las siguientes búsquedas sean directas
+        while parent[fact_id] != root:
+            parent[fact_id], fact_id = root, parent[fact_id]
+        return root
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            # El hecho más antiguo queda como representante del grupo
+            self.parent[max(root_a, root_b)] = min(root_a, root_b)
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.urls import reverse
+
+from .autocomplete import autocomplete_index
+from .views import autocomplete
+
+
+class AutocompleteMiddleware:
+    """Atiende el autocompletado sin pasar por el resto de los middleware.
+
+    Debe ubicarse antes de SessionMiddleware: así cada pulsación de tecla
+    evita leer la sesión, validar el token CSRF y cargar los mensajes. Con
+    FACTS_AUTOCOMPLETE_PRELOAD, la primera petición de cada proceso inicia
+    la construcción del índice en segundo plano.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.path = None
+        self.preload = getattr(settings, 'FACTS_AUTOCOMPLETE_PRELOAD', False)
+
+    def __call__(self, request):
+        if self.preload:
+            autocomplete_index.preload()
+        if self.path is None:
+            self.path = reverse('autocomplete')
+        if request.path_info == self.path:
+            return autocomplete(request)
+        return self.get_response(request)
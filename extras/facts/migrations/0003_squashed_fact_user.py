@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_default_user(apps, schema_editor):
+    # Los hechos iniciales quedan asignados al usuario 1; en una base vacía
+    # (por ejemplo, la de pruebas) se crea un usuario inactivo para ellos
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Fact = apps.get_model('facts', 'Fact')
+    if Fact.objects.exists() and not User.objects.filter(pk=1).exists():
+        User.objects.create(pk=1, username='chucknorris', password='!', is_active=False)
+
+
+class Migration(migrations.Migration):
+    # Reemplaza a 0003_fact_user en las bases que aún no la aplicaron, para
+    # crear el usuario 1 antes de asignarle los hechos iniciales. En las que
+    # ya la aplicaron se considera aplicada y no se ejecuta
+
+    replaces = [
+        ('facts', '0003_fact_user'),
+    ]
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('facts', '0002_initial_data'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_default_user, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='fact',
+            name='user',
+            field=models.ForeignKey(default=1, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.3 on 2026-10-18 11:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('facts', '0003_fact_user'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fact',
+            index=models.Index(fields=['created_at', 'id'], name='fact_created_at_id_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.3 on 2026-10-18 11:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('facts', '0004_fact_created_at_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fact',
+            index=models.Index(fields=['updated_at'], name='fact_updated_at_idx'),
+        ),
+    ]
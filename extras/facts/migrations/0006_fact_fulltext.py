@@ -0,0 +1,51 @@
+from django.db import migrations
+
+# Índice de texto completo sobre Fact.fact. En MySQL se usa un índice
+# FULLTEXT (la intercalación *_ai_ci ignora tildes y mayúsculas); en SQLite
+# una tabla virtual FTS5 sincronizada con triggers. Ambos se mantienen
+# actualizados por el motor en cada INSERT, UPDATE y DELETE.
+SQLITE_FORWARD = [
+    """CREATE VIRTUAL TABLE facts_fact_fts USING fts5(
+        fact, content='facts_fact', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2')""",
+    """CREATE TRIGGER facts_fact_fts_insert AFTER INSERT ON facts_fact BEGIN
+        INSERT INTO facts_fact_fts(rowid, fact) VALUES (new.id, new.fact);
+    END""",
+    """CREATE TRIGGER facts_fact_fts_delete AFTER DELETE ON facts_fact BEGIN
+        INSERT INTO facts_fact_fts(facts_fact_fts, rowid, fact) VALUES ('delete', old.id, old.fact);
+    END""",
+    """CREATE TRIGGER facts_fact_fts_update AFTER UPDATE OF fact ON facts_fact BEGIN
+        INSERT INTO facts_fact_fts(facts_fact_fts, rowid, fact) VALUES ('delete', old.id, old.fact);
+        INSERT INTO facts_fact_fts(rowid, fact) VALUES (new.id, new.fact);
+    END""",
+    "INSERT INTO facts_fact_fts(facts_fact_fts) VALUES ('rebuild')",
+]
+SQLITE_BACKWARD = [
+    'DROP TRIGGER IF EXISTS facts_fact_fts_update',
+    'DROP TRIGGER IF EXISTS facts_fact_fts_delete',
+    'DROP TRIGGER IF EXISTS facts_fact_fts_insert',
+    'DROP TABLE IF EXISTS facts_fact_fts',
+]
+MYSQL_FORWARD = ['ALTER TABLE facts_fact ADD FULLTEXT INDEX fact_fact_fulltext (fact)']
+MYSQL_BACKWARD = ['ALTER TABLE facts_fact DROP INDEX fact_fact_fulltext']
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('facts', '0005_fact_updated_at_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'sqlite': SQLITE_FORWARD, 'mysql': MYSQL_FORWARD}),
+            run({'sqlite': SQLITE_BACKWARD, 'mysql': MYSQL_BACKWARD}),
+        ),
+    ]
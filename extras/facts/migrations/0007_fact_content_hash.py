@@ -0,0 +1,81 @@
+# Generated by Django 4.2.3 on 2026-10-18 11:46
+
+import hashlib
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+WORD_RE = re.compile(r'\w+')
+# Cantidad de hechos procesados por lote al calcular los hashes
+BATCH_SIZE = 2000
+
+# En SQLite agregar una columna única recrea la tabla facts_fact y se pierden
+# los triggers que mantienen el índice FTS5 creado en 0006
+SQLITE_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS facts_fact_fts_insert AFTER INSERT ON facts_fact BEGIN
+        INSERT INTO facts_fact_fts(rowid, fact) VALUES (new.id, new.fact);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS facts_fact_fts_delete AFTER DELETE ON facts_fact BEGIN
+        INSERT INTO facts_fact_fts(facts_fact_fts, rowid, fact) VALUES ('delete', old.id, old.fact);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS facts_fact_fts_update AFTER UPDATE OF fact ON facts_fact BEGIN
+        INSERT INTO facts_fact_fts(facts_fact_fts, rowid, fact) VALUES ('delete', old.id, old.fact);
+        INSERT INTO facts_fact_fts(rowid, fact) VALUES (new.id, new.fact);
+    END""",
+    "INSERT INTO facts_fact_fts(facts_fact_fts) VALUES ('rebuild')",
+]
+
+
+def fact_hash(text):
+    # Copia de facts.models.fact_hash, para que la migración no dependa del
+    # código actual de la aplicación
+    normalized = ' '.join(WORD_RE.findall(unicodedata.normalize('NFKC', text).casefold()))
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+def restore_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for sql in SQLITE_TRIGGERS:
+            schema_editor.execute(sql)
+
+
+def backfill_hashes(apps, schema_editor):
+    Fact = apps.get_model('facts', 'Fact')
+    last_id = 0
+    while True:
+        batch = list(Fact.objects.filter(id__gt=last_id).order_by('id').only('id', 'fact')[:BATCH_SIZE])
+        if not batch:
+            break
+        last_id = batch[-1].id
+        # Solo el primer hecho de cada texto recibe el hash; los duplicados
+        # existentes quedan en NULL para revisarlos manualmente
+        hashes = {}
+        for fact in batch:
+            hashes.setdefault(fact_hash(fact.fact), fact)
+        taken = set(Fact.objects.filter(content_hash__in=list(hashes)).values_list('content_hash', flat=True))
+        pending = []
+        for content_hash, fact in hashes.items():
+            if content_hash not in taken:
+                fact.content_hash = content_hash
+                pending.append(fact)
+        Fact.objects.bulk_update(pending, ['content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('facts', '0006_fact_fulltext'),
+    ]
+
+    operations = [
+        # Al revertir, quitar la columna también recrea la tabla
+        migrations.RunPython(migrations.RunPython.noop, restore_triggers),
+        migrations.AddField(
+            model_name='fact',
+            name='content_hash',
+            field=models.CharField(editable=False, max_length=64, null=True, unique=True),
+        ),
+        migrations.RunPython(restore_triggers, migrations.RunPython.noop),
+        migrations.RunPython(backfill_hashes, migrations.RunPython.noop),
+    ]
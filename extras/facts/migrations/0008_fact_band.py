@@ -0,0 +1,22 @@
+# Generated by Django 4.2.3 on 2026-10-18 11:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('facts', '0007_fact_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FactBand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.BigIntegerField(db_index=True)),
+                ('fact', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='bands', to='facts.fact')),
+            ],
+        ),
+    ]
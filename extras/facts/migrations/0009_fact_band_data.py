@@ -0,0 +1,37 @@
+from django.db import migrations
+
+
+def index_existing_facts(apps, schema_editor):
+    # Calcula las bandas MinHash de los hechos creados antes de 0008, por
+    # bloques para acotar la memoria
+    from facts.minhash import band_keys, shingles, signature
+
+    Fact = apps.get_model('facts', 'Fact')
+    FactBand = apps.get_model('facts', 'FactBand')
+    last_id = 0
+    while True:
+        chunk = list(Fact.objects.filter(id__gt=last_id, bands__isnull=True).order_by('id')
+                     .values_list('id', 'fact')[:500])
+        if not chunk:
+            return
+        last_id = chunk[-1][0]
+        FactBand.objects.bulk_create(
+            [FactBand(fact_id=fact_id, key=key)
+             for fact_id, text in chunk
+             for key in band_keys(signature(shingles(text)))],
+            batch_size=1000)
+
+
+def remove_bands(apps, schema_editor):
+    apps.get_model('facts', 'FactBand').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('facts', '0008_fact_band'),
+    ]
+
+    operations = [
+        migrations.RunPython(index_existing_facts, remove_bands),
+    ]
@@ -0,0 +1,98 @@
+import struct
+import sys
+from array import array
+from hashlib import blake2b, shake_128
+
+from django.conf import settings
+from django.db.models import Count
+
+from .models import Fact, FactBand
+from .search import tokenize
+
+# Largo de los fragmentos de caracteres que se comparan entre hechos
+SHINGLE_SIZE = 4
+# La firma tiene 64 valores divididos en 16 bandas de 4. Dos hechos con
+# similitud 0.7 comparten al menos una banda con probabilidad 0.99, y con
+# similitud 0.3 solo con probabilidad 0.12
+NUM_HASHES = 64
+BANDS = 16
+ROWS = NUM_HASHES // BANDS
+# Candidatos revisados como máximo al buscar casi duplicados
+MAX_CANDIDATES = 200
+
+
+def shingles(text):
+    # Fragmentos de 4 caracteres del texto normalizado:
+    # "Chuck Norris" -> "chuc", "huck", "uck ", "ck n", ...
+    text = ' '.join(tokenize(text))
+    if len(text) <= SHINGLE_SIZE:
+        return {text} if text else set()
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    common = len(a & b)
+    return common / (len(a) + len(b) - common)
+
+
+def signature(shingle_set):
+    # Para cada una de las 64 funciones de hash, el menor valor entre los
+    # fragmentos. La probabilidad de que dos firmas coincidan en una posición
+    # es la similitud de Jaccard de los textos. Las 64 funciones se obtienen
+    # de una sola salida extensible de SHAKE-128 por fragmento
+    rows = []
+    for shingle in shingle_set:
+        row = array('I', shake_128(shingle.encode()).digest(NUM_HASHES * 4))
+        if sys.byteorder == 'big':
+            row.byteswap()
+        rows.append(row)
+    return list(map(min, zip(*rows)))
+
+
+def band_keys(sig):
+    # Una clave de 64 bits por banda, que incluye el número de la banda
+    keys = []
+    for band in range(BANDS if sig else 0):
+        data = struct.pack(f'>H{ROWS}I', band, *sig[band * ROWS:(band + 1) * ROWS])
+        keys.append(int.from_bytes(blake2b(data, digest_size=8).digest(), 'big', signed=True))
+    return keys
+
+
+def index_facts(facts):
+    # Guarda las bandas de los hechos recibidos como pares (id, texto)
+    bands = [FactBand(fact_id=fact_id, key=key)
+             for fact_id, text in facts
+             for key in band_keys(signature(shingles(text)))]
+    FactBand.objects.bulk_create(bands, batch_size=1000)
+
+
+def remove_facts(ids):
+    FactBand.objects.filter(fact_id__in=ids).delete()
+
+
+def find_near_duplicates(text, threshold=None, exclude=None, limit=10):
+    # Devuelve [(id, similitud)] de los hechos casi idénticos al texto. Solo
+    # se comparan los hechos que comparten alguna banda, consultando el
+    # índice por clave en lugar de recorrer la tabla
+    if threshold is None:
+        threshold = getattr(settings, 'FACTS_NEAR_DUPLICATE_THRESHOLD', 0.7)
+    shingle_set = shingles(text)
+    keys = band_keys(signature(shingle_set))
+    if not keys:
+        return []
+    # Los candidatos que comparten más bandas son los más parecidos
+    candidates = (FactBand.objects.filter(key__in=keys)
+                  .values('fact_id').annotate(bands=Count('id')).order_by('-bands'))
+    if exclude is not None:
+        candidates = candidates.exclude(fact_id=exclude)
+    ids = [row['fact_id'] for row in candidates[:MAX_CANDIDATES]]
+    # Calculamos la similitud exacta de los candidatos
+    matches = []
+    for fact_id, fact in Fact.objects.filter(id__in=ids).values_list('id', 'fact'):
+        score = jaccard(shingle_set, shingles(fact))
+        if score >= threshold:
+            matches.append((fact_id, round(score, 4)))
+    matches.sort(key=lambda match: match[1], reverse=True)
+    return matches[:limit]
@@ -1,12 +1,56 @@
+import hashlib
+import re
+import unicodedata
+
 from django.contrib.auth.models import User
 from django.db import models
 
+# Palabras del texto, ignorando espacios y signos de puntuación
+WORD_RE = re.compile(r'\w+')
+# Mensaje de los hechos rechazados por tener el mismo texto que otro
+DUPLICATE_FACT_MESSAGE = 'Ya existe un hecho con el mismo texto.'
+
+
+def normalize_fact(text):
+    # Texto sin diferencias de mayúsculas, espacios ni puntuación:
+    # "  Chuck Norris puede dividir entre CERO!! " -> "chuck norris puede dividir entre cero"
+    return ' '.join(WORD_RE.findall(unicodedata.normalize('NFKC', text).casefold()))
+
+
+def fact_hash(text):
+    return hashlib.sha256(normalize_fact(text).encode()).hexdigest()
+
 
 class Fact(models.Model):
     fact = models.CharField(max_length=255)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE, default=1)
+    # Hash del texto normalizado; el índice único impide hechos duplicados
+    content_hash = models.CharField(max_length=64, unique=True, null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Índice para la paginación por cursor de la API
+            models.Index(fields=['created_at', 'id'], name='fact_created_at_id_idx'),
+            # Índice para los validadores de caché y la exportación incremental
+            models.Index(fields=['updated_at'], name='fact_updated_at_idx'),
+        ]
 
     def __str__(self):
         return self.fact
+
+    def save(self, *args, **kwargs):
+        self.content_hash = fact_hash(self.fact)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'fact' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'content_hash'}
+        super().save(*args, **kwargs)
+
+
+class FactBand(models.Model):
+    # Clave de una banda LSH de la firma MinHash de un hecho. No se usa una
+    # llave foránea en la base de datos porque los hechos se eliminan por
+    # bloques sin cargar sus relaciones; las bandas se quitan con señales
+    fact = models.ForeignKey(Fact, on_delete=models.DO_NOTHING, db_constraint=False, related_name='bands')
+    key = models.BigIntegerField(db_index=True)
@@ -0,0 +1,133 @@
+import hashlib
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import Fact
+
+# Valor guardado para los identificadores que no existen
+MISSING = '__missing__'
+# Campos del usuario que se guardan junto al hecho, los que se muestran. La
+# contraseña y los permisos no llegan a la caché, que puede estar en disco
+CACHED_USER_FIELDS = ('username', 'first_name', 'last_name', 'email')
+
+
+def schema_version(model, related=()):
+    # Las llaves incluyen un resumen de los campos guardados, por lo que al
+    # agregar o quitar campos las instancias guardadas con la estructura
+    # anterior dejan de leerse
+    fields = ','.join([field.attname for field in model._meta.concrete_fields] + list(related))
+    return int(hashlib.md5(fields.encode()).hexdigest()[:8], 16)
+
+
+class FactCache:
+    """Caché de lectura de hechos por identificador.
+
+    Las instancias se guardan en el alias FACTS_CACHE_ALIAS de CACHES, que
+    define el tiempo de expiración y la cantidad máxima de entradas (el
+    backend en memoria descarta las menos usadas). Los identificadores
+    inexistentes también se guardan, por menos tiempo, para que las
+    peticiones repetidas a un hecho eliminado no lleguen a la base de datos.
+    Los receptores de señales eliminan las entradas al guardar o eliminar.
+    """
+
+    key_prefix = 'fact'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._stats = {'hits': 0, 'negative_hits': 0, 'misses': 0}
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'FACTS_CACHE_ALIAS', 'default')]
+
+    @property
+    def negative_ttl(self):
+        return getattr(settings, 'FACTS_CACHE_NEGATIVE_TTL', 30)
+
+    @property
+    def version(self):
+        if self._version is None:
+            self._version = schema_version(Fact, CACHED_USER_FIELDS)
+        return self._version
+
+    def key(self, fact_id):
+        return f'{self.key_prefix}:{fact_id}'
+
+    def get_queryset(self):
+        # El usuario se guarda junto al hecho porque la API lo incluye, pero
+        # solo con los campos que se muestran
+        fields = [field.name for field in Fact._meta.concrete_fields]
+        return Fact.objects.select_related('user').only(
+            *fields, *(f'user__{name}' for name in CACHED_USER_FIELDS))
+
+    def _count(self, hits=0, misses=0, negative_hits=0):
+        with self._lock:
+            self._stats['hits'] += hits
+            self._stats['misses'] += misses
+            self._stats['negative_hits'] += negative_hits
+
+    def get(self, fact_id):
+        # Devuelve el hecho o None si no existe, consultando la base de
+        # datos solo cuando no está en la caché
+        return self.get_many([fact_id]).get(fact_id)
+
+    def get_many(self, ids):
+        # Devuelve {id: hecho} con los que existen, leyendo de la caché todos
+        # los identificadores a la vez y de la base de datos solo los que faltan
+        ids = list(dict.fromkeys(ids))
+        if not ids:
+            return {}
+        cache, version = self.cache, self.version
+        cached = cache.get_many([self.key(i) for i in ids], version=version)
+        found, missing = {}, []
+        negative_hits = 0
+        for fact_id in ids:
+            value = cached.get(self.key(fact_id))
+            if value is None:
+                missing.append(fact_id)
+            elif value == MISSING:
+                negative_hits += 1
+            else:
+                found[fact_id] = value
+        self._count(hits=len(found), misses=len(missing), negative_hits=negative_hits)
+        if missing:
+            loaded = self.get_queryset().in_bulk(missing)
+            # Los backends en niveles guardan lo leído de la base de datos sin
+            # invalidar las entradas de los demás procesos
+            fill = getattr(cache, 'fill_many', cache.set_many)
+            if loaded:
+                fill({self.key(i): fact for i, fact in loaded.items()}, version=version)
+            absent = {self.key(i): MISSING for i in missing if i not in loaded}
+            if absent and self.negative_ttl > 0:
+                fill(absent, timeout=self.negative_ttl, version=version)
+            found.update(loaded)
+        return found
+
+    def invalidate(self, *ids):
+        if ids:
+            self.cache.delete_many([self.key(i) for i in ids], version=self.version)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['negative_hits'] + stats['misses']
+        stats['hit_ratio'] = round((stats['hits'] + stats['negative_hits']) / lookups, 4) if lookups else None
+        # Los backends en niveles informan los aciertos de cada nivel
+        backend_stats = getattr(self.cache, 'stats', None)
+        if backend_stats is not None:
+            stats['tiers'] = backend_stats()
+        return stats
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = {'hits': 0, 'negative_hits': 0, 'misses': 0}
+        reset = getattr(self.cache, 'reset_stats', None)
+        if reset is not None:
+            reset()
+
+
+# Caché compartida por todas las peticiones del proceso
+fact_cache = FactCache()
@@ -0,0 +1,136 @@
+import math
+import re
+import unicodedata
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+
+from .models import Fact
+
+# Palabras: secuencias de letras o dígitos, después de normalizar el texto
+TOKEN_RE = re.compile(r'\w+')
+# Marcas diacríticas combinables (tildes, diéresis, virgulilla)
+COMBINING_RE = re.compile(r'[\u0300-\u036f]')
+# Parámetros de BM25 para los motores sin índice de texto completo
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Largo mínimo de las palabras del índice FULLTEXT de MySQL
+# (innodb_ft_min_token_size)
+MYSQL_MIN_TOKEN_SIZE = 3
+
+
+def fold(text):
+    # Quitamos tildes y diacríticos y pasamos a minúsculas:
+    # "Lágrimas" -> "lagrimas"
+    return COMBINING_RE.sub('', unicodedata.normalize('NFKD', text)).casefold()
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(fold(text))
+
+
+def search_ids(query, limit=20):
+    # Devuelve los identificadores de los hechos que contienen todas las
+    # palabras de la búsqueda, ordenados por relevancia
+    tokens = list(dict.fromkeys(tokenize(query)))
+    if not tokens:
+        return []
+    return find_candidates([[token] for token in tokens], limit)
+
+
+def find_candidates(groups, limit=None):
+    # Busca en el índice de texto completo los hechos que contienen, para
+    # cada grupo, al menos una de sus palabras, ordenados por relevancia. El
+    # motor calcula el puntaje de todas las coincidencias antes de aplicar el
+    # límite, por lo que un hecho antiguo que coincide mejor no se omite
+    if limit is None:
+        limit = getattr(settings, 'FACTS_SEARCH_CANDIDATES', 500)
+    return BACKENDS.get(connection.vendor, candidates_icontains)(groups, limit)
+
+
+def candidates_sqlite(groups, limit):
+    # Tabla FTS5 (ver migración 0006), ordenada con su función bm25(). Cada
+    # palabra va entre comillas para que no se interprete como operador; los
+    # grupos se combinan con AND
+    match = ' AND '.join('(' + ' OR '.join(f'"{word}"' for word in group) + ')'
+                         for group in groups)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT rowid FROM facts_fact_fts WHERE facts_fact_fts MATCH %s '
+            'ORDER BY bm25(facts_fact_fts), rowid DESC LIMIT %s', [match, limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def like_pattern(word):
+    # Las palabras solo tienen letras, dígitos y "_", que en LIKE es un comodín
+    return '%' + word.replace('_', r'\_') + '%'
+
+
+def candidates_mysql(groups, limit):
+    # Índice FULLTEXT en modo booleano: +(a b) exige a o b, y el puntaje de
+    # MATCH ordena los resultados. Las palabras más cortas que
+    # MYSQL_MIN_TOKEN_SIZE no están en el índice: en los grupos con otras
+    # palabras se omiten, y los grupos con solo palabras cortas se buscan
+    # con LIKE, como subcadenas, sin aportar al puntaje. Las palabras de la
+    # lista de palabras vacías de InnoDB (en inglés) tampoco se indexan
+    terms, conditions, params = [], [], []
+    for group in groups:
+        indexed = [word for word in group if len(word) >= MYSQL_MIN_TOKEN_SIZE]
+        if indexed:
+            terms.append('+(' + ' '.join(indexed) + ')')
+        else:
+            conditions.append('(' + ' OR '.join(['fact LIKE %s'] * len(group)) + ')')
+            params.extend(like_pattern(word) for word in group)
+    if not terms:
+        # Sin palabras indexadas no hay puntaje; primero los más recientes
+        sql = f'SELECT id FROM facts_fact WHERE {" AND ".join(conditions)} ORDER BY id DESC LIMIT %s'
+        params.append(limit)
+    else:
+        match = 'MATCH(fact) AGAINST (%s IN BOOLEAN MODE)'
+        conditions.insert(0, match)
+        terms = ' '.join(terms)
+        sql = (f'SELECT id, {match} AS score FROM facts_fact WHERE {" AND ".join(conditions)} '
+               'ORDER BY score DESC, id DESC LIMIT %s')
+        params = [terms, terms] + params + [limit]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def candidates_icontains(groups, limit):
+    # Alternativa para otros motores, sin índice de texto completo: se
+    # ordenan con BM25 todas las coincidencias
+    queryset = Fact.objects.all()
+    for group in groups:
+        condition = Q()
+        for word in group:
+            condition |= Q(fact__icontains=word)
+        queryset = queryset.filter(condition)
+    documents = [(fact_id, tokenize(text)) for fact_id, text in queryset.values_list('id', 'fact')]
+    if not documents:
+        return []
+    # Frecuencia de documentos de cada palabra en toda la tabla
+    words = {word for group in groups for word in group}
+    total = Fact.objects.count()
+    idf = {}
+    for word in words:
+        frequency = Fact.objects.filter(fact__icontains=word).count()
+        idf[word] = math.log(1 + (total - frequency + 0.5) / (frequency + 0.5))
+    average = sum(len(tokens) for _, tokens in documents) / len(documents) or 1
+    scores = {}
+    for fact_id, tokens in documents:
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * len(tokens) / average)
+        score = 0.0
+        for word in words:
+            frequency = tokens.count(word)
+            score += idf[word] * frequency * (BM25_K1 + 1) / (frequency + norm)
+        scores[fact_id] = score
+    # A igual puntaje, primero los más recientes
+    return sorted(scores, key=lambda fact_id: (-scores[fact_id], -fact_id))[:limit]
+
+
+BACKENDS = {
+    'sqlite': candidates_sqlite,
+    'mysql': candidates_mysql,
+}
@@ -0,0 +1,130 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import Signal, receiver
+
+from . import minhash
+from .autocomplete import autocomplete_index
+from .models import Fact
+from .object_cache import CACHED_USER_FIELDS, fact_cache
+from .random_index import fact_index
+from .trigram import trigram_index
+from .version import bump_facts_version
+
+# Se envía después de crear hechos con bulk_create, que no emite post_save.
+# Argumentos: facts (lista de instancias creadas)
+facts_created = Signal()
+# Se envían después de modificar o eliminar hechos con UPDATE o DELETE por
+# bloques, que no emiten post_save ni post_delete.
+# Argumentos: ids (lista de identificadores afectados) y texts (textos
+# anteriores de los hechos modificados o eliminados); facts_updated incluye
+# además values (diccionario con los nuevos valores)
+facts_updated = Signal()
+facts_deleted = Signal()
+
+
+def invalidate_cached(ids):
+    # Eliminamos las entradas de inmediato y otra vez al confirmar la
+    # transacción, por si otra petición guardó la versión anterior entre medio
+    fact_cache.invalidate(*ids)
+    transaction.on_commit(lambda: fact_cache.invalidate(*ids))
+
+
+@receiver(pre_save, sender=Fact)
+def fact_saving(sender, instance, update_fields=None, **kwargs):
+    # Leemos el texto anterior de los hechos modificados, para quitar sus
+    # palabras de la búsqueda aproximada y del autocompletado
+    instance._previous_fact = None
+    if not instance._state.adding and (update_fields is None or 'fact' in update_fields):
+        instance._previous_fact = Fact.objects.filter(pk=instance.pk).values_list('fact', flat=True).first()
+
+
+@receiver(post_save, sender=Fact)
+def fact_saved(sender, instance, created, **kwargs):
+    bump_facts_version()
+    invalidate_cached([instance.id])
+    # Agregamos los hechos nuevos al índice de selección aleatoria
+    if created:
+        fact_index.add(instance.id)
+    # Si cambió el texto, reemplazamos las palabras del texto anterior por
+    # las del nuevo y recalculamos las bandas MinHash
+    previous = getattr(instance, '_previous_fact', None)
+    if created or (previous is not None and previous != instance.fact):
+        if previous is not None:
+            trigram_index.remove_text(previous)
+            autocomplete_index.remove_text(previous)
+            minhash.remove_facts([instance.id])
+        trigram_index.add_text(instance.fact)
+        autocomplete_index.add_text(instance.fact)
+        minhash.index_facts([(instance.id, instance.fact)])
+
+
+@receiver(post_delete, sender=Fact)
+def fact_deleted(sender, instance, **kwargs):
+    bump_facts_version()
+    invalidate_cached([instance.id])
+    # Quitamos el hecho eliminado del índice de selección aleatoria
+    fact_index.discard(instance.id)
+    trigram_index.remove_text(instance.fact)
+    autocomplete_index.remove_text(instance.fact)
+    minhash.remove_facts([instance.id])
+
+
+@receiver(facts_created, sender=Fact)
+def facts_bulk_created(sender, facts, **kwargs):
+    bump_facts_version()
+    # Quitamos las entradas de identificadores inexistentes que ahora existen
+    invalidate_cached([fact.id for fact in facts if fact.id is not None])
+    for fact in facts:
+        trigram_index.add_text(fact.fact)
+        autocomplete_index.add_text(fact.fact)
+    minhash.index_facts([(fact.id, fact.fact) for fact in facts if fact.id is not None])
+    # Algunos motores (MySQL) no devuelven los identificadores al usar
+    # bulk_create; en ese caso reconstruimos el índice
+    for fact in facts:
+        if fact.id is None:
+            fact_index.invalidate()
+            return
+        fact_index.add(fact.id)
+
+
+@receiver(facts_updated, sender=Fact)
+def facts_bulk_updated(sender, ids, values, texts=(), **kwargs):
+    bump_facts_version()
+    invalidate_cached(ids)
+    if 'fact' in values:
+        for text in texts:
+            trigram_index.remove_text(text)
+            autocomplete_index.remove_text(text)
+        for _ in ids:
+            trigram_index.add_text(values['fact'])
+            autocomplete_index.add_text(values['fact'])
+        minhash.remove_facts(ids)
+        minhash.index_facts([(fact_id, values['fact']) for fact_id in ids])
+
+
+@receiver(facts_deleted, sender=Fact)
+def facts_bulk_deleted(sender, ids, texts=(), **kwargs):
+    bump_facts_version()
+    invalidate_cached(ids)
+    minhash.remove_facts(ids)
+    for fact_id in ids:
+        fact_index.discard(fact_id)
+    for text in texts:
+        trigram_index.remove_text(text)
+        autocomplete_index.remove_text(text)
+
+
+# Campos del usuario que se muestran junto a sus hechos
+FACT_USER_FIELDS = set(CACHED_USER_FIELDS)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    # Los hechos se guardan y se muestran junto a su usuario. Los guardados
+    # parciales que no cambian sus datos visibles, como last_login en cada
+    # inicio de sesión, no invalidan la caché ni los validadores
+    if created or (update_fields is not None and not FACT_USER_FIELDS & set(update_fields)):
+        return
+    bump_facts_version()
+    invalidate_cached(list(Fact.objects.filter(user_id=instance.pk).values_list('id', flat=True)))
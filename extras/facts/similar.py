@@ -0,0 +1,369 @@
+import json
+import math
+import os
+import shutil
+import threading
+import time
+from array import array
+from collections import Counter
+from datetime import datetime, timezone
+
+from chuck_norris.cache.singleflight import get_or_compute
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+
+from .models import Fact, fact_hash
+from .object_cache import fact_cache
+from .search import find_candidates, tokenize
+
+# NumPy y SciPy son opcionales: sin ellos los hechos similares se obtienen
+# con la búsqueda de texto completo
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    np = sparse = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+MANIFEST = 'manifest.json'
+# Archivo que impide construir dos versiones a la vez
+BUILD_LOCK = 'build.lock'
+# Segundos que se vuelven a revisar los hechos modificados, por si la
+# transacción que los guardó se confirmó después de la última revisión
+EDIT_MARGIN = 5
+# Arreglos guardados en cada versión del índice: la matriz TF-IDF por filas
+# (un hecho por fila) y por columnas (una palabra por columna)
+ARRAYS = ('ids', 'idf', 'row_data', 'row_indices', 'row_indptr',
+          'col_data', 'col_indices', 'col_indptr')
+
+
+def get_directory():
+    return getattr(settings, 'FACTS_SIMILAR_DIR', os.path.join(settings.BASE_DIR, 'var', 'similar'))
+
+
+def build_index(directory=None, chunk_size=5000, max_df=None, blocking=True):
+    """Calcula los vectores TF-IDF de todos los hechos y los guarda en disco.
+
+    La nueva versión se escribe en su propio directorio y se publica
+    reemplazando el manifiesto, por lo que los procesos que usan la versión
+    anterior no se ven afectados. Solo se construye una versión a la vez;
+    con blocking=False devuelve None si otro proceso ya la está construyendo.
+    """
+    if np is None:
+        raise RuntimeError('Se requieren NumPy y SciPy para construir el índice.')
+    directory = directory or get_directory()
+    if max_df is None:
+        max_df = getattr(settings, 'FACTS_SIMILAR_MAX_DF', 0.5)
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, BUILD_LOCK), 'a') as lock:
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError:
+                return None
+        return _build_index(directory, chunk_size, max_df)
+
+
+def _build_index(directory, chunk_size, max_df):
+    # Los hechos modificados desde este momento se vectorizan como pendientes
+    started = time.time()
+
+    # Leemos los hechos por bloques y guardamos las frecuencias de cada
+    # palabra en arreglos compactos (formato CSR)
+    vocabulary = {}
+    ids, indices, counts, indptr = array('q'), array('i'), array('f'), array('q', [0])
+    last_id = 0
+    while True:
+        chunk = list(Fact.objects.filter(id__gt=last_id).order_by('id')
+                     .values_list('id', 'fact')[:chunk_size])
+        if not chunk:
+            break
+        last_id = chunk[-1][0]
+        for fact_id, text in chunk:
+            for word, count in Counter(tokenize(text)).items():
+                indices.append(vocabulary.setdefault(word, len(vocabulary)))
+                counts.append(count)
+            indptr.append(len(indices))
+            ids.append(fact_id)
+
+    size, words = len(ids), len(vocabulary)
+    matrix = sparse.csr_matrix(
+        (np.frombuffer(counts, dtype=np.float32) if counts else np.zeros(0, np.float32),
+         np.frombuffer(indices, dtype=np.int32) if indices else np.zeros(0, np.int32),
+         np.frombuffer(indptr, dtype=np.int64)),
+        shape=(size, words))
+
+    # IDF suavizado; las palabras presentes en más de max_df de los hechos
+    # ("chuck", "norris", "de") se descartan porque no distinguen a ninguno
+    df = np.bincount(matrix.indices, minlength=words)
+    idf = (np.log((1 + size) / (1 + df)) + 1).astype(np.float32)
+    idf[df > max_df * size] = 0
+    matrix.data = (1 + np.log(matrix.data)) * idf[matrix.indices]
+    matrix.eliminate_zeros()
+    # Normalizamos cada fila para que el producto punto sea el coseno
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    matrix = sparse.diags((1 / norms).astype(np.float32)) @ matrix
+    matrix = matrix.tocsr().astype(np.float32)
+    # En cada columna ordenamos los hechos de mayor a menor peso, para que
+    # las consultas puedan leer solo los primeros de las palabras comunes
+    columns = matrix.tocsc()
+    owners = np.repeat(np.arange(words), np.diff(columns.indptr))
+    order = np.lexsort((-columns.data, owners))
+    columns.data, columns.indices = columns.data[order], columns.indices[order]
+
+    name = f'build-{int(time.time())}-{os.getpid()}'
+    path = os.path.join(directory, name)
+    os.makedirs(path)
+    arrays = {
+        'ids': np.frombuffer(ids, dtype=np.int64) if ids else np.zeros(0, np.int64),
+        'idf': idf,
+        'row_data': matrix.data, 'row_indices': matrix.indices.astype(np.int32),
+        'row_indptr': matrix.indptr.astype(np.int64),
+        'col_data': columns.data, 'col_indices': columns.indices.astype(np.int32),
+        'col_indptr': columns.indptr.astype(np.int64),
+    }
+    for key in ARRAYS:
+        np.save(os.path.join(path, f'{key}.npy'), arrays[key])
+    with open(os.path.join(path, 'vocabulary.json'), 'w') as file:
+        json.dump(sorted(vocabulary, key=vocabulary.get), file)
+
+    # Publicamos la nueva versión y eliminamos las anteriores, salvo la
+    # inmediatamente anterior que aún puede estar en uso
+    previous = read_manifest(directory)
+    manifest = {'build': name, 'facts': size, 'max_id': last_id, 'started': started,
+                'created': time.time()}
+    temporary = os.path.join(directory, f'{MANIFEST}.{os.getpid()}')
+    with open(temporary, 'w') as file:
+        json.dump(manifest, file)
+    os.replace(temporary, os.path.join(directory, MANIFEST))
+    keep = {name, previous and previous['build']}
+    for entry in os.listdir(directory):
+        if entry.startswith('build-') and entry not in keep:
+            shutil.rmtree(os.path.join(directory, entry), ignore_errors=True)
+    return manifest
+
+
+def read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+class IndexBuild:
+    """Una versión del índice cargada en el proceso, con los vectores de los
+    hechos creados o modificados después de construirla.
+
+    Al publicarse otra versión se reemplaza completa, por lo que cada
+    consulta usa los arreglos, el vocabulario y los pendientes de una misma
+    versión aunque otro hilo cargue la siguiente.
+    """
+
+    def __init__(self, manifest, arrays, vocabulary):
+        self.manifest = manifest
+        self.arrays = arrays
+        self.vocabulary = vocabulary
+        # id -> (columnas, pesos), y por columna: columna -> {id: peso}
+        self.pending = {}
+        self.postings = {}
+        # Último identificador y momento revisados
+        self.max_id = manifest['max_id']
+        self.since = manifest.get('started', manifest['created'])
+        self.rebuilding = False
+
+
+class SimilarityIndex:
+    """Vectores TF-IDF de los hechos, compartidos entre procesos.
+
+    Los arreglos se abren con np.load(mmap_mode='r'), por lo que todos los
+    procesos del servidor comparten las mismas páginas en memoria. Los hechos
+    creados o modificados después de construir el índice se vectorizan en
+    cada proceso con el vocabulario y el IDF del índice. Cuando superan
+    FACTS_SIMILAR_MAX_PENDING, el índice se reconstruye en segundo plano.
+    """
+
+    def __init__(self, directory=None):
+        self._directory = directory
+        self._lock = threading.Lock()
+        self._build = None
+        self._checked_at = None
+
+    @property
+    def directory(self):
+        return self._directory or get_directory()
+
+    @property
+    def available(self):
+        return np is not None
+
+    def _refresh(self):
+        # Revisamos el manifiesto cada cierto tiempo para usar la versión
+        # más reciente publicada por build_index
+        interval = getattr(settings, 'FACTS_SIMILAR_RELOAD_INTERVAL', 30)
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < interval:
+            return
+        with self._lock:
+            self._checked_at = now
+            manifest = read_manifest(self.directory)
+            if manifest is None or (self._build and manifest['build'] == self._build.manifest['build']):
+                return
+            path = os.path.join(self.directory, manifest['build'])
+            try:
+                arrays = {key: np.load(os.path.join(path, f'{key}.npy'), mmap_mode='r')
+                          for key in ARRAYS}
+                with open(os.path.join(path, 'vocabulary.json')) as file:
+                    vocabulary = {word: column for column, word in enumerate(json.load(file))}
+            except (OSError, ValueError):
+                return
+            self._build = IndexBuild(manifest, arrays, vocabulary)
+
+    def _vectorize(self, build, text):
+        # Vector TF-IDF normalizado de un texto, con el vocabulario del índice
+        idf = build.arrays['idf']
+        weights = {}
+        for word, count in Counter(tokenize(text)).items():
+            column = build.vocabulary.get(word)
+            if column is not None and idf[column]:
+                weights[column] = (1 + math.log(count)) * float(idf[column])
+        norm = math.sqrt(sum(w * w for w in weights.values())) or 1
+        return (np.fromiter(weights.keys(), dtype=np.int64, count=len(weights)),
+                np.fromiter((w / norm for w in weights.values()), dtype=np.float32, count=len(weights)))
+
+    def _load_pending(self, build):
+        # Agregamos de forma incremental los hechos nuevos y los modificados
+        # desde la última consulta, como máximo FACTS_SIMILAR_MAX_PENDING. La
+        # consulta y los vectores se calculan sin el candado, que solo se
+        # toma para agregarlos
+        max_pending = getattr(settings, 'FACTS_SIMILAR_MAX_PENDING', 5000)
+        checked = time.time()
+        since = datetime.fromtimestamp(build.since - EDIT_MARGIN, tz=timezone.utc)
+        rows = list(Fact.objects.filter(Q(id__gt=build.max_id) | Q(updated_at__gt=since))
+                    .order_by('id').values_list('id', 'fact')[:max_pending])
+        vectors = [(fact_id, self._vectorize(build, text)) for fact_id, text in rows]
+        with self._lock:
+            for fact_id, (columns, weights) in vectors:
+                # Un hecho modificado reemplaza su vector anterior
+                previous = build.pending.get(fact_id)
+                if previous is not None:
+                    for column in previous[0].tolist():
+                        build.postings[column].pop(fact_id, None)
+                build.pending[fact_id] = (columns, weights)
+                for column, weight in zip(columns.tolist(), weights.tolist()):
+                    build.postings.setdefault(column, {})[fact_id] = weight
+            if rows:
+                build.max_id = max(build.max_id, rows[-1][0])
+            if len(rows) < max_pending:
+                build.since = max(build.since, checked)
+            rebuild = len(build.pending) >= max_pending and not build.rebuilding
+            if rebuild:
+                build.rebuilding = True
+        if rebuild:
+            threading.Thread(target=self._rebuild, daemon=True).start()
+
+    def _rebuild(self):
+        # Reconstruye el índice en segundo plano; si otro proceso ya lo está
+        # haciendo, este usará esa versión al revisar el manifiesto
+        try:
+            if build_index(self._directory, blocking=False) is not None:
+                self._checked_at = None
+        finally:
+            # La conexión de este hilo no se vuelve a usar
+            connection.close()
+
+    def _vector(self, build, fact):
+        # Los hechos creados o modificados después del índice usan su vector
+        # pendiente, y si aún no se cargó, el de su texto actual
+        with self._lock:
+            vector = build.pending.get(fact.id)
+        if vector is not None:
+            return vector
+        ids = build.arrays['ids']
+        row = int(np.searchsorted(ids, fact.id))
+        if row < len(ids) and ids[row] == fact.id:
+            start, end = build.arrays['row_indptr'][row:row + 2]
+            return (np.asarray(build.arrays['row_indices'][start:end], dtype=np.int64),
+                    np.asarray(build.arrays['row_data'][start:end]))
+        return self._vectorize(build, fact.fact)
+
+    def similar_ids(self, fact, limit=10):
+        # Devuelve [(id, similitud)] de los hechos con mayor coseno
+        self._refresh()
+        # Una sola versión para toda la consulta
+        build = self._build
+        if build is None:
+            return None
+        self._load_pending(build)
+        columns, weights = self._vector(build, fact)
+        arrays = build.arrays
+        scores = {}
+        if len(columns):
+            # Recorremos solo las columnas de las palabras del hecho y
+            # acumulamos el producto punto de cada fila que las contiene. De
+            # cada columna se leen solo los hechos con mayor peso, por lo que
+            # el costo no depende de la cantidad de hechos
+            postings = getattr(settings, 'FACTS_SIMILAR_MAX_POSTINGS', 5000)
+            starts = arrays['col_indptr'][columns]
+            ends = np.minimum(arrays['col_indptr'][columns + 1], starts + postings)
+            rows = np.concatenate([arrays['col_indices'][s:e] for s, e in zip(starts, ends)])
+            products = np.concatenate([arrays['col_data'][s:e] * w
+                                       for s, e, w in zip(starts, ends, weights)])
+            if len(rows):
+                touched, positions = np.unique(rows, return_inverse=True)
+                totals = np.bincount(positions, weights=products)
+                # Pedimos algunos extra por si el propio hecho o algunos
+                # eliminados o modificados quedan entre los primeros
+                count = min(limit + 5, len(touched))
+                best = np.argpartition(totals, -count)[-count:]
+                scores = {int(arrays['ids'][touched[i]]): round(float(totals[i]), 4) for i in best}
+            # Los hechos pendientes se comparan recorriendo solo las columnas
+            # de las palabras del hecho; los modificados reemplazan el
+            # puntaje calculado con su vector anterior
+            pending = Counter()
+            with self._lock:
+                for fact_id in [fact_id for fact_id in scores if fact_id in build.pending]:
+                    del scores[fact_id]
+                for column, weight in zip(columns.tolist(), weights.tolist()):
+                    for fact_id, other in build.postings.get(column, {}).items():
+                        pending[fact_id] += weight * other
+            for fact_id, score in pending.items():
+                if score > 0:
+                    scores[fact_id] = round(score, 4)
+        scores.pop(fact.id, None)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit + 5]
+
+
+# Índice compartido por todas las peticiones del proceso
+similar_index = SimilarityIndex()
+
+
+def similar_ids(fact, limit=5):
+    # Devuelve [(id, similitud)]; la similitud es None sin el índice
+    matches = similar_index.similar_ids(fact, limit) if similar_index.available else None
+    if matches is None:
+        # Sin NumPy o sin índice construido, buscamos los hechos que comparten
+        # alguna palabra, ordenados por relevancia
+        tokens = list(dict.fromkeys(tokenize(fact.fact)))
+        ids = find_candidates([tokens], limit + 1) if tokens else []
+        ids = [fact_id for fact_id in ids if fact_id != fact.id]
+        matches = [(fact_id, None) for fact_id in ids[:limit]]
+    return matches
+
+
+def similar_facts(fact, limit=5):
+    """Devuelve [(hecho, similitud)] de los hechos más parecidos a fact."""
+    # Los resultados se guardan por hecho y texto; si expiran mientras
+    # varias peticiones muestran el mismo hecho, se calculan una sola vez
+    key = f'facts:similar:{fact.id}:{fact_hash(fact.fact)[:16]}:{limit}'
+    timeout = getattr(settings, 'FACTS_QUERY_CACHE_TTL', 60)
+    matches = get_or_compute(key, lambda: similar_ids(fact, limit), timeout)
+    # Descartamos los hechos eliminados después de construir el índice
+    facts = fact_cache.get_many([fact_id for fact_id, _ in matches])
+    return [(facts[fact_id], score) for fact_id, score in matches if fact_id in facts][:limit]
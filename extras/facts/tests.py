@@ -1,3 +1,442 @@
-from django.test import TestCase
+import fcntl
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+from chuck_norris.cache.singleflight import get_cache, get_or_compute, group
+from chuck_norris.db.pool import ConnectionPool, PoolTimeout
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import similar
+from .autocomplete import autocomplete_index
+from .forms import FactForm
+from .minhash import find_near_duplicates
+from .models import DUPLICATE_FACT_MESSAGE, Fact
+from .object_cache import fact_cache
+from .random_index import FactIdIndex, fact_index
+from .search import candidates_icontains, search_ids
+from .signals import facts_updated
+from .trigram import trigram_index
+
+
+@override_settings(SINGLE_FLIGHT_ALIAS='default')
+class SingleFlightTests(TransactionTestCase):
+    threads = 8
+
+    def setUp(self):
+        get_cache().clear()
+        group.reset_stats()
+        user = User.objects.create_user('chuck', password='roundhouse')
+        Fact.objects.create(user=user, fact='Chuck Norris contó hasta el infinito. Dos veces.')
+        self.queries = 0
+        self.lock = threading.Lock()
+
+    def count_query(self, execute, sql, params, many, context):
+        with self.lock:
+            self.queries += 1
+        return execute(sql, params, many, context)
+
+    def compute(self):
+        # Consulta lenta: los demás hilos llegan mientras se ejecuta
+        time.sleep(0.2)
+        return Fact.objects.count()
+
+    def run_concurrently(self, key, timeout=60):
+        # Todos los hilos piden la misma llave al mismo tiempo y se cuentan
+        # las consultas ejecutadas en sus conexiones
+        barrier = threading.Barrier(self.threads)
+        results = []
+
+        def worker():
+            try:
+                with connection.execute_wrapper(self.count_query):
+                    barrier.wait()
+                    results.append(get_or_compute(key, self.compute, timeout))
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return results
+
+    def test_one_query_per_key(self):
+        self.assertEqual(self.run_concurrently('facts:count'), [1] * self.threads)
+        self.assertEqual(self.queries, 1)
+        # Mientras no expire, no se vuelve a consultar
+        self.run_concurrently('facts:count')
+        self.assertEqual(self.queries, 1)
+        # Cada llave se calcula por separado
+        self.run_concurrently('facts:other')
+        self.assertEqual(self.queries, 2)
+
+    def test_one_query_per_expiry(self):
+        self.run_concurrently('facts:count', timeout=0.5)
+        time.sleep(0.6)
+        # Al expirar se consulta una vez más; los hilos que llegan mientras
+        # tanto reciben el valor anterior
+        self.assertEqual(self.run_concurrently('facts:count', timeout=0.5), [1] * self.threads)
+        self.assertEqual(self.queries, 2)
+        self.assertEqual(group.stats()['stale'], self.threads - 1)
+
+    def test_lock_between_processes(self):
+        # Si otro proceso tiene el candado y existe un valor anterior, se
+        # entrega ese valor sin consultar
+        cache = get_cache()
+        cache.set('facts:count', (5, time.time() - 1))
+        cache.add('facts:count:lock', 'otro', timeout=10)
+        self.assertEqual(self.run_concurrently('facts:count'), [5] * self.threads)
+        self.assertEqual(self.queries, 0)
+
+
+class RandomIndexTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('chuck', password='roundhouse')
+        self.facts = [Fact.objects.create(user=user, fact=f'Chuck Norris ganó la pelea {i}.') for i in range(8)]
+        fact_index.load()
+        # El índice es del proceso y no se deshace con la transacción
+        self.addCleanup(fact_index.invalidate)
+
+    def sampled(self, index=fact_index, draws=200):
+        return {index.random_fact().id for _ in range(draws)}
+
+    def test_deleted_facts_are_not_sampled(self):
+        deleted = self.facts[:4]
+        for fact in deleted:
+            fact.delete()
+        # Al superar un cuarto de eliminados se compacta el arreglo
+        self.assertEqual(len(fact_index._ids), Fact.objects.count())
+        self.assertFalse(self.sampled() & {fact.id for fact in deleted})
+
+    def test_created_facts_are_sampled(self):
+        fact = Fact.objects.create(user=self.facts[0].user, fact='Chuck Norris ganó la última pelea.')
+        self.assertEqual(len(fact_index), Fact.objects.count())
+        self.assertIn(fact.id, self.sampled(draws=500))
+
+    def test_fact_deleted_by_other_process(self):
+        # Otro proceso elimina los hechos sin avisar a este índice
+        index = FactIdIndex(ttl=0)
+        index.load()
+        kept = self.facts[0]
+        Fact.objects.exclude(id=kept.id).delete()
+        self.assertEqual(self.sampled(index, draws=20), {kept.id})
+
+
+class SearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('chuck', password='roundhouse')
+        # El hecho más antiguo es el que mejor coincide
+        cls.best = Fact.objects.create(user=user, fact='Patada giratoria, patada doble.')
+        cls.others = [Fact.objects.create(
+            user=user, fact=f'Chuck Norris dio una patada a la pared número {number} y la pared pidió perdón.')
+            for number in range(30)]
+
+    def test_best_match_first(self):
+        ids = search_ids('patada', limit=5)
+        self.assertEqual(len(ids), 5)
+        self.assertEqual(ids[0], self.best.id)
+        # También en los motores sin índice de texto completo
+        self.assertEqual(candidates_icontains([['patada']], 5)[0], self.best.id)
+
+    def test_accents_and_case(self):
+        self.assertEqual(search_ids('PATÁDA GIRATÓRIA'), [self.best.id])
+        self.assertTrue(search_ids('lagrimas'))
+
+    def test_all_words_required(self):
+        self.assertEqual(search_ids('patada perdón', limit=50), [fact.id for fact in reversed(self.others)])
+        self.assertEqual(search_ids('patada inexistente'), [])
+        self.assertEqual(search_ids('¿?'), [])
+
+
+class TrigramIndexTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('chuck', password='roundhouse')
+        self.fact = Fact.objects.create(user=user, fact='Chuck Norris derrotó al kraken.')
+        trigram_index.load()
+
+    def tearDown(self):
+        trigram_index.invalidate()
+
+    def words(self, word):
+        return [match for match, _ in trigram_index.similar_words(word)]
+
+    def test_load_keeps_lock(self):
+        lock = trigram_index._lock
+        trigram_index.load()
+        self.assertIs(trigram_index._lock, lock)
+
+    def test_edit_replaces_words(self):
+        self.assertIn('kraken', self.words('krakn'))
+        self.fact.fact = 'Chuck Norris derrotó al leviatán.'
+        self.fact.save()
+        self.assertNotIn('kraken', self.words('krakn'))
+        self.assertIn('leviatan', self.words('leviatan'))
+
+    def test_bulk_edit_replaces_words(self):
+        # Como la edición masiva de la API: UPDATE y luego la señal con los
+        # textos anteriores
+        Fact.objects.filter(id=self.fact.id).update(fact='Chuck Norris derrotó a la hidra.')
+        facts_updated.send(sender=Fact, ids=[self.fact.id], values={'fact': 'Chuck Norris derrotó a la hidra.'},
+                           texts=['Chuck Norris derrotó al kraken.'])
+        self.assertNotIn('kraken', self.words('krakn'))
+        self.assertIn('hidra', self.words('hidra'))
+
+
+@override_settings(FACTS_AUTOCOMPLETE_PRELOAD=False)
+class AutocompleteTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('chuck', password='roundhouse')
+        self.fact = Fact.objects.create(user=user, fact='Chuck Norris ganó el torneo de karate.')
+        Fact.objects.create(user=user, fact='Chuck Norris ganó otra vez.')
+        autocomplete_index.load()
+
+    def tearDown(self):
+        autocomplete_index.invalidate()
+
+    def test_most_frequent_first(self):
+        self.assertEqual(autocomplete_index.complete('ga', limit=1), ['ganó'])
+        self.assertEqual(autocomplete_index.complete('Chuck N'), ['chuck norris'])
+
+    def test_edit_replaces_words(self):
+        self.assertEqual(autocomplete_index.complete('kar'), ['karate'])
+        self.fact.fact = 'Chuck Norris ganó el torneo de kung fu.'
+        self.fact.save()
+        self.assertEqual(autocomplete_index.complete('kar'), [])
+        self.assertEqual(autocomplete_index.complete('kung'), ['kung', 'kung fu'])
+
+    def test_view_skips_session(self):
+        with self.assertNumQueries(0):
+            response = self.client.get('/autocomplete/', {'q': 'torn'})
+        self.assertEqual(response.json(), {'suggestions': ['torneo', 'torneo de']})
+        self.assertNotIn('Set-Cookie', response)
+
+
+@override_settings(FACTS_AUTOCOMPLETE_PRELOAD=False)
+class CreateFactTests(TestCase):
+
+    def test_duplicate_saved_concurrently(self):
+        # Otra petición guarda el mismo texto entre la validación y el INSERT
+        user = User.objects.create_user('chuck', password='roundhouse')
+        Fact.objects.create(user=user, fact='Chuck Norris llegó antes que el rayo.')
+        self.client.force_login(user)
+        with mock.patch.object(FactForm, 'clean_fact', lambda form: form.cleaned_data['fact']):
+            response = self.client.post('/create/', {'fact': 'Chuck Norris llegó antes que el rayo', 'confirm': '1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, DUPLICATE_FACT_MESSAGE)
+
+
+class UserSavedTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('chuck', password='roundhouse')
+        Fact.objects.create(user=self.user, fact='Chuck Norris inició sesión antes de registrarse.')
+
+    def fact_queries(self, **kwargs):
+        with CaptureQueriesContext(connection) as context:
+            self.user.save(**kwargs)
+        return [query for query in context.captured_queries if 'facts_fact' in query['sql']]
+
+    def test_login_keeps_cache(self):
+        self.user.last_login = timezone.now()
+        self.assertEqual(self.fact_queries(update_fields=['last_login']), [])
+
+    def test_visible_fields_invalidate(self):
+        self.user.username = 'carlos'
+        self.assertEqual(len(self.fact_queries(update_fields=['username'])), 1)
+        self.assertEqual(len(self.fact_queries()), 1)
+
+
+class MinHashTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('chuck', password='roundhouse')
+        self.fact = Fact.objects.create(user=user, fact='Chuck Norris puede contar hasta el infinito dos veces.')
+
+    def test_initial_facts_have_bands(self):
+        # La migración 0009 calcula las bandas de los hechos existentes
+        self.assertFalse(Fact.objects.filter(bands__isnull=True).exists())
+
+    def test_near_duplicates(self):
+        matches = find_near_duplicates('Chuck Norris pudo contar hasta el infinito dos veces!')
+        self.assertEqual([fact_id for fact_id, _ in matches], [self.fact.id])
+        self.assertEqual(find_near_duplicates('Bruce Lee toma té por las tardes.'), [])
+
+    def test_save_without_text_change_keeps_bands(self):
+        with CaptureQueriesContext(connection) as context:
+            self.fact.save()
+        self.assertFalse([query for query in context.captured_queries if 'facts_factband' in query['sql']])
+        self.fact.fact = 'Chuck Norris terminó el infinito.'
+        self.fact.save()
+        self.assertEqual(find_near_duplicates('Chuck Norris terminó el infinito!')[0][0], self.fact.id)
+
+
+class FactCacheTests(TestCase):
+
+    def setUp(self):
+        fact_cache.cache.clear()
+        self.user = User.objects.create_superuser('chuck', 'chuck@example.com', 'roundhouse')
+        self.fact = Fact.objects.create(user=self.user, fact='Chuck Norris no duerme, espera.')
+
+    def test_user_without_private_fields(self):
+        fact_cache.get(self.fact.id)
+        cached = fact_cache.cache.get(fact_cache.key(self.fact.id), version=fact_cache.version)
+        self.assertEqual(cached.user.username, 'chuck')
+        self.assertIn('password', cached.user.get_deferred_fields())
+        self.assertIn('is_superuser', cached.user.get_deferred_fields())
+
+    def test_missing_ids_are_cached(self):
+        self.assertIsNone(fact_cache.get(0))
+        fact_cache.get(self.fact.id)
+        with self.assertNumQueries(0):
+            self.assertIsNone(fact_cache.get(0))
+            self.assertEqual(fact_cache.get(self.fact.id).fact, self.fact.fact)
+
+
+class SimilarityIndexTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        user = User.objects.create_user('chuck', password='roundhouse')
+        self.facts = [Fact.objects.create(user=user, fact=text) for text in (
+            'Chuck Norris cuenta ovejas eléctricas.',
+            'Chuck Norris cuenta ovejas dormidas.',
+            'Chuck Norris pinta trenes veloces.',
+            'Chuck Norris pinta trenes rojos.')]
+        similar.build_index(directory, max_df=0.9)
+        self.index = similar.SimilarityIndex(directory)
+
+    def test_edited_fact_uses_new_vector(self):
+        first, _, third, _ = self.facts
+        self.assertEqual(self.index.similar_ids(first, 1)[0][0], self.facts[1].id)
+        first.fact = 'Chuck Norris pinta trenes azules.'
+        first.save()
+        self.assertIn(self.index.similar_ids(first, 1)[0][0], (third.id, self.facts[3].id))
+        # Los demás también lo comparan con su texto nuevo
+        matches = dict(self.index.similar_ids(self.facts[1], 3))
+        self.assertNotIn(first.id, matches)
+
+    @override_settings(FACTS_SIMILAR_MAX_PENDING=2)
+    def test_rebuild_after_max_pending(self):
+        user = self.facts[0].user
+        for text in ('Chuck Norris cuenta trenes.', 'Chuck Norris pinta ovejas.'):
+            Fact.objects.create(user=user, fact=text)
+        with mock.patch('facts.similar.threading.Thread') as thread:
+            self.index.similar_ids(self.facts[0])
+            self.index.similar_ids(self.facts[0])
+        thread.assert_called_once_with(target=self.index._rebuild, daemon=True)
+
+    def test_single_build_at_a_time(self):
+        with open(os.path.join(self.index.directory, similar.BUILD_LOCK), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self.assertIsNone(similar.build_index(self.index.directory, blocking=False))
+
+
+class ConnectionPoolTests(SimpleTestCase):
+
+    def make_pool(self, **kwargs):
+        self.pings = []
+        return ConnectionPool(connect=mock.Mock, ping=self.pings.append, **kwargs)
+
+    def test_reuses_released_connections(self):
+        pool = self.make_pool(size=2)
+        connection = pool.acquire()
+        pool.release(connection)
+        self.assertIs(pool.acquire(), connection)
+        self.assertEqual(self.pings, [connection])
+        self.assertEqual(pool.stats()['created'], 1)
+
+    def test_timeout_when_exhausted(self):
+        pool = self.make_pool(size=1, timeout=0.05)
+        pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+        stats = pool.stats()
+        self.assertEqual((stats['waits'], stats['timeouts'], stats['in_use']), (1, 1, 1))
+
+    def test_waiter_gets_released_connection(self):
+        pool = self.make_pool(size=1, timeout=5)
+        connection = pool.acquire()
+        threading.Timer(0.05, pool.release, [connection]).start()
+        self.assertIs(pool.acquire(), connection)
+
+    def test_closes_idle_and_broken_connections(self):
+        pool = self.make_pool(size=2, idle_timeout=60)
+        connection = pool.acquire()
+        pool.release(connection)
+        with mock.patch('chuck_norris.db.pool.time.monotonic', return_value=time.monotonic() + 120):
+            self.assertIsNot(pool.acquire(), connection)
+        connection.close.assert_called_once_with()
+        self.assertEqual(pool.stats()['evicted'], 1)
+        broken = pool.acquire()
+        pool.release(broken, discard=True)
+        broken.close.assert_called_once_with()
+
+
+TIERED_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'l2': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-l2'},
+}
+# Dos cachés con su propio L1 sobre el mismo L2 simulan dos procesos
+for name in ('tiered', 'other'):
+    TIERED_CACHES[name] = {
+        'BACKEND': 'chuck_norris.cache.tiered.TieredCache',
+        'LOCATION': f'tests-{name}',
+        'OPTIONS': {'L2': 'l2', 'STAMP_INTERVAL': 0},
+    }
+
+
+@override_settings(CACHES=TIERED_CACHES)
+class TieredCacheTests(TestCase):
+
+    def setUp(self):
+        self.cache, self.other = caches['tiered'], caches['other']
+        for cache in (self.cache, self.other):
+            cache.clear()
+            cache.reset_stats()
+
+    def test_l1_shared_by_threads(self):
+        self.cache.set('fact:1', 'a')
+        thread = threading.Thread(target=lambda: caches['tiered'].get('fact:1'))
+        thread.start()
+        thread.join()
+        self.assertEqual(self.cache.stats()['l1_hits'], 1)
+        self.assertEqual(self.cache.stats()['l2_hits'], 0)
+
+    def test_writes_invalidate_other_processes(self):
+        self.cache.set('fact:1', 'a')
+        self.assertEqual(self.other.get('fact:1'), 'a')
+        self.cache.set('fact:1', 'b')
+        self.assertEqual(self.other.get('fact:1'), 'b')
+        self.cache.delete('fact:1')
+        self.assertIsNone(self.other.get('fact:1'))
+
+    def test_fill_keeps_other_processes(self):
+        # Llenar después de un fallo no invalida las entradas de los demás
+        self.cache.set_many({f'fact:{i}': i for i in range(64)})
+        self.other.get_many([f'fact:{i}' for i in range(64)])
+        self.cache.fill_many({f'fact:{i}': i for i in range(64, 128)})
+        self.cache.add('fact:200', 200)
+        self.other.reset_stats()
+        self.assertEqual(len(self.other.get_many([f'fact:{i}' for i in range(64)])), 64)
+        self.assertEqual(self.other.stats()['l1_hits'], 64)
+        self.assertEqual(self.other.stats()['l1_stale'], 0)
+        # Lo llenado se lee desde L2 y luego desde L1
+        self.assertEqual(self.cache.get('fact:100'), 100)
+        self.assertEqual(self.cache.get('fact:100'), 100)
+        self.assertEqual(self.cache.stats()['l1_hits'], 1)
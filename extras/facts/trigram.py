@@ -0,0 +1,157 @@
+import threading
+from collections import Counter
+
+from django.conf import settings
+
+from .models import Fact
+from .search import find_candidates, tokenize
+
+
+def trigrams(word):
+    # Trigramas de la palabra con dos espacios al inicio y uno al final,
+    # como pg_trgm: "norris" -> "  n", " no", "nor", "orr", "rri", "ris", "is "
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(a, b):
+    # Coeficiente de Jaccard entre los trigramas de ambas palabras
+    a, b = trigrams(a), trigrams(b)
+    return len(a & b) / len(a | b)
+
+
+class TrigramIndex:
+    """Índice de trigramas sobre el vocabulario de los hechos.
+
+    Se indexan las palabras distintas (no cada hecho), por lo que su tamaño
+    depende del vocabulario y no de la cantidad de hechos. Una búsqueda con
+    errores de tipeo se corrige primero contra el vocabulario y luego se
+    resuelve con el índice de texto completo de la base de datos.
+    """
+
+    # Hechos leídos por consulta al construir el índice
+    chunk_size = 5000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._reset()
+
+    def _reset(self):
+        # Palabra -> identificador interno, y su inverso
+        self._word_ids = {}
+        self._words = []
+        # Cantidad de trigramas de cada palabra
+        self._sizes = []
+        # Cantidad de hechos que contienen cada palabra
+        self._counts = []
+        # Trigrama -> lista de identificadores de palabras
+        self._postings = {}
+
+    @property
+    def threshold(self):
+        return getattr(settings, 'FACTS_TRIGRAM_THRESHOLD', 0.3)
+
+    def __len__(self):
+        return len(self._words)
+
+    def _add_word(self, word, count=1):
+        word_id = self._word_ids.get(word)
+        if word_id is None:
+            word_id = self._word_ids[word] = len(self._words)
+            grams = trigrams(word)
+            self._words.append(word)
+            self._sizes.append(len(grams))
+            self._counts.append(0)
+            for gram in grams:
+                self._postings.setdefault(gram, []).append(word_id)
+        self._counts[word_id] += count
+
+    def load(self):
+        # Recorremos la tabla por bloques de identificadores y contamos en
+        # cuántos hechos aparece cada palabra
+        counts = Counter()
+        last_id = 0
+        while True:
+            rows = list(Fact.objects.filter(id__gt=last_id).order_by('id')
+                        .values_list('id', 'fact')[:self.chunk_size])
+            if not rows:
+                break
+            for _, text in rows:
+                counts.update(set(tokenize(text)))
+            last_id = rows[-1][0]
+        with self._lock:
+            self._reset()
+            for word, count in counts.items():
+                self._add_word(word, count)
+            self._loaded = True
+
+    def ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def add_text(self, text):
+        # Al modificar un hecho se quita su texto anterior con remove_text
+        # y se agrega el nuevo
+        with self._lock:
+            if not self._loaded:
+                return
+            for word in set(tokenize(text)):
+                self._add_word(word)
+
+    def remove_text(self, text):
+        with self._lock:
+            if not self._loaded:
+                return
+            for word in set(tokenize(text)):
+                word_id = self._word_ids.get(word)
+                if word_id is not None and self._counts[word_id] > 0:
+                    self._counts[word_id] -= 1
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded = False
+
+    def similar_words(self, word, limit=5):
+        # Devuelve las palabras del vocabulario más parecidas a la indicada,
+        # con su similitud, contando los trigramas compartidos
+        self.ensure_loaded()
+        grams = trigrams(word)
+        threshold = self.threshold
+        shared = Counter()
+        with self._lock:
+            for gram in grams:
+                shared.update(self._postings.get(gram, ()))
+            matches = []
+            for word_id, common in shared.items():
+                if not self._counts[word_id]:
+                    continue
+                score = common / (len(grams) + self._sizes[word_id] - common)
+                if score >= threshold:
+                    matches.append((score, self._counts[word_id], self._words[word_id]))
+        matches.sort(reverse=True)
+        return [(match, score) for score, _, match in matches[:limit]]
+
+    def search(self, query, limit=20):
+        # Devuelve [(id, similitud)] de los hechos más parecidos a la búsqueda
+        tokens = list(dict.fromkeys(tokenize(query)))
+        expansions = []
+        for token in tokens:
+            similar = dict(self.similar_words(token))
+            if similar:
+                expansions.append(similar)
+        if not expansions:
+            return []
+        ids = find_candidates([list(similar) for similar in expansions])
+        # Puntaje: promedio de la mejor similitud de cada palabra buscada
+        scores = []
+        for fact_id, text in Fact.objects.filter(id__in=ids).values_list('id', 'fact'):
+            words = set(tokenize(text))
+            score = sum(max(similar.get(word, 0) for word in words) for similar in expansions)
+            scores.append((score / len(tokens), fact_id))
+        scores.sort(key=lambda item: (-item[0], -item[1]))
+        return [(fact_id, round(score, 4)) for score, fact_id in scores[:limit]]
+
+
+# Índice compartido por todas las peticiones del proceso
+trigram_index = TrigramIndex()
@@ -4,6 +4,7 @@ from . import views
 
 urlpatterns = [
     path('', views.home, name='home'),
+    path('autocomplete/', views.autocomplete, name='autocomplete'),
     path('create/', views.create_fact, name='create_fact'),
     path('login/', views.login_view, name='login'),
     path('logout/', views.logout_view, name='logout'),
@@ -0,0 +1,40 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+# Llave del contador de cambios de la tabla de hechos
+VERSION_KEY = 'facts:version'
+
+
+def get_cache():
+    # El contador se guarda en la caché compartida por los procesos del
+    # servidor (FACTS_VERSION_CACHE_ALIAS), para que los cambios hechos en un
+    # proceso invaliden los validadores y las consultas guardadas en todos
+    return caches[getattr(settings, 'FACTS_VERSION_CACHE_ALIAS', 'shared')]
+
+
+def initial_version():
+    # Si la caché pierde el contador, se reinicia en un valor mayor que los
+    # anteriores (microsegundos actuales), de modo que no se repitan versiones
+    return time.time_ns() // 1000
+
+
+def get_facts_version():
+    # Devuelve el contador de cambios; se inicializa si no existe
+    cache = get_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, initial_version(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_facts_version():
+    # Incrementa el contador cada vez que se crea, modifica o elimina un hecho
+    cache = get_cache()
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, initial_version(), timeout=None)
+        return cache.get(VERSION_KEY)
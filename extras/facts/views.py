@@ -1,23 +1,51 @@
-import random
-
 from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import AuthenticationForm, UserCreationForm
+from django.db import IntegrityError, transaction
+from django.http import JsonResponse
 from django.shortcuts import redirect, render
+from django.views.decorators.http import require_GET
 
+from .autocomplete import autocomplete_index
 from .forms import FactForm
-from .models import Fact
+from .minhash import find_near_duplicates
+from .models import DUPLICATE_FACT_MESSAGE
+from .object_cache import fact_cache
+from .random_index import fact_index
+from .similar import similar_facts
+from .trigram import trigram_index
 
 
 def home(request):
-    # Seleccionamos un hecho aleatorio
-    current_fact = random.choice(Fact.objects.all())
+    # Obtenemos el texto buscado, si existe
+    query = request.GET.get('q', '').strip()
+    if query:
+        # Buscamos los hechos más parecidos, tolerando errores de tipeo
+        ids = [fact_id for fact_id, _ in trigram_index.search(query, limit=10)]
+        facts = fact_cache.get_many(ids)
+        context = {'query': query, 'results': [facts[i] for i in ids if i in facts]}
+        return render(request, 'facts/home.html', context=context)
+    # Seleccionamos un hecho aleatorio desde el índice de identificadores,
+    # consultando solo la fila elegida
+    current_fact = fact_index.random_fact()
+    # Buscamos hechos parecidos para el bloque "Más como este"
+    similar = similar_facts(current_fact, limit=3) if current_fact else []
     # Creamos el contenido de la respuesta
-    context = {'current_fact': current_fact}
+    context = {'current_fact': current_fact, 'similar_facts': [fact for fact, _ in similar]}
     # Creamos la respuesta
     return render(request, 'facts/home.html', context=context)
 
 
+@require_GET
+def autocomplete(request):
+    # Se atiende desde AutocompleteMiddleware, antes de las sesiones, CSRF y
+    # mensajes, por lo que no debe usar request.user ni request.session
+    suggestions = autocomplete_index.complete(request.GET.get('q', '')[:100])
+    response = JsonResponse({'suggestions': suggestions})
+    response['Cache-Control'] = 'public, max-age=60'
+    return response
+
+
 @login_required(login_url='/login/')
 def create_fact(request):
     # Verificamos si se envió el formulario
@@ -26,14 +54,29 @@ def create_fact(request):
         form = FactForm(request.POST)
         # Verificamos si el formulario es válido
         if form.is_valid():
+            # Si el hecho es casi idéntico a otros, los mostramos y pedimos
+            # confirmación antes de guardarlo
+            if not request.POST.get('confirm'):
+                matches = find_near_duplicates(form.cleaned_data['fact'])
+                if matches:
+                    facts = fact_cache.get_many([fact_id for fact_id, _ in matches])
+                    context = {'form': form, 'near_duplicates': [
+                        (facts[fact_id], score) for fact_id, score in matches if fact_id in facts]}
+                    return render(request, 'facts/create_fact.html', context=context)
             # Creamos el objeto sin guardarlo en la base de datos
             fact = form.save(commit=False)
             # Asignamos el usuario autenticado
             fact.user = request.user
-            # Guardamos el objeto en la base de datos
-            fact.save()
-            # Redireccionamos a la página principal
-            return redirect('/')
+            # Guardamos el objeto en la base de datos; si otra petición guardó
+            # el mismo texto después de validar, el índice único lo rechaza
+            try:
+                with transaction.atomic():
+                    fact.save()
+            except IntegrityError:
+                form.add_error('fact', DUPLICATE_FACT_MESSAGE)
+            else:
+                # Redireccionamos a la página principal
+                return redirect('/')
     else:
         # Creamos el formulario
         form = FactForm()
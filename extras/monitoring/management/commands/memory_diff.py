@@ -0,0 +1,37 @@
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from monitoring.memory import GROUPS, compare
+
+
+def size(value):
+    for unit in ('B', 'KiB', 'MiB'):
+        if abs(value) < 1024:
+            return f'{value:+.1f} {unit}' if unit != 'B' else f'{value:+d} B'
+        value /= 1024
+    return f'{value:+.1f} GiB'
+
+
+class Command(BaseCommand):
+    help = ('Compara dos capturas de tracemalloc guardadas con '
+            'memory/snapshots/ y muestra las líneas cuya memoria más creció.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('old', help='Archivo de la captura anterior')
+        parser.add_argument('new', help='Archivo de la captura posterior')
+        parser.add_argument('--group', choices=GROUPS, default='lineno',
+                            help='Agrupa por línea, archivo o traceback completo')
+        parser.add_argument('--limit', type=int, default=20,
+                            help='Cantidad de diferencias que se muestran')
+
+    def handle(self, *args, **options):
+        try:
+            old = tracemalloc.Snapshot.load(options['old'])
+            new = tracemalloc.Snapshot.load(options['new'])
+        except (OSError, EOFError) as error:
+            raise CommandError(f'No se pudo leer la captura: {error}')
+        for stat in compare(old, new, options['group'], options['limit']):
+            self.stdout.write(f'{size(stat["size_diff"]):>12} ({stat["count_diff"]:+d} bloques) '
+                              f'total {size(stat["size"])[1:]}')
+            for frame in stat['traceback']:
+                self.stdout.write(f'    {frame}')
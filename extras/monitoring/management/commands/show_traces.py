@@ -0,0 +1,98 @@
+import os
+from collections import defaultdict
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from monitoring.tracing import get_trace_file, read_traces
+
+# Atributos que se muestran junto a cada span
+SHOWN_ATTRIBUTES = ('view', 'status', 'template', 'serializer', 'renderer', 'rows', 'sql', 'error')
+
+
+def ms(seconds):
+    return f'{(seconds or 0) * 1000:8.2f} ms'
+
+
+class Command(BaseCommand):
+    help = ('Muestra las trazas guardadas por TracingMiddleware. Sin argumentos '
+            'lista las más recientes; con el identificador de una traza muestra '
+            'sus spans en forma de árbol y el tiempo por tipo de span.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('trace_id', nargs='?',
+                            help='Identificador de la traza (o su comienzo)')
+        parser.add_argument('--file', default=None,
+                            help='Archivo de trazas (por defecto TRACING_FILE; las anteriores '
+                                 'a la última rotación están en TRACING_FILE.1)')
+        parser.add_argument('--limit', type=int, default=20,
+                            help='Cantidad de trazas que se listan')
+        parser.add_argument('--slowest', action='store_true',
+                            help='Lista las más lentas en lugar de las más recientes')
+        parser.add_argument('--path', default=None,
+                            help='Solo las trazas cuyo nombre contiene este texto')
+
+    def handle(self, *args, **options):
+        path = options['file'] or get_trace_file()
+        if not os.path.exists(path):
+            raise CommandError(f'No existe el archivo de trazas {path}.')
+        traces = read_traces(path)
+        if options['path']:
+            traces = (trace for trace in traces if options['path'] in trace['name'])
+        if options['trace_id']:
+            for trace in traces:
+                if trace['trace_id'].startswith(options['trace_id']):
+                    return self.show(trace)
+            raise CommandError(f'No se encontró la traza {options["trace_id"]}.')
+        self.list(list(traces), options['limit'], options['slowest'])
+
+    def list(self, traces, limit, slowest):
+        if slowest:
+            traces.sort(key=lambda trace: trace['duration'], reverse=True)
+        else:
+            traces.reverse()
+        for trace in traces[:limit]:
+            start = datetime.fromtimestamp(trace['start']).strftime('%Y-%m-%d %H:%M:%S')
+            status = trace['spans'][0]['attributes'].get('status', '')
+            self.stdout.write(f'{trace["trace_id"]}  {start}  {ms(trace["duration"])}  '
+                              f'{len(trace["spans"]):4} spans  {status}  {trace["name"]}')
+
+    def show(self, trace):
+        spans = trace['spans']
+        children = defaultdict(list)
+        ids = {span['span_id'] for span in spans}
+        roots = []
+        for span in spans:
+            if span['parent_id'] in ids:
+                children[span['parent_id']].append(span)
+            else:
+                roots.append(span)
+        start = trace['start']
+        self.stdout.write(f'Traza {trace["trace_id"]}: {trace["name"]} ({ms(trace["duration"]).strip()})')
+        if trace.get('dropped'):
+            self.stdout.write(f'Se descartaron {trace["dropped"]} spans por superar TRACING_MAX_SPANS')
+        self.stdout.write('')
+
+        # Tiempo propio de cada span: su duración menos la de sus hijos
+        totals = defaultdict(lambda: [0, 0.0, 0.0])
+
+        def write(span, depth):
+            duration = span['duration'] or 0
+            own = duration - sum(child['duration'] or 0 for child in children[span['span_id']])
+            total = totals[span['name']]
+            total[0] += 1
+            total[1] += duration
+            total[2] += own
+            attributes = ' '.join(f'{key}={str(span["attributes"][key])[:80]!r}'
+                                  for key in SHOWN_ATTRIBUTES if key in span['attributes'])
+            offset = (span['start'] - start) * 1000
+            self.stdout.write(f'{offset:8.2f} {ms(duration)}  {"  " * depth}{span["name"]}  {attributes}')
+            for child in sorted(children[span['span_id']], key=lambda child: child['start']):
+                write(child, depth + 1)
+
+        self.stdout.write(f'{"inicio":>8} {"duración":>11}  span')
+        for root in roots:
+            write(root, 0)
+
+        self.stdout.write('\nTiempo por tipo de span (propio = sin contar sus hijos):')
+        for name, (count, duration, own) in sorted(totals.items(), key=lambda item: item[1][2], reverse=True):
+            self.stdout.write(f'  {name:24} {count:5}x  total {ms(duration)}  propio {ms(own)}')
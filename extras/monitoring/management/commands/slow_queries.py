@@ -0,0 +1,75 @@
+import os
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from monitoring.slow_queries import get_log_file, normalize, read_log
+
+ORDERS = ('total', 'count', 'max', 'avg')
+
+
+class Command(BaseCommand):
+    help = ('Resume el registro de consultas lentas: agrupa las consultas '
+            'normalizadas y muestra las que más tiempo consumen, con las vistas '
+            'que las ejecutan y el plan de la ejecución más lenta.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=None,
+                            help='Archivo del registro (por defecto SLOW_QUERY_LOG)')
+        parser.add_argument('--top', type=int, default=10,
+                            help='Cantidad de consultas que se muestran')
+        parser.add_argument('--order', choices=ORDERS, default='total',
+                            help='Tiempo total, cantidad, tiempo máximo o promedio')
+        parser.add_argument('--hours', type=float, default=None,
+                            help='Solo los registros de las últimas horas')
+        parser.add_argument('--no-plan', action='store_true',
+                            help='No muestra el plan de ejecución ni la pila')
+
+    def handle(self, *args, **options):
+        path = options['file'] or get_log_file()
+        if not os.path.exists(path):
+            raise CommandError(f'No existe el registro de consultas lentas {path}.')
+        since = time.time() - options['hours'] * 3600 if options['hours'] else 0
+
+        # Cada registro representa su ejecución y las omitidas antes de él
+        groups = {}
+        for record in read_log(path):
+            if record['time'] < since:
+                continue
+            group = groups.get(record['fingerprint'])
+            if group is None:
+                group = groups[record['fingerprint']] = {
+                    'sql': normalize(record['sql']), 'count': 0, 'total': 0.0,
+                    'max': 0.0, 'views': Counter(), 'worst': record}
+            count = 1 + record.get('skipped', 0)
+            group['count'] += count
+            group['total'] += record['duration_ms'] + record.get('skipped_ms', 0)
+            group['views'][record.get('view') or '-'] += count
+            if record['duration_ms'] >= group['max']:
+                group['max'] = record['duration_ms']
+                group['worst'] = record
+        if not groups:
+            self.stdout.write('No hay consultas lentas registradas.')
+            return
+        for group in groups.values():
+            group['avg'] = group['total'] / group['count']
+
+        ranking = sorted(groups.items(), key=lambda item: item[1][options['order']], reverse=True)
+        self.stdout.write(f'{len(groups)} consultas distintas, '
+                          f'{sum(group["count"] for group in groups.values())} ejecuciones lentas\n')
+        for position, (key, group) in enumerate(ranking[:options['top']], start=1):
+            views = ', '.join(f'{view} ({count})' for view, count in group['views'].most_common(3))
+            self.stdout.write(f'#{position} [{key}] {group["count"]} veces, total {group["total"]:.1f} ms, '
+                              f'promedio {group["avg"]:.1f} ms, máximo {group["max"]:.1f} ms')
+            self.stdout.write(f'   Vistas: {views}')
+            self.stdout.write(f'   {group["sql"][:500]}')
+            if options['no_plan']:
+                continue
+            worst = group['worst']
+            if worst.get('params'):
+                self.stdout.write(f'   Parámetros: {worst["params"]}')
+            for line in worst.get('plan') or ():
+                self.stdout.write(f'   plan: {line}')
+            for frame in worst.get('stack') or ():
+                self.stdout.write(f'   en {frame}')
+            self.stdout.write('')
@@ -0,0 +1,115 @@
+import os
+import threading
+import time
+import tracemalloc
+
+from django.conf import settings
+
+# Asignaciones que no corresponden a la aplicación
+IGNORED_FILES = (tracemalloc.__file__, '<frozen importlib._bootstrap>',
+                 '<frozen importlib._bootstrap_external>', '<unknown>')
+GROUPS = ('lineno', 'filename', 'traceback')
+
+
+def get_directory():
+    return getattr(settings, 'MEMORY_SNAPSHOT_DIR', os.path.join(settings.BASE_DIR, 'var', 'memory'))
+
+
+def start():
+    # Inicia tracemalloc si no está activo; guardar más marcos por
+    # asignación permite agrupar por traceback, pero usa más memoria
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(getattr(settings, 'MEMORY_TRACE_FRAMES', 5))
+
+
+def filtered(snapshot):
+    return snapshot.filter_traces([tracemalloc.Filter(False, name) for name in IGNORED_FILES])
+
+
+def format_stat(stat, diff=False):
+    data = {
+        'size': stat.size,
+        'count': stat.count,
+        'traceback': [f'{frame.filename}:{frame.lineno}' for frame in stat.traceback],
+    }
+    if diff:
+        data['size_diff'] = stat.size_diff
+        data['count_diff'] = stat.count_diff
+    return data
+
+
+def compare(old, new, group='lineno', limit=20):
+    # Diferencias entre dos capturas, de mayor a menor crecimiento
+    stats = filtered(new).compare_to(filtered(old), group)
+    return [format_stat(stat, diff=True) for stat in stats[:limit]]
+
+
+def remove_files(removed):
+    for info, _ in removed:
+        try:
+            os.remove(info['path'])
+        except FileNotFoundError:
+            pass
+
+
+class SnapshotStore:
+    """Capturas de tracemalloc tomadas en el proceso.
+
+    Se conservan en memoria las últimas MEMORY_MAX_SNAPSHOTS, y cada una se
+    guarda también en MEMORY_SNAPSHOT_DIR para compararlas después con el
+    comando memory_diff, incluso entre procesos. Los archivos de las que se
+    descartan se borran.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshots = []
+        self._next_id = 1
+
+    def take(self):
+        start()
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        directory = get_directory()
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            snapshot_id = self._next_id
+            self._next_id += 1
+            path = os.path.join(directory, f'{os.getpid()}-{snapshot_id}.snapshot')
+            snapshot.dump(path)
+            info = {'id': snapshot_id, 'pid': os.getpid(), 'time': time.time(),
+                    'path': path, 'traced': current, 'peak': peak}
+            self._snapshots.append((info, snapshot))
+            keep = getattr(settings, 'MEMORY_MAX_SNAPSHOTS', 5)
+            removed = self._snapshots[:-keep]
+            del self._snapshots[:-keep]
+        remove_files(removed)
+        return info
+
+    def list(self):
+        with self._lock:
+            return [info for info, _ in self._snapshots]
+
+    def get(self, snapshot_id):
+        with self._lock:
+            for info, snapshot in self._snapshots:
+                if info['id'] == snapshot_id:
+                    return snapshot
+        return None
+
+    def last(self, count):
+        with self._lock:
+            return [snapshot for _, snapshot in self._snapshots[-count:]]
+
+    def clear(self):
+        # Detiene tracemalloc, que mientras está activo hace más lenta cada
+        # asignación y guarda sus marcos
+        with self._lock:
+            removed, self._snapshots = self._snapshots, []
+        remove_files(removed)
+        if not getattr(settings, 'MEMORY_PROFILING', False):
+            tracemalloc.stop()
+
+
+# Capturas del proceso, compartidas por todas las peticiones
+snapshots = SnapshotStore()
@@ -0,0 +1,250 @@
+import atexit
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+
+# El bloqueo de archivos solo existe en sistemas tipo Unix
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Límites superiores de los intervalos de cada histograma
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+MEMORY_BUCKETS = (65536, 262144, 1048576, 4194304, 16777216, 67108864, 268435456)
+
+# Nombre, tipo, descripción e intervalos de cada métrica
+METRICS = {
+    'django_http_requests_total': (
+        'counter', 'Peticiones atendidas por vista, método y código de estado', None),
+    'django_http_request_duration_seconds': (
+        'histogram', 'Duración de las peticiones', DURATION_BUCKETS),
+    'django_http_request_db_queries': (
+        'histogram', 'Consultas a la base de datos por petición', QUERY_BUCKETS),
+    'django_http_request_db_duration_seconds': (
+        'histogram', 'Tiempo en la base de datos por petición', DURATION_BUCKETS),
+    'django_http_response_size_bytes': (
+        'histogram', 'Tamaño del cuerpo de las respuestas', SIZE_BUCKETS),
+    # Solo con MEMORY_PROFILING activo
+    'django_http_request_memory_peak_bytes': (
+        'histogram', 'Máximo de memoria asignada durante la petición (tracemalloc)', MEMORY_BUCKETS),
+}
+# Archivo con los valores de los procesos que ya terminaron
+ARCHIVE = 'archive.json'
+
+
+def get_directory():
+    return getattr(settings, 'METRICS_DIR', os.path.join(settings.BASE_DIR, 'var', 'metrics'))
+
+
+class Registry:
+    """Métricas de las peticiones atendidas por el proceso.
+
+    Los valores se acumulan en memoria y cada METRICS_FLUSH_INTERVAL segundos
+    se escriben en un archivo propio del proceso dentro de METRICS_DIR. La
+    vista /metrics suma los archivos de todos los procesos del servidor.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._counters = defaultdict(float)
+        # (métrica, etiquetas) -> [conteo por intervalo..., suma, total]
+        self._histograms = {}
+        self._start()
+        atexit.register(self.flush)
+        # Con gunicorn --preload los procesos se crean con fork después de
+        # importar este módulo: cada uno empieza sus propias métricas y su
+        # propio archivo, como el pool de conexiones
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _start(self):
+        # Archivo propio del proceso: <pid>-<inicio>.json
+        self._name = f'{os.getpid()}-{time.time_ns()}.json'
+        self._flushed_at = time.monotonic()
+        self._changed = False
+
+    def _after_fork(self):
+        # Los valores heredados ya los informa el proceso padre
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._histograms = {}
+        self._start()
+
+    def observe_request(self, view, method, status, duration, queries, db_duration, size):
+        labels = (('view', view),)
+        with self._lock:
+            self._counters['django_http_requests_total', labels + (('method', method), ('status', str(status)))] += 1
+            self._observe('django_http_request_duration_seconds', labels, duration)
+            self._observe('django_http_request_db_queries', labels, queries)
+            self._observe('django_http_request_db_duration_seconds', labels, db_duration)
+            if size is not None:
+                self._observe('django_http_response_size_bytes', labels, size)
+            self._changed = True
+        if time.monotonic() - self._flushed_at >= getattr(settings, 'METRICS_FLUSH_INTERVAL', 5):
+            self.flush(blocking=False)
+
+    def observe_memory(self, view, peak):
+        with self._lock:
+            self._observe('django_http_request_memory_peak_bytes', (('view', view),), peak)
+            self._changed = True
+
+    def _observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        values = self._histograms.get((name, labels))
+        if values is None:
+            values = self._histograms[name, labels] = [0] * (len(buckets) + 3)
+        # Intervalo con el menor límite mayor o igual al valor (+Inf al final)
+        values[bisect_left(buckets, value)] += 1
+        values[-2] += value
+        values[-1] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': [[name, labels, value] for (name, labels), value in self._counters.items()],
+                'histograms': [[name, labels, list(values)] for (name, labels), values in self._histograms.items()],
+            }
+
+    def flush(self, blocking=True):
+        # Escribimos el archivo completo y lo reemplazamos de forma atómica,
+        # para que el proceso que lo lee nunca vea un archivo a medias. Sin
+        # bloquear, no se escribe si otro hilo ya lo está haciendo
+        if not self._flush_lock.acquire(blocking=blocking):
+            return
+        try:
+            self._flushed_at = time.monotonic()
+            if not self._changed:
+                return
+            self._changed = False
+            directory = get_directory()
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, self._name)
+            with open(f'{path}.tmp', 'w') as file:
+                json.dump(self.snapshot(), file)
+            os.replace(f'{path}.tmp', path)
+        finally:
+            self._flush_lock.release()
+
+
+# Métricas del proceso, compartidas por todas las peticiones
+registry = Registry()
+
+
+def _merge(total, data):
+    for name, labels, value in data.get('counters', ()):
+        key = (name, tuple(map(tuple, labels)))
+        total['counters'][key] = total['counters'].get(key, 0) + value
+    for name, labels, values in data.get('histograms', ()):
+        key = (name, tuple(map(tuple, labels)))
+        current = total['histograms'].get(key)
+        if current is None or len(current) != len(values):
+            total['histograms'][key] = list(values)
+        else:
+            total['histograms'][key] = [a + b for a, b in zip(current, values)]
+
+
+def _read(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _archive(directory, names):
+    # Sumamos los archivos de los procesos terminados al archivo histórico,
+    # para que el directorio no crezca con cada reinicio del servidor
+    finished = [name for name in names if not _is_running(int(name.split('-', 1)[0]))]
+    if not finished:
+        return names
+    total = {'counters': {}, 'histograms': {}}
+    for name in [ARCHIVE] + finished:
+        _merge(total, _read(os.path.join(directory, name)))
+    data = {
+        'counters': [[name, labels, value] for (name, labels), value in total['counters'].items()],
+        'histograms': [[name, labels, values] for (name, labels), values in total['histograms'].items()],
+    }
+    temporary = os.path.join(directory, f'{ARCHIVE}.{os.getpid()}')
+    with open(temporary, 'w') as file:
+        json.dump(data, file)
+    os.replace(temporary, os.path.join(directory, ARCHIVE))
+    for name in finished:
+        os.remove(os.path.join(directory, name))
+    return [name for name in names if name not in finished]
+
+
+def collect():
+    """Suma las métricas de todos los procesos: {'counters': {}, 'histograms': {}}."""
+    registry.flush()
+    directory = get_directory()
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, 'collect.lock'), 'w') as lock:
+        # Un solo proceso lee y archiva a la vez, para no sumar dos veces el
+        # archivo de un proceso que otro está archivando
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        # Archivos de los procesos: <pid>-<inicio>.json
+        names = [name for name in os.listdir(directory)
+                 if name.endswith('.json') and name.split('-', 1)[0].isdigit()]
+        if fcntl is not None:
+            names = _archive(directory, names)
+        total = {'counters': {}, 'histograms': {}}
+        for name in names + [ARCHIVE]:
+            _merge(total, _read(os.path.join(directory, name)))
+    return total
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+
+def _format_number(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render(total):
+    """Escribe las métricas en el formato de texto de Prometheus."""
+    lines = []
+    for name, (kind, description, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for (metric, labels), value in sorted(total['counters'].items()):
+                if metric == name:
+                    lines.append(f'{name}{_format_labels(labels)} {_format_number(value)}')
+            continue
+        for (metric, labels), values in sorted(total['histograms'].items()):
+            if metric != name:
+                continue
+            # Los intervalos de Prometheus son acumulados
+            cumulative = 0
+            for bound, count in zip(buckets + ('+Inf',), values):
+                cumulative += count
+                le = bound if bound == '+Inf' else _format_number(bound)
+                lines.append(f'{name}_bucket{_format_labels(labels + (("le", le),))} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {_format_number(values[-2])}')
+            lines.append(f'{name}_count{_format_labels(labels)} {_format_number(values[-1])}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,227 @@
+import os
+import threading
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.http import FileResponse
+from django.urls import Resolver404, resolve
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from . import memory
+from .metrics import registry
+from .profiling import MODES, profile
+from .slow_queries import SlowQueryLogger
+from .tracing import QueryTracer, current_span, should_sample, span, start_trace
+
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+
+def view_name(request):
+    # Nombre de la ruta ("home", "create_fact") o, si no tiene, la ruta de
+    # la vista ("api.views.FactList")
+    match = request.resolver_match
+    if match is None:
+        # Las peticiones atendidas por un middleware (como el autocompletado)
+        # no llegan a resolver la URL
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return 'unresolved'
+    return match.view_name
+
+
+class QueryTimer:
+    # Cuenta las consultas a la base de datos y el tiempo que toman
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+class MetricsMiddleware:
+    """Registra la duración, las consultas, el tamaño y el código de estado
+    de cada petición, agrupados por vista.
+
+    Debe ser el primero de MIDDLEWARE para medir también a los demás. En las
+    respuestas por partes (como la exportación) solo se mide hasta crear la
+    respuesta, no el envío del contenido.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        start = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+        # El tamaño de las respuestas por partes no se conoce de antemano
+        size = None if response.streaming else len(response.content)
+        method = request.method if request.method in METHODS else 'other'
+        registry.observe_request(view_name(request), method, response.status_code,
+                                 duration, timer.count, timer.duration, size)
+        return response
+
+
+class TracingMiddleware:
+    """Traza las peticiones elegidas según TRACING_SAMPLE_RATE, o las que
+    llegan desde TRACING_TRUSTED_IPS con un encabezado traceparent muestreado.
+
+    Crea el span raíz y un span por cada consulta a la base de datos, y
+    devuelve el identificador de la traza en el encabezado X-Trace-Id. Las
+    peticiones no elegidas no tienen ningún costo adicional.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        trusted = request.META.get('REMOTE_ADDR') in getattr(settings, 'TRACING_TRUSTED_IPS', [])
+        sampled, trace_id, parent_id = should_sample(request.META.get('HTTP_TRACEPARENT'), trusted)
+        if not sampled:
+            return self.get_response(request)
+        name = f'{request.method} {request.path}'
+        with start_trace(name, trace_id, parent_id, method=request.method, path=request.path) as root:
+            with connection.execute_wrapper(QueryTracer()):
+                response = self.get_response(request)
+            root.set(view=view_name(request), status=response.status_code)
+        response['X-Trace-Id'] = root.trace.trace_id
+        return response
+
+
+class ViewTracingMiddleware:
+    """Mide la vista, incluido el renderizado de la respuesta, en un span
+    propio. Debe ser el último de MIDDLEWARE: el tiempo restante del span
+    raíz corresponde a los demás middleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with span('view') as current:
+            response = self.get_response(request)
+            if current is not None:
+                current.set(view=view_name(request))
+        return response
+
+    def process_template_response(self, request, response):
+        # Las respuestas de DRF y los TemplateResponse se renderizan después
+        # de la vista; medimos ese paso por separado
+        if current_span() is not None:
+            render = response.render
+
+            def traced_render():
+                with span('response.render', renderer=type(response).__name__):
+                    return render()
+            response.render = traced_render
+        return response
+
+
+class SlowQueryMiddleware:
+    """Registra las consultas lentas ejecutadas durante la petición, junto a
+    la vista que las ejecutó (ver monitoring.slow_queries)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with connection.execute_wrapper(SlowQueryLogger(request)):
+            return self.get_response(request)
+
+
+class ProfilingMiddleware:
+    """Perfila una petición cuando un usuario staff lo solicita con el
+    encabezado X-Profile o el parámetro _profile, con el valor 'sample'
+    (pilas plegadas para flame graphs) o 'cprofile' (archivo de pstats).
+
+    El perfil se guarda en PROFILING_DIR y su nombre se indica en el
+    encabezado X-Profile-File; con X-Profile-Download: 1 (o
+    _profile_download=1) se entrega el archivo en lugar de la respuesta. El
+    usuario se obtiene de la sesión o del token JWT, para cubrir también la
+    API. Las demás peticiones solo revisan el encabezado y la URL.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = request.META.get('HTTP_X_PROFILE')
+        if mode is None and '_profile' in request.META.get('QUERY_STRING', ''):
+            mode = request.GET.get('_profile')
+        if mode not in MODES or not self.is_staff(request):
+            return self.get_response(request)
+        response, path = profile(mode, lambda: self.get_response(request), request.path)
+        download = (request.META.get('HTTP_X_PROFILE_DOWNLOAD') == '1'
+                    or request.GET.get('_profile_download') == '1')
+        if download:
+            return FileResponse(open(path, 'rb'), as_attachment=True, content_type='text/plain')
+        response['X-Profile-File'] = os.path.basename(path)
+        return response
+
+    def is_staff(self, request):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return user.is_staff
+        try:
+            result = JWTAuthentication().authenticate(request)
+        except (AuthenticationFailed, InvalidToken):
+            return False
+        return result is not None and result[0].is_staff
+
+
+class MemoryMiddleware:
+    """Registra, por vista, la memoria máxima asignada durante cada petición
+    en la métrica django_http_request_memory_peak_bytes de /metrics.
+
+    Solo se activa con MEMORY_PROFILING, ya que tracemalloc hace más lenta
+    cada asignación. El máximo de tracemalloc es de todo el proceso y cada
+    petición lo reinicia, por lo que solo se registran las peticiones que no
+    coincidieron con otra: con varios hilos por proceso se descartan las
+    simultáneas. En las respuestas por partes solo se mide hasta crear la
+    respuesta.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'MEMORY_PROFILING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self._lock = threading.Lock()
+        # Peticiones en curso y cantidad de peticiones iniciadas
+        self._active = 0
+        self._started = 0
+        memory.start()
+
+    def __call__(self, request):
+        with self._lock:
+            self._active += 1
+            self._started += 1
+            started = self._started
+            alone = self._active == 1
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+        try:
+            response = self.get_response(request)
+        finally:
+            with self._lock:
+                self._active -= 1
+                # Otra petición que empezó después reinició el máximo
+                alone = alone and self._started == started
+                peak = tracemalloc.get_traced_memory()[1]
+        if alone:
+            registry.observe_memory(view_name(request), max(peak - before, 0))
+        return response
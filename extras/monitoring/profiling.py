@@ -0,0 +1,120 @@
+import cProfile
+import os
+import re
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+
+# Modos de perfilado: muestreo de pilas (formato de flame graph) o cProfile
+MODES = {'sample': 'folded', 'cprofile': 'prof'}
+UNSAFE_RE = re.compile(r'[^A-Za-z0-9_.-]+')
+
+
+def get_directory():
+    return getattr(settings, 'PROFILING_DIR', os.path.join(settings.BASE_DIR, 'var', 'profiles'))
+
+
+def frame_name(frame):
+    code = frame.f_code
+    module = frame.f_globals.get('__name__', os.path.basename(code.co_filename))
+    # co_qualname incluye la clase de los métodos (Python 3.11 o superior)
+    return f'{module}:{getattr(code, "co_qualname", code.co_name)}'
+
+
+class Sampler:
+    """Perfilador por muestreo: cada `interval` segundos guarda la pila del
+    hilo observado. El resultado usa el formato de pilas plegadas
+    ("a;b;c 12") que leen flamegraph.pl, speedscope o inferno.
+
+    Las muestras se toman desde otro hilo, por lo que en código que no
+    libera el GIL el intervalo efectivo es al menos sys.getswitchinterval().
+    """
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+                self.samples += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def folded(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+def prune(directory):
+    # Borra los perfiles con más de PROFILING_MAX_AGE segundos y, de los
+    # demás, los que superan PROFILING_MAX_FILES, empezando por los más
+    # antiguos. Cero desactiva cada límite
+    max_files = getattr(settings, 'PROFILING_MAX_FILES', 100)
+    max_age = getattr(settings, 'PROFILING_MAX_AGE', 7 * 24 * 3600)
+    extensions = tuple(f'.{extension}' for extension in MODES.values())
+    profiles = []
+    for name in os.listdir(directory):
+        if name.endswith(extensions):
+            path = os.path.join(directory, name)
+            try:
+                profiles.append((os.path.getmtime(path), path))
+            except FileNotFoundError:
+                continue
+    profiles.sort(reverse=True)
+    oldest = time.time() - max_age
+    for position, (modified, path) in enumerate(profiles):
+        if (max_files and position >= max_files) or (max_age and modified < oldest):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # Otro proceso ya lo borró
+                pass
+
+
+def profile(mode, function, label):
+    """Ejecuta function() con el perfilador indicado y guarda el resultado.
+
+    Devuelve (resultado de function, ruta del archivo).
+    """
+    directory = get_directory()
+    os.makedirs(directory, exist_ok=True)
+    name = (f'{time.strftime("%Y%m%d-%H%M%S")}-{secrets.token_hex(3)}-'
+            f'{UNSAFE_RE.sub("_", label)[:60]}.{MODES[mode]}')
+    path = os.path.join(directory, name)
+    if mode == 'cprofile':
+        profiler = cProfile.Profile()
+        try:
+            result = profiler.runcall(function)
+        finally:
+            profiler.dump_stats(path)
+            prune(directory)
+        return result, path
+    sampler = Sampler(threading.get_ident(), getattr(settings, 'PROFILING_INTERVAL', 0.005))
+    sampler.start()
+    try:
+        result = function()
+    finally:
+        sampler.stop()
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(sampler.folded())
+        prune(directory)
+    return result, path
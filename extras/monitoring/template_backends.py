@@ -0,0 +1,23 @@
+from django.template.backends.django import DjangoTemplates, Template
+
+from .tracing import span
+
+
+class TracedTemplate(Template):
+
+    def render(self, context=None, request=None):
+        with span('template.render', template=self.origin.template_name):
+            return super().render(context, request)
+
+
+class TracedDjangoTemplates(DjangoTemplates):
+    """Motor de plantillas de Django que mide cada renderizado en la traza
+    de la petición, incluidas las etiquetas que usa la plantilla."""
+
+    def from_string(self, template_code):
+        template = super().from_string(template_code)
+        return TracedTemplate(template.template, self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TracedTemplate(template.template, self)
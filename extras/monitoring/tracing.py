@@ -0,0 +1,224 @@
+import json
+import os
+import random
+import re
+import secrets
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# Span activo en el contexto actual (hilo o tarea de asyncio)
+_current = ContextVar('monitoring_span', default=None)
+# Encabezado traceparent de W3C: versión-traza-span-opciones
+TRACEPARENT_RE = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+
+class Trace:
+    # Spans de una petición; se exporta al terminar el span raíz
+
+    def __init__(self, trace_id=None):
+        self.trace_id = trace_id or secrets.token_hex(16)
+        self.spans = []
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            if len(self.spans) < getattr(settings, 'TRACING_MAX_SPANS', 1000):
+                self.spans.append(span)
+                return True
+            self.dropped += 1
+            return False
+
+    def to_dict(self):
+        root = self.spans[0]
+        return {
+            'trace_id': self.trace_id,
+            'name': root.name,
+            'start': root.start,
+            'duration': root.duration,
+            'dropped': self.dropped,
+            'spans': [span.to_dict() for span in self.spans],
+        }
+
+
+class Span:
+
+    def __init__(self, trace, name, parent_id=None, attributes=None):
+        self.trace = trace
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = attributes or {}
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self.duration = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._started
+
+    def to_dict(self):
+        return {
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start': self.start,
+            'duration': self.duration,
+            'attributes': self.attributes,
+        }
+
+
+def current_span():
+    return _current.get()
+
+
+@contextmanager
+def span(name, **attributes):
+    """Mide el bloque como hijo del span activo.
+
+    Si la petición no fue elegida para trazar no hace nada, por lo que puede
+    usarse en cualquier parte del código.
+    """
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(parent.trace, name, parent.span_id, attributes)
+    if not parent.trace.add(child):
+        yield None
+        return
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as error:
+        child.set(error=repr(error))
+        raise
+    finally:
+        child.finish()
+        _current.reset(token)
+
+
+def should_sample(traceparent=None, trusted=False):
+    # Devuelve (trazar, id de la traza, id del span padre). Una petición que
+    # llega de un origen confiable con un traceparent marcado como muestreado
+    # continúa esa traza; el de los demás clientes se ignora para que no
+    # puedan forzar el trazado
+    match = TRACEPARENT_RE.match(traceparent or '') if trusted else None
+    if match:
+        trace_id, parent_id, flags = match.groups()
+        if int(flags, 16) & 1:
+            return True, trace_id, parent_id
+    return random.random() < getattr(settings, 'TRACING_SAMPLE_RATE', 0.0), None, None
+
+
+@contextmanager
+def start_trace(name, trace_id=None, parent_id=None, **attributes):
+    """Inicia una traza con un span raíz y la exporta al terminar."""
+    trace = Trace(trace_id)
+    root = Span(trace, name, parent_id, attributes)
+    trace.add(root)
+    token = _current.set(root)
+    try:
+        yield root
+    except BaseException as error:
+        root.set(error=repr(error))
+        raise
+    finally:
+        root.finish()
+        _current.reset(token)
+        get_exporter().export(trace)
+
+
+class MemoryExporter:
+    # Guarda las últimas trazas en memoria, para pruebas o para revisarlas
+    # desde el mismo proceso
+
+    def __init__(self, max_traces=100):
+        self.traces = deque(maxlen=max_traces)
+
+    def export(self, trace):
+        self.traces.append(trace.to_dict())
+
+    def clear(self):
+        self.traces.clear()
+
+
+class FileExporter:
+    # Agrega cada traza como una línea JSON al archivo. Cada línea se escribe
+    # con una sola llamada a os.write sobre un descriptor abierto con
+    # O_APPEND, por lo que varios procesos pueden compartirlo sin mezclar
+    # líneas. Al superar max_bytes el archivo pasa a <archivo>.1
+
+    def __init__(self, path, max_bytes=None):
+        self.path = path
+        self.max_bytes = max_bytes
+
+    def export(self, trace):
+        line = json.dumps(trace.to_dict(), ensure_ascii=False, default=str) + '\n'
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fd = self._open()
+        try:
+            os.write(fd, line.encode('utf-8'))
+        finally:
+            os.close(fd)
+
+    def _open(self):
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        if not self.max_bytes:
+            return fd
+        stat = os.fstat(fd)
+        if stat.st_size < self.max_bytes:
+            return fd
+        os.close(fd)
+        try:
+            # Otro proceso puede haberlo rotado ya: solo se mueve si sigue
+            # siendo el mismo archivo
+            if os.stat(self.path).st_ino == stat.st_ino:
+                os.replace(self.path, self.path + '.1')
+        except FileNotFoundError:
+            pass
+        return os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+
+_exporter = None
+
+
+def get_exporter():
+    global _exporter
+    if _exporter is None:
+        if getattr(settings, 'TRACING_EXPORTER', 'memory') == 'file':
+            _exporter = FileExporter(get_trace_file(), getattr(settings, 'TRACING_MAX_BYTES', None))
+        else:
+            _exporter = MemoryExporter()
+    return _exporter
+
+
+def get_trace_file():
+    return getattr(settings, 'TRACING_FILE', os.path.join(settings.BASE_DIR, 'var', 'traces.jsonl'))
+
+
+def read_traces(path):
+    # Lee las trazas del archivo, ignorando las líneas incompletas
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+class QueryTracer:
+    # Crea un span por cada consulta a la base de datos
+
+    def __call__(self, execute, sql, params, many, context):
+        with span('db.query', sql=sql[:1000], many=many, vendor=context['connection'].vendor):
+            return execute(sql, params, many, context)
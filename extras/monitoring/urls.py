@@ -0,0 +1,9 @@
+from django.urls import path
+
+from . import views
+
+urlpatterns = [
+    path('metrics', views.metrics, name='metrics'),
+    path('memory/snapshots/', views.MemorySnapshots.as_view()),
+    path('memory/diff/', views.MemoryDiff.as_view()),
+]
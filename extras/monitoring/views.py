@@ -0,0 +1,85 @@
+import os
+import tracemalloc
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.views.decorators.http import require_GET
+from rest_framework import status
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from . import memory
+from .memory import snapshots
+from .metrics import collect, render
+
+
+@require_GET
+def metrics(request):
+    # Métricas de todos los procesos en el formato de texto de Prometheus.
+    # Solo se entregan a las direcciones de METRICS_ALLOWED_IPS (o a todas
+    # si la lista está vacía)
+    allowed = getattr(settings, 'METRICS_ALLOWED_IPS', [])
+    if allowed and request.META.get('REMOTE_ADDR') not in allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(render(collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class MemorySnapshots(APIView):
+    authentication_classes = [SessionAuthentication, JWTAuthentication]
+    permission_classes = [IsAdminUser]
+    max_limit = 100
+
+    def get(self, request):
+        # Capturas de tracemalloc del proceso que atiende la petición
+        return Response({'pid': os.getpid(), 'tracing': tracemalloc.is_tracing(),
+                         'snapshots': snapshots.list()})
+
+    def post(self, request):
+        # Toma una captura e informa las líneas que más memoria ocupan
+        group, limit = get_group_and_limit(request, self.max_limit)
+        info = snapshots.take()
+        stats = memory.filtered(snapshots.get(info['id'])).statistics(group)
+        data = dict(info, top=[memory.format_stat(stat) for stat in stats[:limit]])
+        return Response(data, status=status.HTTP_201_CREATED)
+
+    def delete(self, request):
+        # Elimina las capturas y detiene tracemalloc
+        snapshots.clear()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class MemoryDiff(APIView):
+    authentication_classes = [SessionAuthentication, JWTAuthentication]
+    permission_classes = [IsAdminUser]
+    max_limit = 100
+
+    def get(self, request):
+        # Compara dos capturas del proceso (?from=1&to=2), por defecto las
+        # dos últimas
+        group, limit = get_group_and_limit(request, self.max_limit)
+        try:
+            ids = [int(request.query_params[key]) for key in ('from', 'to')
+                   if key in request.query_params]
+        except ValueError:
+            raise ValidationError({'detail': 'Los identificadores deben ser números enteros.'})
+        if ids and len(ids) != 2:
+            raise ValidationError({'detail': 'Debe indicar from y to.'})
+        pair = [snapshots.get(snapshot_id) for snapshot_id in ids] if ids else snapshots.last(2)
+        if len(pair) != 2 or None in pair:
+            raise ValidationError({'detail': f'El proceso {os.getpid()} no tiene esas capturas.'})
+        return Response({'pid': os.getpid(), 'diff': memory.compare(pair[0], pair[1], group, limit)})
+
+
+def get_group_and_limit(request, max_limit):
+    group = request.query_params.get('group', 'lineno')
+    if group not in memory.GROUPS:
+        raise ValidationError({'group': f'Debe ser uno de: {", ".join(memory.GROUPS)}.'})
+    try:
+        limit = max(1, min(int(request.query_params.get('limit', 20)), max_limit))
+    except ValueError:
+        raise ValidationError({'limit': 'Debe ser un número entero.'})
+    return group, limit
@@ -83,6 +83,37 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+# Backend de la caché de páginas para visitantes anónimos: 'locmem' guarda las
+# páginas en la memoria de cada proceso; 'file' las comparte entre los procesos
+# del servidor, de modo que una modificación las invalida en todos
+PAGE_CACHE_BACKEND = 'locmem'
+PAGE_CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'pages',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'var' / 'cache' / 'pages',
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'pages': {
+        **PAGE_CACHE_BACKENDS[PAGE_CACHE_BACKEND],
+        # Las páginas se invalidan al modificar los hechos; el tiempo de
+        # expiración solo acota el espacio usado
+        'TIMEOUT': 600,
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
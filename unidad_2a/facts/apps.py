@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class FactsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'facts'
+
+    def ready(self):
+        # Registramos los receptores de señales del modelo Fact
+        from . import signals  # noqa: F401
@@ -0,0 +1,98 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.core.cache import caches
+from django.http import HttpResponse
+
+# Alias de settings.CACHES donde se guardan las páginas
+CACHE_ALIAS = 'pages'
+# Encabezados de la petición que pueden cambiar el contenido de la página
+VARY_HEADERS = ('HTTP_ACCEPT_LANGUAGE',)
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def _version_key(tag):
+    return f'pages:version:{tag}'
+
+
+def get_versions(tags):
+    # Cada etiqueta ("facts", "fact:3") tiene un número de versión; al
+    # cambiarlo, las páginas guardadas con el número anterior dejan de usarse
+    cache = get_cache()
+    keys = [_version_key(tag) for tag in tags]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Si la versión no existe (o se descartó) usamos la hora actual,
+            # para no coincidir con un número usado antes
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def invalidate(*tags):
+    cache = get_cache()
+    for tag in tags:
+        try:
+            cache.incr(_version_key(tag))
+        except ValueError:
+            cache.set(_version_key(tag), time.time_ns(), timeout=None)
+
+
+def _page_key(request, tags):
+    parts = [request.build_absolute_uri()]
+    parts += [request.META.get(header, '') for header in VARY_HEADERS]
+    parts += [str(version) for version in get_versions(tags)]
+    return 'pages:page:' + hashlib.md5('\n'.join(parts).encode()).hexdigest()
+
+
+def _is_cacheable(request, response):
+    # No se guardan las respuestas con contenido propio del visitante: las
+    # que crean cookies (sesión o CSRF), las que incluyen un token CSRF o
+    # mensajes, y las marcadas como privadas
+    if response.status_code not in (200, 404) or response.streaming:
+        return False
+    if response.cookies or request.META.get('CSRF_COOKIE_NEEDS_UPDATE'):
+        return False
+    messages = getattr(request, '_messages', None)
+    if messages is not None and messages.used:
+        return False
+    session = getattr(request, 'session', None)
+    if session is not None and session.modified:
+        return False
+    cache_control = response.get('Cache-Control', '')
+    return 'private' not in cache_control and 'no-store' not in cache_control
+
+
+def cache_anonymous_page(tags):
+    """Guarda la página completa para los visitantes anónimos.
+
+    tags recibe la petición y los argumentos de la vista, y devuelve las
+    etiquetas de los datos que muestra la página; los receptores de señales
+    las invalidan cuando esos datos cambian. Los usuarios autenticados
+    siempre reciben una página nueva.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+                return view(request, *args, **kwargs)
+            cache = get_cache()
+            key = _page_key(request, tags(request, *args, **kwargs))
+            cached = cache.get(key)
+            if cached is not None:
+                content, status, content_type = cached
+                response = HttpResponse(content, status=status, content_type=content_type)
+                response['X-Page-Cache'] = 'hit'
+                return response
+            response = view(request, *args, **kwargs)
+            if request.method == 'GET' and _is_cacheable(request, response):
+                cache.set(key, (response.content, response.status_code, response['Content-Type']))
+                response['X-Page-Cache'] = 'miss'
+            return response
+        return wrapper
+    return decorator
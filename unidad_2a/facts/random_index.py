@@ -0,0 +1,119 @@
+import random
+import threading
+import time
+from array import array
+
+from django.conf import settings
+
+from .models import Fact
+
+
+class FactIdIndex:
+    """Índice compacto en memoria con los identificadores de los hechos.
+
+    Permite elegir un hecho aleatorio en O(1) sin cargar la tabla completa,
+    y se actualiza de forma incremental cuando se guardan o eliminan hechos.
+    """
+
+    # Cantidad de identificadores leídos por bloque al construir el índice
+    chunk_size = 10000
+
+    def __init__(self, ttl=None):
+        # Arreglo de enteros de 64 bits con los identificadores (8 bytes c/u)
+        self._ids = array('q')
+        # Identificadores eliminados que aún no se quitan del arreglo
+        self._deleted = set()
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self._ttl = ttl
+
+    @property
+    def ttl(self):
+        if self._ttl is not None:
+            return self._ttl
+        return getattr(settings, 'FACTS_RANDOM_INDEX_TTL', 300)
+
+    def __len__(self):
+        return len(self._ids) - len(self._deleted)
+
+    def _is_stale(self):
+        # El índice se reconstruye si nunca se cargó o si expiró, para
+        # incorporar los cambios realizados por otros procesos
+        if self._loaded_at is None:
+            return True
+        return self.ttl and time.monotonic() - self._loaded_at > self.ttl
+
+    def load(self):
+        # Leemos solo los identificadores, por bloques y sin crear modelos
+        ids = array('q')
+        queryset = Fact.objects.values_list('id', flat=True).order_by()
+        for fact_id in queryset.iterator(chunk_size=self.chunk_size):
+            ids.append(fact_id)
+        with self._lock:
+            self._ids = ids
+            self._deleted = set()
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def add(self, fact_id):
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            if fact_id in self._deleted:
+                self._deleted.discard(fact_id)
+            else:
+                self._ids.append(fact_id)
+
+    def discard(self, fact_id):
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            self._deleted.add(fact_id)
+            # Compactamos cuando los eliminados superan un cuarto del índice
+            if len(self._deleted) * 4 > len(self._ids):
+                self._compact()
+
+    def _compact(self):
+        deleted = self._deleted
+        self._ids = array('q', (i for i in self._ids if i not in deleted))
+        self._deleted = set()
+
+    def sample_id(self):
+        if self._is_stale():
+            self.load()
+        with self._lock:
+            size = len(self._ids)
+            if size == len(self._deleted):
+                return None
+            # Muestreo por rechazo: los eliminados son menos de un cuarto,
+            # por lo que el número esperado de intentos es menor a 4/3
+            while True:
+                fact_id = self._ids[random.randrange(size)]
+                if fact_id not in self._deleted:
+                    return fact_id
+
+    def random_fact(self, queryset=None):
+        if queryset is None:
+            queryset = Fact.objects.all()
+        # Reintentamos si otro proceso eliminó el hecho elegido
+        for _ in range(8):
+            fact_id = self.sample_id()
+            if fact_id is None:
+                return None
+            fact = queryset.filter(id=fact_id).first()
+            if fact is not None:
+                return fact
+            self.discard(fact_id)
+        # Si hay demasiados eliminados, reconstruimos el índice
+        self.invalidate()
+        fact_id = self.sample_id()
+        if fact_id is None:
+            return None
+        return queryset.filter(id=fact_id).first()
+
+
+# Índice compartido por todas las peticiones del proceso
+fact_index = FactIdIndex()
@@ -0,0 +1,22 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import invalidate
+from .models import Fact
+from .random_index import fact_index
+
+
+@receiver(post_save, sender=Fact)
+def fact_saved(sender, instance, created, **kwargs):
+    # Invalidamos las páginas guardadas que muestran el hecho
+    invalidate('facts', f'fact:{instance.id}')
+    # Agregamos los hechos nuevos al índice de selección aleatoria
+    if created:
+        fact_index.add(instance.id)
+
+
+@receiver(post_delete, sender=Fact)
+def fact_deleted(sender, instance, **kwargs):
+    invalidate('facts', f'fact:{instance.id}')
+    # Quitamos el hecho eliminado del índice de selección aleatoria
+    fact_index.discard(instance.id)
@@ -1,11 +1,12 @@
-import random
-
 from django.shortcuts import redirect, render
 
+from .cache import cache_anonymous_page
 from .forms import FactForm
 from .models import Fact
+from .random_index import fact_index
 
 
+@cache_anonymous_page(lambda request: ['facts'])
 def home_view(request):
     # Creamos el contenido de la respuesta
     context = {'facts': Fact.objects.all()}
@@ -13,6 +14,7 @@ def home_view(request):
     return render(request, 'facts/home.html', context=context)
 
 
+@cache_anonymous_page(lambda request, fact_id: [f'fact:{fact_id}'])
 def fact_view(request, fact_id):
     try:
         # Seleccionamos un hecho específico
@@ -27,8 +29,9 @@ def fact_view(request, fact_id):
 
 
 def random_view(request):
-    # Seleccionamos un hecho aleatorio
-    current_fact = random.choice(Fact.objects.all())
+    # Seleccionamos un hecho aleatorio desde el índice de identificadores,
+    # consultando solo la fila elegida
+    current_fact = fact_index.random_fact()
     # Creamos el contenido de la respuesta
     context = {'fact': current_fact}
     # Creamos la respuesta
@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'facts.slow_queries.SlowQueryMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -83,6 +84,62 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+# Backend de la caché de páginas para visitantes anónimos: 'locmem' guarda las
+# páginas en la memoria de cada proceso; 'file' las comparte entre los procesos
+# del servidor, de modo que una modificación las invalida en todos
+PAGE_CACHE_BACKEND = 'locmem'
+PAGE_CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'pages',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'var' / 'cache' / 'pages',
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'pages': {
+        **PAGE_CACHE_BACKENDS[PAGE_CACHE_BACKEND],
+        # Las páginas se invalidan al modificar los hechos; el tiempo de
+        # expiración solo acota el espacio usado
+        'TIMEOUT': 600,
+    },
+    # Hechos leídos por identificador; al llenarse se descartan los menos usados
+    'facts': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'facts',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+FACTS_CACHE_ALIAS = 'facts'
+# Segundos que se recuerda que un identificador no existe
+FACTS_CACHE_NEGATIVE_TTL = 30
+
+# Registro de consultas lentas: las que superan SLOW_QUERY_THRESHOLD_MS se
+# guardan en SLOW_QUERY_LOG con su plan de ejecución. Se registran como
+# máximo una vez por consulta cada SLOW_QUERY_INTERVAL segundos, y de esos
+# registros solo una fracción SLOW_QUERY_SAMPLE_RATE; las ejecuciones no
+# registradas se suman al siguiente. El comando slow_queries resume el archivo
+SLOW_QUERY_THRESHOLD_MS = 100
+SLOW_QUERY_SAMPLE_RATE = 1.0
+SLOW_QUERY_INTERVAL = 60
+SLOW_QUERY_EXPLAIN = True
+SLOW_QUERY_LOG = BASE_DIR / 'var' / 'slow_queries.jsonl'
+# Tablas cuyas consultas se registran sin parámetros
+SLOW_QUERY_REDACTED_TABLES = ['django_session', 'auth_user']
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
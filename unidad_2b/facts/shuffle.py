@@ -0,0 +1,122 @@
+import hashlib
+import random
+
+from django.db.models import Count, Max
+
+from .models import Fact
+
+
+class ShuffleCursor:
+    """Recorre los hechos en un orden pseudoaleatorio sin repetirlos.
+
+    En lugar de guardar los identificadores ya vistos, solo se guarda una
+    semilla, el tramo de identificadores (after, high], su cantidad de hechos
+    y la posición del cursor. Cada posición se convierte en el rango (la
+    posición en orden de id) de un hecho del tramo con una red de Feistel
+    con la semilla como clave, que es una biyección sobre [0, size).
+
+    Cada petición cuesta una consulta, que lee el hecho de ese rango con
+    OFFSET; si se eliminaron hechos del tramo se agrega un conteo y se saltan
+    los rangos que ya no existen. Al eliminar un hecho los rangos siguientes
+    se desplazan en uno, por lo que un hecho puede repetirse o saltarse en
+    ese ciclo. Los hechos creados durante el ciclo se recorren en un tramo
+    nuevo, y cada ciclo comienza con una consulta de MAX y COUNT.
+    """
+
+    # Vueltas de la red de Feistel
+    rounds = 4
+
+    def __init__(self, seed=None, after=None, high=None, size=0, cursor=0):
+        self.seed = seed
+        self.after = after
+        self.high = high
+        self.size = size
+        self.cursor = cursor
+
+    @classmethod
+    def from_session(cls, session, key):
+        state = session.get(key)
+        # Los cursores de versiones anteriores no tienen 'after'
+        if not isinstance(state, dict) or 'after' not in state:
+            return cls()
+        return cls(state.get('seed'), state.get('after'), state.get('high'),
+                   state.get('size', 0), state.get('cursor', 0))
+
+    def to_session(self, session, key):
+        session[key] = {'seed': self.seed, 'after': self.after, 'high': self.high,
+                        'size': self.size, 'cursor': self.cursor}
+
+    def _round(self, number, value, mask):
+        data = f'{self.seed}:{self.after}:{number}:{value}'.encode()
+        return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'big') & mask
+
+    def _permute(self, position):
+        # Red de Feistel sobre 2 * half bits; los valores fuera de [0, size)
+        # se vuelven a cifrar hasta caer dentro (cycle-walking)
+        half = max(1, ((self.size - 1).bit_length() + 1) // 2)
+        mask = (1 << half) - 1
+        value = position
+        while True:
+            left, right = value >> half, value & mask
+            for number in range(self.rounds):
+                left, right = right, left ^ self._round(number, right, mask)
+            value = (left << half) | right
+            if value < self.size:
+                return value
+
+    def _queryset(self):
+        return Fact.objects.filter(id__gt=self.after, id__lte=self.high).order_by('id')
+
+    def _segment(self, after):
+        # Máximo identificador y cantidad de hechos después de after
+        return Fact.objects.filter(id__gt=after).aggregate(high=Max('id'), size=Count('id'))
+
+    def _start_cycle(self):
+        segment = self._segment(0)
+        self.seed = random.getrandbits(32)
+        self.after = 0
+        self.high = segment['high']
+        self.size = segment['size']
+        self.cursor = 0
+        return self.size > 0
+
+    def _extend(self):
+        # Los hechos creados durante el ciclo tienen identificadores mayores
+        # que el tramo actual, por lo que se recorren en un tramo nuevo
+        segment = self._segment(self.high)
+        if not segment['size']:
+            return False
+        self.after = self.high
+        self.high = segment['high']
+        self.size = segment['size']
+        self.cursor = 0
+        return True
+
+    def _next_in_segment(self):
+        queryset = self._queryset()
+        available = self.size
+        while self.cursor < self.size:
+            rank = self._permute(self.cursor)
+            self.cursor += 1
+            if rank >= available:
+                continue
+            fact = queryset[rank:rank + 1].first()
+            if fact is not None:
+                return fact
+            # Se eliminaron hechos del tramo: los rangos desde el conteo
+            # actual ya no existen y se saltan sin consultar
+            available = queryset.count()
+        return None
+
+    def next_fact(self):
+        if self.seed is None and not self._start_cycle():
+            return None
+        # Como máximo: terminar el tramo, recorrer uno nuevo e iniciar un
+        # ciclo nuevo
+        for _ in range(3):
+            fact = self._next_in_segment()
+            if fact is not None:
+                return fact
+            if not self._extend() and not self._start_cycle():
+                return None
+        return None
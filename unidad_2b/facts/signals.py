@@ -0,0 +1,27 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import invalidate
+from .models import Fact
+from .object_cache import fact_cache
+
+
+def invalidate_cached(fact_id):
+    # Eliminamos la entrada de inmediato y otra vez al confirmar la
+    # transacción, por si otra petición guardó la versión anterior entre medio
+    fact_cache.invalidate(fact_id)
+    transaction.on_commit(lambda: fact_cache.invalidate(fact_id))
+
+
+@receiver(post_save, sender=Fact)
+def fact_saved(sender, instance, created, **kwargs):
+    # Invalidamos las páginas guardadas que muestran el hecho
+    invalidate('facts', f'fact:{instance.id}')
+    invalidate_cached(instance.id)
+
+
+@receiver(post_delete, sender=Fact)
+def fact_deleted(sender, instance, **kwargs):
+    invalidate('facts', f'fact:{instance.id}')
+    invalidate_cached(instance.id)
@@ -0,0 +1,217 @@
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+import traceback
+
+from django.conf import settings
+from django.db import DatabaseError, NotSupportedError, connection
+
+# Normalización de las consultas para agruparlas: los valores literales y
+# las listas de IN y las filas de INSERT (de cualquier largo) se
+# reemplazan por marcadores
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+IN_LIST_RE = re.compile(r'\bIN\s*\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)', re.IGNORECASE)
+# Varias filas de un INSERT: VALUES (%s, %s), (%s, %s), ...
+ROWS_RE = re.compile(r'(\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\))(?:\s*,\s*\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\))+')
+SPACE_RE = re.compile(r'\s+')
+# Máximo de caracteres por parámetro guardado
+MAX_PARAM_LENGTH = 200
+
+
+def normalize(sql):
+    sql = STRING_RE.sub('?', sql)
+    sql = NUMBER_RE.sub('?', sql)
+    sql = IN_LIST_RE.sub('IN (...)', sql)
+    sql = ROWS_RE.sub(r'\1, ...', sql)
+    return SPACE_RE.sub(' ', sql).strip()
+
+
+def fingerprint(sql):
+    return hashlib.md5(normalize(sql).encode(), usedforsecurity=False).hexdigest()[:12]
+
+
+def get_log_file():
+    return getattr(settings, 'SLOW_QUERY_LOG', os.path.join(settings.BASE_DIR, 'var', 'slow_queries.jsonl'))
+
+
+def read_log(path):
+    # Lee los registros del archivo, ignorando las líneas incompletas
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+class Throttle:
+    """Limita los registros a uno por consulta normalizada cada
+    SLOW_QUERY_INTERVAL segundos en cada proceso.
+
+    Las ocurrencias omitidas se suman al siguiente registro de la misma
+    consulta. Las pendientes de una consulta que no vuelve a ejecutarse, o
+    que se descartan al vaciar la tabla de consultas vistas, no llegan al
+    archivo: el reporte es un mínimo.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # huella -> [último registro, omitidas, milisegundos omitidos]
+        self._seen = {}
+
+    def allow(self, key, duration_ms):
+        # Devuelve (registrar, omitidas, milisegundos omitidos)
+        interval = getattr(settings, 'SLOW_QUERY_INTERVAL', 60)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._seen.get(key)
+            if entry is not None and now - entry[0] < interval:
+                entry[1] += 1
+                entry[2] += duration_ms
+                return False, 0, 0
+            if len(self._seen) > 10000:
+                self._seen.clear()
+            _, skipped, skipped_ms = entry or (None, 0, 0)
+            self._seen[key] = [now, 0, 0]
+            return True, skipped, skipped_ms
+
+    def defer(self, key, count, duration_ms):
+        # Devuelve ocurrencias que no se registraron para sumarlas al
+        # siguiente registro de la consulta
+        with self._lock:
+            entry = self._seen.get(key)
+            if entry is not None:
+                entry[1] += count
+                entry[2] += duration_ms
+
+
+throttle = Throttle()
+
+
+def explain(db, sql, params):
+    # Plan de ejecución de la consulta, obtenido en la misma conexión
+    try:
+        prefix = db.ops.explain_query_prefix()
+    except NotSupportedError:
+        return None
+    try:
+        with db.cursor() as cursor:
+            cursor.execute(f'{prefix} {sql}', params)
+            return [' '.join(str(column) for column in row) for row in cursor.fetchall()]
+    except DatabaseError as error:
+        return [f'No se pudo obtener el plan: {error}']
+
+
+def caller_stack(limit=8):
+    # Marcos del código del proyecto que ejecutó la consulta, sin los de
+    # Django ni los de este módulo
+    base = str(settings.BASE_DIR)
+    frames = [frame for frame in traceback.extract_stack()
+              if frame.filename.startswith(base) and 'site-packages' not in frame.filename
+              and not frame.filename.startswith(os.path.dirname(__file__))]
+    return [f'{os.path.relpath(frame.filename, base)}:{frame.lineno} en {frame.name}'
+            for frame in frames[-limit:]]
+
+
+def short(value):
+    text = repr(value)
+    return text if len(text) <= MAX_PARAM_LENGTH else text[:MAX_PARAM_LENGTH] + '...'
+
+
+def short_params(sql, params):
+    # Los parámetros de las consultas a tablas con datos sensibles (sesiones,
+    # contraseñas) no se guardan
+    redacted = getattr(settings, 'SLOW_QUERY_REDACTED_TABLES', ('django_session', 'auth_user'))
+    if params is None or any(f'"{table}"' in sql or f'`{table}`' in sql for table in redacted):
+        return None
+    if isinstance(params, dict):
+        return {key: short(value) for key, value in params.items()}
+    return [short(value) for value in params]
+
+
+class SlowQueryLogger:
+    """Envoltorio de connection.execute_wrapper que registra las consultas
+    más lentas que SLOW_QUERY_THRESHOLD_MS, con su plan de ejecución.
+
+    Se registra como máximo una por consulta normalizada cada
+    SLOW_QUERY_INTERVAL segundos, y de esas solo una fracción
+    SLOW_QUERY_SAMPLE_RATE. Las que no se registran se suman al siguiente
+    registro de la misma consulta.
+    """
+
+    def __init__(self, request=None):
+        self.request = request
+        self._explaining = False
+
+    def __call__(self, execute, sql, params, many, context):
+        if self._explaining:
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration_ms = (time.perf_counter() - start) * 1000
+            if duration_ms >= getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', 100):
+                self.log(sql, params, many, context['connection'], duration_ms)
+
+    def log(self, sql, params, many, db, duration_ms):
+        key = fingerprint(sql)
+        allowed, skipped, skipped_ms = throttle.allow(key, duration_ms)
+        if not allowed:
+            return
+        # El muestreo va después del límite para que las consultas que no se
+        # registran igual se cuenten
+        if random.random() >= getattr(settings, 'SLOW_QUERY_SAMPLE_RATE', 1.0):
+            throttle.defer(key, skipped + 1, skipped_ms + duration_ms)
+            return
+        plan = None
+        # Solo se explican las consultas de lectura, que no modifican datos
+        if (not many and getattr(settings, 'SLOW_QUERY_EXPLAIN', True)
+                and sql.lstrip()[:6].upper() == 'SELECT'):
+            self._explaining = True
+            try:
+                plan = explain(db, sql, params)
+            finally:
+                self._explaining = False
+        request = self.request
+        match = getattr(request, 'resolver_match', None)
+        record = {
+            'time': time.time(),
+            'fingerprint': key,
+            'duration_ms': round(duration_ms, 3),
+            'skipped': skipped,
+            'skipped_ms': round(skipped_ms, 3),
+            'sql': sql,
+            'params': short_params(sql, params) if not many else None,
+            'view': match.view_name if match else None,
+            'path': request.path if request is not None else None,
+            'vendor': db.vendor,
+            'pid': os.getpid(),
+            'stack': caller_stack(),
+            'plan': plan,
+        }
+        path = get_log_file()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Cada registro se escribe con una sola llamada, por lo que varios
+        # procesos pueden compartir el archivo
+        with open(path, 'a', encoding='utf-8') as file:
+            file.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+
+
+class SlowQueryMiddleware:
+    """Registra las consultas lentas ejecutadas durante la petición, junto a
+    la vista que las ejecutó."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with connection.execute_wrapper(SlowQueryLogger(request)):
+            return self.get_response(request)
@@ -1,3 +1,91 @@
+from django.contrib.auth.models import User
 from django.test import TestCase
 
-# Create your tests here.
+from .cache import get_cache
+from .models import Fact
+from .shuffle import ShuffleCursor
+
+
+class ShuffleCursorTests(TestCase):
+
+    def setUp(self):
+        # Sin los hechos de la migración inicial
+        Fact.objects.all().delete()
+
+    def draw(self, cursor, count):
+        return [cursor.next_fact().id for _ in range(count)]
+
+    def test_permutation_is_not_a_constant_step(self):
+        ids = [Fact.objects.create(fact=f'Hecho {i}').id for i in range(20)]
+        cursor = ShuffleCursor()
+        drawn = self.draw(cursor, 20)
+        self.assertEqual(sorted(drawn), ids)
+        steps = {(b - a) % 20 for a, b in zip(drawn, drawn[1:])}
+        self.assertGreater(len(steps), 1)
+
+    def test_sparse_ids_cost_one_query_per_draw(self):
+        first = Fact.objects.create(fact='Primero')
+        last = Fact.objects.create(id=2_000_000, fact='Último')
+        cursor = ShuffleCursor()
+        cursor.next_fact()
+        with self.assertNumQueries(1):
+            second = cursor.next_fact()
+        self.assertIn(second.id, (first.id, last.id))
+
+    def test_deleted_and_added_facts_mid_cycle(self):
+        facts = [Fact.objects.create(fact=f'Hecho {i}') for i in range(10)]
+        cursor = ShuffleCursor()
+        seen = self.draw(cursor, 3)
+        deleted = [fact.id for fact in facts if fact.id not in seen][:2]
+        Fact.objects.filter(id__in=deleted).delete()
+        added = Fact.objects.create(fact='Nuevo').id
+        # Quedan 7 posiciones del tramo; el hecho nuevo está en el siguiente
+        seen += self.draw(cursor, 8)
+        self.assertNotIn(deleted[0], seen)
+        self.assertNotIn(deleted[1], seen)
+        self.assertIn(added, seen)
+
+    def test_session_round_trip(self):
+        Fact.objects.create(fact='Único')
+        session = {'random_cursor': {'seed': 1, 'low': 1, 'high': 5, 'cursor': 2}}
+        cursor = ShuffleCursor.from_session(session, 'random_cursor')
+        self.assertIsNone(cursor.seed)
+        cursor.next_fact()
+        cursor.to_session(session, 'random_cursor')
+        restored = ShuffleCursor.from_session(session, 'random_cursor')
+        self.assertEqual(vars(restored), vars(cursor))
+
+
+class PageCacheTests(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        self.fact = Fact.objects.first()
+
+    def get(self, path, **headers):
+        return self.client.get(path, **headers)['X-Page-Cache']
+
+    def test_hit_after_miss(self):
+        self.assertEqual(self.get('/facts/'), 'miss')
+        self.assertEqual(self.get('/facts/'), 'hit')
+
+    def test_key_varies_by_query_and_language(self):
+        self.get('/facts/')
+        self.assertEqual(self.get('/facts/?page=2'), 'miss')
+        self.assertEqual(self.get('/facts/', HTTP_ACCEPT_LANGUAGE='en'), 'miss')
+        self.assertEqual(self.get('/facts/', HTTP_ACCEPT_LANGUAGE='en'), 'hit')
+
+    def test_saving_fact_invalidates_its_pages(self):
+        other = Fact.objects.exclude(id=self.fact.id).first()
+        for path in ('/facts/', f'/facts/{self.fact.id}/', f'/facts/{other.id}/'):
+            self.get(path)
+        self.fact.fact = 'Chuck Norris invalidó la caché.'
+        self.fact.save()
+        self.assertEqual(self.get('/facts/'), 'miss')
+        self.assertEqual(self.get(f'/facts/{self.fact.id}/'), 'miss')
+        self.assertEqual(self.get(f'/facts/{other.id}/'), 'hit')
+
+    def test_authenticated_users_skip_cache(self):
+        self.get('/facts/')
+        self.client.force_login(User.objects.create_user('chuck', password='roundhouse'))
+        self.assertNotIn('X-Page-Cache', self.client.get('/facts/'))
@@ -1,14 +1,16 @@
-import random
-
 from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import AuthenticationForm, UserCreationForm
 from django.shortcuts import redirect, render
 
+from .cache import cache_anonymous_page
 from .forms import FactForm
 from .models import Fact
+from .object_cache import fact_cache
+from .shuffle import ShuffleCursor
 
 
+@cache_anonymous_page(lambda request: ['facts'])
 def home_view(request):
     # Creamos el contenido de la respuesta
     context = {'facts': Fact.objects.all()}
@@ -16,37 +18,30 @@ def home_view(request):
     return render(request, 'facts/home.html', context=context)
 
 
+@cache_anonymous_page(lambda request, fact_id: [f'fact:{fact_id}'])
 def fact_view(request, fact_id):
-    try:
-        # Seleccionamos un hecho específico
-        current_fact = Fact.objects.get(id=fact_id)
-        # Creamos el contenido de la respuesta
-        context = {'fact': current_fact}
-        # Creamos la respuesta
-        return render(request, 'facts/detail.html', context=context)
-    except Fact.DoesNotExist:
+    # Seleccionamos un hecho específico desde la caché de objetos
+    current_fact = fact_cache.get(fact_id)
+    if current_fact is None:
         # Creamos la respuesta
         return render(request, 'facts/404.html', status=404)
+    # Creamos el contenido de la respuesta
+    context = {'fact': current_fact}
+    # Creamos la respuesta
+    return render(request, 'facts/detail.html', context=context)
 
 
 def random_view(request):
-    # Obtiene la lista de hechos vistos (identificadores únicos)
-    seen_facts_ids = request.session.get('seen_facts_ids', [])
-    # Filtra la lista de hechos para mostrar solo los que el
-    # usuario aún no ha visto (por identificador único)
-    remaining_facts = Fact.objects.exclude(id__in=seen_facts_ids)
-    # Si no quedan hechos por mostrar, reinicia la lista
-    if not remaining_facts:
-        # Si el usuario ha visto todos los hechos, reinicia la lista
-        seen_facts_ids = []
-        remaining_facts = Fact.objects.all()
-    # Elige un hecho aleatorio de los que quedan por mostrar
-    current_fact = random.choice(remaining_facts)
-    # Agrega el identificador único del hecho actual a la lista
-    # de hechos vistos por el usuario
-    seen_facts_ids.append(current_fact.id)
-    # Almacena la lista actualizada de hechos vistos en la sesión del usuario
-    request.session['seen_facts_ids'] = seen_facts_ids
+    # Eliminamos la lista de hechos vistos usada por versiones anteriores
+    request.session.pop('seen_facts_ids', None)
+    # Recuperamos el cursor de la sesión: solo guarda una semilla, el rango
+    # de identificadores y la posición, sin importar cuántos hechos se vean
+    cursor = ShuffleCursor.from_session(request.session, 'random_cursor')
+    # Obtenemos el siguiente hecho de la permutación que aún no se ha visto;
+    # al terminar el ciclo se inicia uno nuevo con otra semilla
+    current_fact = cursor.next_fact()
+    # Almacenamos el cursor actualizado en la sesión del usuario
+    cursor.to_session(request.session, 'random_cursor')
     # Creamos el contenido de la respuesta
     context = {'fact': current_fact}
     # Creamos la respuesta